@@ -0,0 +1,147 @@
+"""Compare concurrent character reads in sync and async serving modes.
+
+Drives GET /character/<id> through the ASGI interface of one process, with a
+growing number of concurrent clients, for:
+
+- sync: the Flask app behind asgiref's WsgiToAsgi (a thread per request,
+  like gthread workers)
+- async: AsyncApp, serving the request natively on an AsyncEngine
+
+The server and network stack are left out, so the numbers compare the
+request handling of the two modes only.
+
+Usage:
+    python benchmarks/async_character_reads.py [--requests N]
+                                               [--concurrency 1,10,100]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import create_access_token
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import TestingConfig                        # noqa: E402
+from dndbehind import create_app, db                    # noqa: E402
+from dndbehind.aio import AsyncApp                      # noqa: E402
+from dndbehind.models import Background, Character, User  # noqa: E402
+
+CHARACTERS = 1_000
+
+
+def seed() -> None:
+    """Insert one user owning CHARACTERS characters."""
+    db.session.execute(sa.insert(User), [
+        {"id": 1, "username": "player", "email": "player@example.com",
+         "password_hash": "x", "disabled": False}
+    ])
+    db.session.execute(sa.insert(Background), [
+        {"id": 1, "name": "Acolyte", "description": "Temple life"}
+    ])
+    db.session.execute(sa.insert(Character), [
+        {"name": f"Character {i}", "backstory": "Once upon a time " * 200,
+         "strength": 10, "dexterity": 10, "constitution": 10,
+         "intelligence": 10, "wisdom": 10, "charisma": 10,
+         "owner_id": 1, "background_id": 1}
+        for i in range(CHARACTERS)
+    ])
+    db.session.commit()
+
+
+async def get_character(asgi_app, token: str, character_id: int) -> float:
+    """Perform one request and return its latency.
+
+    Args:
+        asgi_app: the ASGI application.
+        token (str): access token.
+        character_id (int): character to retrieve.
+
+    Returns:
+        float: latency in seconds.
+    """
+    path = f"/character/{character_id}"
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path,
+        "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "server": ("localhost", 80), "client": ("127.0.0.1", 1),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    start = time.perf_counter()
+    await asgi_app(scope, receive, send)
+    assert status == [200], status
+    return time.perf_counter() - start
+
+
+async def run(asgi_app, token: str, requests: int, concurrency: int) -> None:
+    """Run the load and print throughput and latency.
+
+    Args:
+        asgi_app: the ASGI application.
+        token (str): access token.
+        requests (int): total number of requests.
+        concurrency (int): number of concurrent clients.
+    """
+    latencies = []
+
+    async def client(offset: int) -> None:
+        for i in range(offset, requests, concurrency):
+            latencies.append(await get_character(
+                asgi_app, token, i % CHARACTERS + 1))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1000
+    print(f"  concurrency {concurrency:>5}: {requests / elapsed:>8.1f} req/s"
+          f"  p99 {p99:>8.1f} ms")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", default="1,10,100,500")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        class BenchConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmpdir}/bench.db"
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            seed()
+            token = create_access_token(identity="1")
+
+        modes = {"sync": WsgiToAsgi(app), "async": AsyncApp(app)}
+        for name, asgi_app in modes.items():
+            print(name)
+            for concurrency in levels:
+                asyncio.run(run(asgi_app, token, args.requests, concurrency))
+            if isinstance(asgi_app, AsyncApp):
+                asyncio.run(asgi_app.engine.dispose())
+                asgi_app.hash_executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Fixtures for the pytest-benchmark suite.
+
+The database is seeded once per session. Volumes default to a tenth of the
+production target to keep the suite quick; set BENCH_USERS=100000 and
+BENCH_CHARACTERS=1000000 for full-scale runs.
+"""
+import os
+
+from flask import Flask
+from flask_jwt_extended import create_access_token
+import pytest
+
+from config import TestingConfig
+from dndbehind import create_app, db
+
+from seed import seed
+
+BENCH_USERS = int(os.environ.get("BENCH_USERS", 10_000))
+BENCH_CHARACTERS = int(os.environ.get("BENCH_CHARACTERS", 100_000))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory) -> Flask:
+    database = tmp_path_factory.mktemp("bench") / "bench.db"
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            seed(connection, BENCH_USERS, BENCH_CHARACTERS)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope="session")
+def auth_headers(app):
+    """Headers for the loadtest user, who owns no characters."""
+    with app.app_context():
+        token = create_access_token(
+            identity="1", additional_claims={"roles": ["operator",
+                                                       "maintainer"]})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="session")
+def owner_headers(app):
+    """Headers for user 2, who owns the most characters."""
+    with app.app_context():
+        token = create_access_token(identity="2",
+                                    additional_claims={"roles": []})
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,110 @@
+"""Compare the JSON serialization paths of the list endpoints.
+
+Measures throughput and allocated memory of rendering the background and
+user lists as JSON responses, for:
+
+- the original path: ORM objects -> as_dict -> Flask's default provider
+- the row path: column rows -> rows_as_dicts -> FastJSONProvider
+
+Usage:
+    python benchmarks/json_serialization.py [--rows N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable
+
+import sqlalchemy as sa
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import TestingConfig                        # noqa: E402
+from dndbehind import create_app, db                    # noqa: E402
+from dndbehind.models import Background, User           # noqa: E402
+from dndbehind.serialization import FastJSONProvider, _default, \
+    rows_as_dicts                                       # noqa: E402
+
+
+def seed(rows: int) -> None:
+    """Insert the given number of backgrounds and users.
+
+    Args:
+        rows (int): number of rows to insert per table.
+    """
+    now = datetime.now(timezone.utc)
+    db.session.execute(sa.insert(Background), [
+        {"name": f"Background {i}", "description": "Lorem ipsum " * 40}
+        for i in range(rows)
+    ])
+    db.session.execute(sa.insert(User), [
+        {"username": f"user{i}", "email": f"user{i}@example.com",
+         "password_hash": "x", "last_logged_in": now, "disabled": False}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int) -> None:
+    """Time a serialization path and report its allocations.
+
+    Args:
+        name (str): label to print.
+        fn (Callable[[], object]): function producing one response.
+        repeat (int): number of timed runs.
+    """
+    fn()    # warm up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+        db.session.expunge_all()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.expunge_all()
+
+    print(f"{name:<40} {repeat / elapsed:>9.1f} req/s "
+          f"{peak / 1024:>10.1f} KiB peak")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(TestingConfig)
+    default_provider = DefaultJSONProvider(app)
+    # Compressed descriptions load as LazyText, which Flask doesn't know
+    default_provider.default = _default
+    fast_provider = FastJSONProvider(app)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+
+        for model in (Background, User):
+            label = model.__name__.lower()
+            measure(
+                f"{label}: as_dict + default provider",
+                lambda: default_provider.response(
+                    [obj.as_dict() for obj in model.query.all()]),
+                args.repeat)
+            measure(
+                f"{label}: rows + {fast_provider.backend} provider",
+                lambda: fast_provider.response(rows_as_dicts(
+                    db.session.execute(
+                        sa.select(*model.as_dict_columns())))),
+                args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Load-test scenario for the main endpoints.
+
+Seed the server's database with benchmarks/seed.py first, then run:
+
+    locust -f benchmarks/locustfile.py --host http://localhost:5000 \\
+        --headless --users 200 --spawn-rate 20 --run-time 2m
+
+When the run ends, the 95th percentile response time and failure ratio of
+every endpoint are compared with benchmarks/locust_baseline.json. The run
+exits with code 1 if any endpoint is more than LOCUST_TOLERANCE (default
+25%) slower than its baseline, or fails more often.
+"""
+import json
+import os
+import random
+
+from locust import HttpUser, between, events, task
+
+from seed import LOADTEST_PASSWORD, LOADTEST_USERNAME
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__),
+                             "locust_baseline.json")
+TOLERANCE = float(os.environ.get("LOCUST_TOLERANCE", 0.25))
+CHARACTERS = int(os.environ.get("BENCH_CHARACTERS", 1_000_000))
+
+
+class Player(HttpUser):
+    """A client logging in and browsing characters and backgrounds."""
+    wait_time = between(0.1, 1)
+
+    def on_start(self) -> None:
+        """Log in and keep the access token for subsequent requests."""
+        response = self.client.post("/auth/login", json={
+            "username": LOADTEST_USERNAME,
+            "password": LOADTEST_PASSWORD
+        })
+        token = response.json()["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {token}"
+
+    @task(10)
+    def get_character(self) -> None:
+        """Retrieve a random character (the loadtest user is an operator)."""
+        self.client.get(f"/character/{random.randint(1, CHARACTERS)}",
+                        name="/character/[id]")
+
+    @task(3)
+    def whoami(self) -> None:
+        """Retrieve the logged in user."""
+        self.client.get("/auth/whoami")
+
+    @task(1)
+    def list_backgrounds(self) -> None:
+        """Retrieve the background catalog."""
+        self.client.get("/background")
+
+    @task(1)
+    def login(self) -> None:
+        """Log in again, exercising password hashing."""
+        self.client.post("/auth/login", json={
+            "username": LOADTEST_USERNAME,
+            "password": LOADTEST_PASSWORD
+        })
+
+
+@events.quitting.add_listener
+def check_baseline(environment, **kwargs) -> None:
+    """Fail the run when an endpoint regressed compared to the baseline."""
+    if not os.path.exists(BASELINE_FILE):
+        return
+
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+
+    for name, limits in baseline.items():
+        method, _, path = name.partition(" ")
+        entry = environment.stats.get(path, method)
+        if entry.num_requests == 0:
+            continue
+
+        p95 = entry.get_response_time_percentile(0.95)
+        if p95 > limits["p95_ms"] * (1 + TOLERANCE):
+            print(f"Regression: {name} p95 {p95} ms, "
+                  f"baseline {limits['p95_ms']} ms")
+            environment.process_exit_code = 1
+        if entry.fail_ratio > limits["fail_ratio"]:
+            print(f"Regression: {name} failure ratio {entry.fail_ratio:.3f}, "
+                  f"baseline {limits['fail_ratio']:.3f}")
+            environment.process_exit_code = 1
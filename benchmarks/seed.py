@@ -0,0 +1,78 @@
+"""Seed a database with realistic volumes of data for benchmarks.
+
+Creates users, backgrounds and characters with dndbehind.seeding (also
+available as `flask seed`), with a skewed number of characters per owner and
+log-normally distributed text lengths. One additional "loadtest" user with
+the operator and maintainer roles is created first, as user 1, for the
+load-test scenario in locustfile.py; all users share its password.
+
+Usage:
+    python benchmarks/seed.py --database-url sqlite:///bench.db \\
+        [--users 100000] [--characters 1000000]
+"""
+import argparse
+import os
+import sys
+
+import sqlalchemy as sa
+from argon2 import PasswordHasher
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dndbehind import db                                # noqa: E402
+from dndbehind.models import Role, User, user_roles_table  # noqa: E402
+from dndbehind import seeding                           # noqa: E402
+
+LOADTEST_USERNAME = "loadtest"
+LOADTEST_PASSWORD = "loadtest-password"
+
+
+def seed(connection: sa.Connection, users: int, characters: int,
+         backgrounds: int = 100, seed_value: int = 42) -> None:
+    """Insert the load-test user, then generated users, roles, backgrounds
+    and characters.
+
+    Args:
+        connection (sa.Connection): connection to insert with.
+        users (int): number of generated users.
+        characters (int): number of characters.
+        backgrounds (int, optional): number of backgrounds. Defaults to 100.
+        seed_value (int, optional): random seed. Defaults to 42.
+    """
+    password_hash = PasswordHasher().hash(LOADTEST_PASSWORD)
+
+    connection.execute(sa.insert(Role), [
+        {"id": 1, "name": "admin", "description": "Administrator"},
+        {"id": 2, "name": "operator", "description": "Operator"},
+        {"id": 3, "name": "maintainer", "description": "Maintainer"},
+    ])
+    connection.execute(sa.insert(User), [
+        {"id": 1, "username": LOADTEST_USERNAME,
+         "email": "loadtest@example.com", "password_hash": password_hash,
+         "disabled": False}
+    ])
+    connection.execute(sa.insert(user_roles_table), [
+        {"user_id": 1, "role_id": 2},
+        {"user_id": 1, "role_id": 3},
+    ])
+
+    seeding.seed(connection, users, characters, backgrounds, seed_value,
+                 password_hash)
+
+
+def main() -> None:
+    """Create the schema and seed the database given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--characters", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.database_url)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed(connection, args.users, args.characters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measure application cold start against a time budget.
+
+Starts fresh interpreters that import the application and create an app,
+and reports the median time of both steps. With --importtime, the slowest
+imports of one run (from `python -X importtime`) are listed as well. Exits
+with code 1 when the median cold start exceeds the budget.
+
+Usage:
+    python benchmarks/startup.py [--runs N] [--budget-ms MS] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+STARTUP = """
+import json, time
+start = time.perf_counter()
+from config import TestingConfig
+from dndbehind import create_app
+imported = time.perf_counter()
+create_app(TestingConfig)
+created = time.perf_counter()
+print(json.dumps({"import": imported - start, "create": created - imported}))
+"""
+
+
+def run_once(importtime: bool = False) -> tuple[dict[str, float], str]:
+    """Start the application in a fresh interpreter.
+
+    Args:
+        importtime (bool, optional): run with -X importtime. Defaults to
+                                     False.
+
+    Returns:
+        tuple[dict[str, float], str]: seconds spent importing and creating
+                                      the app, and the importtime report.
+    """
+    args = [sys.executable]
+    if importtime:
+        args += ["-X", "importtime"]
+    result = subprocess.run(args + ["-c", STARTUP], cwd=ROOT, check=True,
+                            capture_output=True, text=True)
+    return json.loads(result.stdout), result.stderr
+
+
+def slowest_imports(report: str, top: int) -> list[tuple[int, str]]:
+    """Find the imports of the application with the highest cumulative time.
+
+    Args:
+        report (str): output of -X importtime.
+        top (int): number of imports to return.
+
+    Returns:
+        list[tuple[int, str]]: cumulative microseconds and module name.
+    """
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Imports of the startup script and their direct imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main() -> int:
+    """Run the startup benchmark.
+
+    Returns:
+        int: exit code, 1 if the budget is exceeded.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=700)
+    parser.add_argument("--importtime", action="store_true")
+    args = parser.parse_args()
+
+    timings = [run_once()[0] for _ in range(args.runs)]
+    imported = statistics.median(t["import"] for t in timings) * 1000
+    created = statistics.median(t["create"] for t in timings) * 1000
+    total = imported + created
+    print(f"import {imported:.0f} ms + create_app {created:.0f} ms "
+          f"= {total:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if args.importtime:
+        _, report = run_once(importtime=True)
+        for cumulative, name in slowest_imports(report, 15):
+            print(f"{cumulative / 1000:8.1f} ms  {name}")
+
+    return 1 if total > args.budget_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
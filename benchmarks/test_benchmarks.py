@@ -0,0 +1,78 @@
+"""Micro-benchmarks for hot code paths and endpoints.
+
+Run and compare against the stored baseline; the run fails when the mean of
+a benchmark regresses by more than 25%:
+
+    pytest benchmarks --benchmark-storage=benchmarks/.benchmarks \\
+        --benchmark-compare=0001 --benchmark-compare-fail=mean:25%
+"""
+import sqlalchemy as sa
+
+from dndbehind import db
+from dndbehind.auth.rbac import owner_or_role_required, role_required, \
+    self_or_role_required
+from dndbehind.models import Character, User
+
+from seed import LOADTEST_PASSWORD
+
+
+def _owned_character_id() -> int:
+    return db.session.scalar(
+        sa.select(Character.id).where(Character.owner_id == 2).limit(1))
+
+
+def test_user_as_dict(benchmark, app_context):
+    user = db.session.get(User, 2)
+    benchmark(user.as_dict)
+
+
+def test_character_as_dict(benchmark, app_context):
+    character = db.session.get(Character, _owned_character_id())
+    benchmark(character.as_dict)
+
+
+def test_check_password(benchmark, app_context):
+    user = db.session.get(User, 1)
+    result = benchmark.pedantic(user.check_password, args=(LOADTEST_PASSWORD,),
+                                rounds=10)
+    assert result is True
+
+
+def test_role_required(benchmark, app, auth_headers):
+    view = role_required("maintainer")(lambda: "ok")
+    with app.test_request_context(headers=auth_headers):
+        assert benchmark(view) == "ok"
+
+
+def test_self_or_role_required(benchmark, app, owner_headers):
+    view = self_or_role_required("user_id", "admin")(lambda user_id: "ok")
+    with app.test_request_context("/auth/user/2", headers=owner_headers):
+        assert benchmark(view, user_id=2) == "ok"
+
+
+def test_owner_or_role_required(benchmark, app, owner_headers):
+    with app.app_context():
+        character_id = _owned_character_id()
+    view = owner_or_role_required(Character, "character_id", "operator")(
+        lambda character_id: "ok")
+    with app.test_request_context(f"/character/{character_id}",
+                                  headers=owner_headers):
+        assert benchmark(view, character_id=character_id) == "ok"
+
+
+def test_get_character_endpoint(benchmark, app, client, owner_headers):
+    with app.app_context():
+        character_id = _owned_character_id()
+    response = benchmark(client.get, f"/character/{character_id}",
+                         headers=owner_headers)
+    assert response.status_code == 200
+
+
+def test_whoami_endpoint(benchmark, client, owner_headers):
+    response = benchmark(client.get, "/auth/whoami", headers=owner_headers)
+    assert response.status_code == 200
+
+
+def test_list_backgrounds_endpoint(benchmark, client, auth_headers):
+    response = benchmark(client.get, "/background", headers=auth_headers)
+    assert response.status_code == 200
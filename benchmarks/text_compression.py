@@ -0,0 +1,137 @@
+"""Compare storage size and read latency of compressed text columns.
+
+Writes the same generated backstories to SQLite databases with a plain text
+column and with CompressedText columns using zlib, zstd and zstd with a
+dictionary trained on a sample of the texts. For each, reports the database
+size and the median time to read a page of rows, with and without
+serializing the texts to JSON (compressed texts are only decompressed when
+serialized).
+
+Usage:
+    python benchmarks/text_compression.py [--rows N] [--page N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+import zstandard
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dndbehind.compressed import CompressedText, codec  # noqa: E402
+from dndbehind.serialization import rows_as_dicts, \
+    _msgspec_codec                                      # noqa: E402
+
+_WORDS = ("the wind howled over ruined keep as our hero set out sword in "
+          "hand and doubt heart to find truth about past dragon tavern "
+          "village elder ancient curse wizard tower forest goblin ambush "
+          "paladin oath broken temple shadow whispered gold coin debt "
+          "sister lost war north mountain pass river crossing storm night "
+          "blade cloak ranger map secret guild thief betrayed king").split()
+
+
+def generate_texts(rows: int, rng: random.Random) -> list[str]:
+    """Generate backstories with log-normally distributed lengths.
+
+    Args:
+        rows (int): number of texts.
+        rng (random.Random): random number generator.
+
+    Returns:
+        list[str]: the texts.
+    """
+    texts = []
+    for _ in range(rows):
+        words = min(int(rng.lognormvariate(5, 1)), 100_000)
+        sentences = []
+        while words > 0:
+            length = rng.randint(6, 18)
+            sentence = " ".join(rng.choices(_WORDS, k=length))
+            sentences.append(sentence.capitalize() + ".")
+            words -= length
+        texts.append(" ".join(sentences))
+    return texts
+
+
+def measure(name: str, column_type: sa.types.TypeEngine, texts: list[str],
+            page: int, repeat: int) -> None:
+    """Store the texts and time reading pages of them.
+
+    Args:
+        name (str): label to print.
+        column_type (sa.types.TypeEngine): type of the text column.
+        texts (list[str]): the texts to store.
+        page (int): rows per read.
+        repeat (int): number of timed reads.
+    """
+    encode = _msgspec_codec(False)[0]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "texts.db")
+        engine = sa.create_engine(f"sqlite:///{path}")
+        metadata = sa.MetaData()
+        table = sa.Table("character", metadata,
+                         sa.Column("id", sa.Integer(), primary_key=True),
+                         sa.Column("backstory", column_type))
+        metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(sa.insert(table), [
+                {"id": i, "backstory": text} for i, text in enumerate(texts)
+            ])
+        with engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+        size = os.path.getsize(path)
+
+        rng = random.Random(1)
+        fetch, serialize = [], []
+        with engine.connect() as connection:
+            for _ in range(repeat):
+                start_id = rng.randrange(max(len(texts) - page, 1))
+                query = sa.select(table).where(
+                    table.c.id.between(start_id, start_id + page - 1))
+                start = time.perf_counter()
+                rows = rows_as_dicts(connection.execute(query))
+                fetched = time.perf_counter()
+                encode(rows)
+                done = time.perf_counter()
+                fetch.append(fetched - start)
+                serialize.append(done - start)
+        engine.dispose()
+
+    print(f"{name:<16} {size / 1024 / 1024:>9.1f} MiB "
+          f"{statistics.median(fetch) * 1000:>10.2f} ms "
+          f"{statistics.median(serialize) * 1000:>12.2f} ms")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    texts = generate_texts(args.rows, rng)
+    sample = [text.encode() for text in rng.sample(texts, min(len(texts),
+                                                              2_000))]
+    dictionary = zstandard.train_dictionary(112_640, sample).as_bytes()
+    print(f"{args.rows} texts, {sum(map(len, texts)) / 1024 / 1024:.1f} MiB"
+          f" of text; reading pages of {args.page} rows")
+    print(f"{'column':<16} {'size':>13} {'fetch':>13} {'fetch+JSON':>15}")
+
+    measure("text", sa.Text(), texts, args.page, args.repeat)
+    for name, codec_name, dictionaries in (
+            ("zlib", "zlib", ()),
+            ("zstd", "zstd", ()),
+            ("zstd+dictionary", "zstd", [dictionary])):
+        codec.configure(codec_name, dictionaries=dictionaries)
+        measure(name, CompressedText(), texts, args.page, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 """Configuration file for the application."""
 import os
 
-from dotenv import load_dotenv
-
 basedir = os.path.join(os.path.dirname(__file__))
-load_dotenv(os.path.join(basedir, ".env"))
+if os.path.exists(os.path.join(basedir, ".env")):
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(basedir, ".env"))
 
 
 class Config:
@@ -14,8 +14,137 @@ class Config:
         os.environ.get("JWT_ACCESS_TOKEN_EXPIRES") or 3600
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or "NOTSECURE"
     SECRET_KEY = os.environ.get("SECRET_KEY") or "insecure"
+    # Token signing (see dndbehind/tokens.py): "HS256" with JWT_SECRET_KEY,
+    # or "EdDSA" with the Ed25519 keys <kid>.pem in JWT_KEYS_DIR (requires
+    # the crypto extra). Tokens are signed with the private key JWT_KEY_ID
+    # and verified with any key in the directory, whose public keys are
+    # served on /auth/jwks.json.
+    JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM") or "HS256"
+    JWT_KEYS_DIR = os.environ.get("JWT_KEYS_DIR") or "keys"
+    JWT_KEY_ID = os.environ.get("JWT_KEY_ID")
+    # Verified token payloads cached per worker (0 disables the cache)
+    JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 10_000))
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") \
         or "sqlite:///dndbehind-dev.db"
+    # Argon2 password hashing parameters (defaults: RFC 9106 low-memory)
+    ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", 3))
+    ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", 65536))
+    ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 4))
+    # Bulk user creation (POST /auth/users, `flask users import`): users per
+    # request, users per transaction, and threads hashing their passwords
+    # (default: one per CPU)
+    BULK_USERS_MAX = int(os.environ.get("BULK_USERS_MAX", 1000))
+    BULK_USERS_BATCH_SIZE = \
+        int(os.environ.get("BULK_USERS_BATCH_SIZE", 200))
+    BULK_HASH_WORKERS = \
+        int(os.environ.get("BULK_HASH_WORKERS", 0)) or os.cpu_count()
+    # JSON library used for requests and responses: "auto", "orjson",
+    # "msgspec" or "stdlib". "auto" uses the fastest one installed.
+    JSON_BACKEND = os.environ.get("JSON_BACKEND") or "auto"
+    # Response compression: bodies smaller than COMPRESSION_MIN_SIZE bytes
+    # are sent uncompressed, compressed GET bodies are cached up to
+    # COMPRESSION_CACHE_SIZE bytes per worker.
+    COMPRESSION_ENABLED = \
+        os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+    COMPRESSION_CACHE_SIZE = \
+        int(os.environ.get("COMPRESSION_CACHE_SIZE", 32 * 1024 * 1024))
+    # Compressed text columns (see dndbehind/compressed.py): codec ("auto",
+    # "zstd", "zlib" or "none"), level, size below which texts are stored
+    # uncompressed, and trained zstd dictionaries separated by os.pathsep,
+    # the first of which is used for new values
+    TEXT_COMPRESSION = os.environ.get("TEXT_COMPRESSION") or "auto"
+    TEXT_COMPRESSION_LEVEL = int(os.environ.get("TEXT_COMPRESSION_LEVEL", 3))
+    TEXT_COMPRESSION_MIN_SIZE = \
+        int(os.environ.get("TEXT_COMPRESSION_MIN_SIZE", 256))
+    TEXT_COMPRESSION_DICTIONARIES = [
+        path for path in os.environ.get(
+            "TEXT_COMPRESSION_DICTIONARIES", "").split(os.pathsep) if path]
+    # Maximum number of IDs per multi-get request (GET /character?ids=...)
+    MULTI_GET_MAX_IDS = int(os.environ.get("MULTI_GET_MAX_IDS", 100))
+    # Let concurrent identical reads of characters and backgrounds share one
+    # computation (see dndbehind/singleflight.py)
+    SINGLE_FLIGHT_ENABLED = \
+        os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    # Character version history (see dndbehind/history.py): versions listed
+    # per page, and what `flask history compact` keeps: the latest
+    # HISTORY_KEEP_VERSIONS versions of every character, and all versions up
+    # to HISTORY_MAX_AGE_DAYS old (0 to only keep the latest)
+    HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 50))
+    HISTORY_KEEP_VERSIONS = int(os.environ.get("HISTORY_KEEP_VERSIONS", 100))
+    HISTORY_MAX_AGE_DAYS = \
+        float(os.environ.get("HISTORY_MAX_AGE_DAYS", 90))
+    # Audit log of logins, role changes and other security-relevant actions
+    # (see dndbehind/audit/log.py): AUDIT_SINK is "database", "file" (NDJSON
+    # files in AUDIT_DIR, rotated at AUDIT_FILE_MAX_BYTES) or "none". Events
+    # are queued (at most AUDIT_QUEUE_SIZE) and written in batches of up to
+    # AUDIT_BATCH_SIZE at least every AUDIT_FLUSH_INTERVAL seconds.
+    AUDIT_SINK = os.environ.get("AUDIT_SINK") or "database"
+    AUDIT_DIR = os.environ.get("AUDIT_DIR") or "audit"
+    AUDIT_FILE_MAX_BYTES = \
+        int(os.environ.get("AUDIT_FILE_MAX_BYTES", 64 * 1024 * 1024))
+    AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", 10_000))
+    AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1))
+    AUDIT_PAGE_SIZE = int(os.environ.get("AUDIT_PAGE_SIZE", 100))
+    # Idempotency-Key support of POST endpoints (see
+    # dndbehind/idempotency.py): responses are kept for IDEMPOTENCY_TTL
+    # seconds in IDEMPOTENCY_STORE, "database" (shared by all workers) or
+    # "memory" (per worker, at most IDEMPOTENCY_MEMORY_KEYS keys). A request
+    # that hasn't stored its response after IDEMPOTENCY_LEASE seconds is
+    # considered dead and its key is taken over by the next retry; keep it
+    # above the longest request (GUNICORN_TIMEOUT).
+    IDEMPOTENCY_STORE = os.environ.get("IDEMPOTENCY_STORE") or "database"
+    IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+    IDEMPOTENCY_LEASE = float(os.environ.get("IDEMPOTENCY_LEASE", 60))
+    IDEMPOTENCY_MEMORY_KEYS = \
+        int(os.environ.get("IDEMPOTENCY_MEMORY_KEYS", 10_000))
+    # Expose Prometheus metrics on /metrics
+    METRICS_ENABLED = \
+        os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    # Count SQL statements per request, report them in a Server-Timing
+    # header and warn about statements repeated QUERY_REPEAT_THRESHOLD times
+    QUERY_STATS_ENABLED = \
+        os.environ.get("QUERY_STATS_ENABLED", "true").lower() == "true"
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", 5))
+    # Where tracing spans are exported: "none", "console", "file" (JSON lines
+    # in TRACING_FILE), "otlp" or "external" (see dndbehind/tracing.py)
+    TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER") or "none"
+    TRACING_FILE = os.environ.get("TRACING_FILE") or "traces.jsonl"
+    # Profile requests by admins sending an X-Profile header, and a random
+    # PROFILE_SAMPLE_RATE fraction of all requests (see dndbehind/profiling.py)
+    PROFILING_ENABLED = \
+        os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILE_DIR = os.environ.get("PROFILE_DIR")
+    PROFILE_MODE = os.environ.get("PROFILE_MODE") or "cprofile"
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_SAMPLE_INTERVAL = \
+        float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.001))
+    PROFILE_MAX_PER_MINUTE = int(os.environ.get("PROFILE_MAX_PER_MINUTE", 6))
+    # Change feed (/changes): default and maximum number of changes per
+    # response, and how long a request may wait for new changes
+    CHANGES_BATCH_SIZE = int(os.environ.get("CHANGES_BATCH_SIZE", 100))
+    CHANGES_MAX_BATCH_SIZE = \
+        int(os.environ.get("CHANGES_MAX_BATCH_SIZE", 1000))
+    CHANGES_MAX_WAIT = float(os.environ.get("CHANGES_MAX_WAIT", 30))
+    CHANGES_POLL_INTERVAL = \
+        float(os.environ.get("CHANGES_POLL_INTERVAL", 1))
+    # Live character updates (Server-Sent Events): heartbeat interval,
+    # buffered messages per subscriber and subscribers per worker. The relay
+    # publishes the changes of all workers, read from the outbox table.
+    CHANGES_HEARTBEAT = float(os.environ.get("CHANGES_HEARTBEAT", 15))
+    CHANGES_SUBSCRIPTION_BUFFER = \
+        int(os.environ.get("CHANGES_SUBSCRIPTION_BUFFER", 8))
+    CHANGES_MAX_SUBSCRIPTIONS = \
+        int(os.environ.get("CHANGES_MAX_SUBSCRIPTIONS", 10_000))
+    CHANGES_RELAY_ENABLED = \
+        os.environ.get("CHANGES_RELAY_ENABLED", "true").lower() == "true"
+    # Serve the hot endpoints with async views when running under ASGI (see
+    # dndbehind/aio.py). ASYNC_DATABASE_URL defaults to DATABASE_URL with an
+    # async driver (aiosqlite, asyncpg).
+    ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "false").lower() == "true"
+    ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+    ASYNC_HASH_WORKERS = int(os.environ.get("ASYNC_HASH_WORKERS", 0)) or None
 
 
 class TestingConfig(Config):
@@ -23,3 +152,11 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     JWT_SECRET_KEY = "test-secret-key"
+    # Cheap hashing keeps the test suite fast; never use in production
+    ARGON2_TIME_COST = 1
+    ARGON2_MEMORY_COST = 8
+    ARGON2_PARALLELISM = 1
+    # Tests publish to the broker directly
+    CHANGES_RELAY_ENABLED = False
+    # The in-memory database is per thread, out of the audit writer's reach
+    AUDIT_SINK = "none"
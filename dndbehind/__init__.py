@@ -1,15 +1,60 @@
 """The flask application package."""
 
+from typing import Any
+
+import click
 from flask import Flask
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
 from config import Config
+from .compressed import TextCompression
+from .compression import Compress
+from .metrics import Metrics
+from .querystats import QueryCounter
+from .singleflight import SingleFlight
+from .tokens import TokenManager, jwt_keys_cli
+from .tracing import Tracing
 
+metrics = Metrics()
 db = SQLAlchemy()
-migrate = Migrate()
-jwt = JWTManager()
+jwt = TokenManager()
+compress = Compress()
+query_counter = QueryCounter()
+tracing = Tracing()
+text_compression = TextCompression()
+single_flight = SingleFlight()
+
+
+class MigrateCommand(click.Command):
+    """The `flask db` command group, setting up Flask-Migrate on first use.
+    Migrations only run through the flask CLI, and importing alembic costs as
+    much as the rest of the application.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        """Initialize the command.
+
+        Args:
+            app (Flask): application whose database to migrate.
+        """
+        super().__init__("db", help="Perform database migrations.")
+        self.app = app
+
+    def make_context(self, info_name: str | None, args: list[str],
+                     parent: click.Context | None = None,
+                     **extra: Any) -> click.Context:
+        """Set up Flask-Migrate and parse the arguments with its group.
+        Click invokes the command of the returned context.
+
+        Returns:
+            click.Context: context of Flask-Migrate's command group.
+        """
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_cli_group
+
+        if "migrate" not in self.app.extensions:
+            Migrate(self.app, db)
+        return db_cli_group.make_context(info_name, args, parent, **extra)
 
 
 def create_app(config_class: Config = Config) -> Flask:
@@ -25,14 +70,52 @@ def create_app(config_class: Config = Config) -> Flask:
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    from .serialization import FastJSONProvider
+    app.json = FastJSONProvider(app, backend=app.config["JSON_BACKEND"])
+
+    metrics.init_app(app)
+    tracing.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    text_compression.init_app(app)
+    app.cli.add_command(MigrateCommand(app))
     jwt.init_app(app)
+    app.cli.add_command(jwt_keys_cli)
+    compress.init_app(app)
+    query_counter.init_app(app)
+    single_flight.init_app(app)
+
+    from .profiling import Profiler
+    Profiler(app)
 
     from .auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix="/auth")
 
+    from .auth.provisioning import users_cli
+    app.cli.add_command(users_cli)
+
     from .mgmt import bp as mgmt_bp
     app.register_blueprint(mgmt_bp)
 
+    from .history import history_cli
+    app.cli.add_command(history_cli)
+
+    from .seeding import seed_cli
+    app.cli.add_command(seed_cli)
+
+    from .idempotency import Idempotency, idempotency_cli
+    Idempotency(app)
+    app.cli.add_command(idempotency_cli)
+
+    from .changes import bp as changes_bp
+    app.register_blueprint(changes_bp)
+
+    from .changes.broker import LiveChanges
+    LiveChanges(app)
+
+    from .audit import bp as audit_bp
+    app.register_blueprint(audit_bp)
+
+    from .audit.log import AuditLog
+    AuditLog(app)
+
     return app
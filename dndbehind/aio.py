@@ -0,0 +1,569 @@
+"""Async-native serving of the hottest API endpoints.
+
+Flask views are synchronous and occupy a worker thread for the duration of
+every database round trip and password hash. AsyncApp is an ASGI
+application that serves the read-heavy endpoints (login, whoami, single and
+multi-get character retrieval and the background list) natively on an
+SQLAlchemy AsyncEngine, with Argon2 work pushed to a thread pool. All other
+requests are passed on to the regular Flask application.
+
+The async views reuse the models, JSON provider and JWT configuration of the
+Flask application they wrap, check tokens and roles with the same functions
+as its views (see auth/rbac.py), and run inside one of its request contexts:
+the application's request hooks (metrics, tracing, query statistics,
+response compression and profiling) apply to them as to the Flask views,
+under the endpoint names of the Flask views they replace. The live event
+stream sends its own response, which the after-request hooks don't see; its
+span covers the whole connection.
+Enable with ASYNC_VIEWS=true and run:
+
+    uvicorn dndbehind.asgi:app
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask, Response
+from flask_jwt_extended import create_access_token, current_user
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, \
+    create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from . import models
+from .auth.rbac import BACKGROUND_ROLES, CHARACTER_READ_ROLES, \
+    accessible_resources, check_role, verify_identity
+from .changes.broker import sse_message
+from .mgmt.routes import multi_get_results, parse_ids
+from .serialization import rows_as_dicts
+from .singleflight import SingleFlight
+
+# Async drivers for the synchronous database URL schemes
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class AsyncViewError(Exception):
+    """Raised by async views to end the request with an error response."""
+
+    def __init__(self, status: int, msg: str) -> None:
+        """Initialize the error.
+
+        Args:
+            status (int): HTTP status code.
+            msg (str): message for the "msg" field of the JSON response.
+        """
+        super().__init__(msg)
+        self.status = status
+        self.msg = msg
+
+
+def async_database_url(url: str) -> str:
+    """Convert a database URL to one using an async driver.
+
+    Args:
+        url (str): SQLAlchemy database URL, e.g. "sqlite:///dndbehind.db".
+
+    Returns:
+        str: the URL with an async driver, e.g.
+             "sqlite+aiosqlite:///dndbehind.db". URLs that already specify
+             a driver are returned unchanged.
+    """
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+def create_engine_for(app: Flask) -> AsyncEngine:
+    """Create the async engine for an application.
+
+    Args:
+        app (Flask): application whose configuration to use.
+
+    Returns:
+        AsyncEngine: engine for ASYNC_DATABASE_URL if configured, or for the
+                     async variant of SQLALCHEMY_DATABASE_URI otherwise.
+    """
+    url = app.config.get("ASYNC_DATABASE_URL") \
+        or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    return create_async_engine(url)
+
+
+class AsyncApp:
+    """ASGI application serving hot endpoints with async views."""
+
+    def __init__(self, app: Flask, engine: AsyncEngine | None = None) -> None:
+        """Initialize the async application.
+
+        Args:
+            app (Flask): the Flask application to wrap.
+            engine (AsyncEngine | None, optional): engine to use. Defaults to
+                                                   an engine created from the
+                                                   app's configuration.
+        """
+        self.flask_app = app
+        self.engine = engine or create_engine_for(app)
+        self.session = async_sessionmaker(self.engine,
+                                          expire_on_commit=False)
+        self.fallback = WsgiToAsgi(app)
+        self.single_flight = SingleFlight()
+        self.hash_executor = ThreadPoolExecutor(
+            max_workers=app.config.get("ASYNC_HASH_WORKERS")
+            or os.cpu_count(),
+            thread_name_prefix="argon2")
+
+        self.url_map = Map([
+            Rule("/auth/login", methods=["POST"], endpoint=self.login),
+            Rule("/auth/whoami", methods=["GET"], endpoint=self.whoami),
+            Rule("/character/<int:character_id>", methods=["GET"],
+                 endpoint=self.get_character),
+            Rule("/character", methods=["GET"],
+                 endpoint=self.get_characters),
+            Rule("/background", methods=["GET"],
+                 endpoint=self.list_backgrounds),
+            Rule("/character/<int:character_id>/events", methods=["GET"],
+                 endpoint=self.character_events),
+        ])
+        # Views sending their own response, rather than returning data
+        self.streaming_views = {self.character_events}
+
+    async def __call__(self, scope: Scope,
+                       receive: Receive,
+                       send: Send) -> None:
+        """Handle an ASGI connection.
+
+        Args:
+            scope (Scope): connection scope.
+            receive (Receive): ASGI receive callable.
+            send (Send): ASGI send callable.
+        """
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            await self.fallback(scope, receive, send)
+            return
+
+        try:
+            view, view_args = self.url_map.bind("localhost").match(
+                scope["path"], method=scope["method"])
+        except HTTPException:
+            await self.fallback(scope, receive, send)
+            return
+        if "expand" in parse_qs(scope.get("query_string", b"").decode()):
+            # Relations are only expanded by the Flask views
+            await self.fallback(scope, receive, send)
+            return
+
+        with self.flask_app.request_context(self._environ(scope)):
+            try:
+                # A before_request hook may answer the request itself, as
+                # in Flask.full_dispatch_request
+                result = self.flask_app.preprocess_request()
+                if result is None:
+                    if view in self.streaming_views:
+                        await view(scope, receive, send, **view_args)
+                        return
+                    result = await view(scope, receive, **view_args)
+            except AsyncViewError as e:
+                result = self._json_response(e.status, {"msg": e.msg})
+            except Exception as e:
+                # E.g. invalid tokens, answered by the application's error
+                # handlers as for the Flask views
+                result = self.flask_app.handle_user_exception(e)
+            response = self.flask_app.process_response(
+                self.flask_app.make_response(result))
+
+        await self._send_response(send, response)
+
+    @staticmethod
+    def _environ(scope: Scope) -> dict[str, Any]:
+        """Build the WSGI environment of a request for its Flask context.
+        The body is left to the async view.
+
+        Args:
+            scope (Scope): connection scope.
+
+        Returns:
+            dict[str, Any]: the environment.
+        """
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            "PATH_INFO": scope["path"],
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(),
+        }
+        if scope.get("client"):
+            environ["REMOTE_ADDR"] = scope["client"][0]
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").upper().replace("-", "_")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = f"HTTP_{name}"
+            value = value.decode("latin-1")
+            environ[name] = f"{environ[name]},{value}" if name in environ \
+                else value
+        return environ
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        """Handle the ASGI lifespan protocol.
+
+        Args:
+            receive (Receive): ASGI receive callable.
+            send (Send): ASGI send callable.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.hash_executor.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _json_response(self, status: int, obj: Any) -> Response:
+        """Build a JSON response.
+
+        Args:
+            status (int): HTTP status code.
+            obj (Any): data to serialize as the response body.
+
+        Returns:
+            Response: the response.
+        """
+        return self.flask_app.response_class(
+            self.flask_app.json.dumps(obj), status,
+            mimetype="application/json")
+
+    @staticmethod
+    async def _send_response(send: Send, response: Response) -> None:
+        """Send a complete response.
+
+        Args:
+            send (Send): ASGI send callable.
+            response (Response): the response, after the request hooks.
+        """
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(name.lower().encode("latin-1"),
+                         value.encode("latin-1"))
+                        for name, value in response.headers.items()],
+        })
+        await send({"type": "http.response.body",
+                    "body": response.get_data()})
+
+    async def _read_json(self, receive: Receive) -> Any:
+        """Read the request body and decode it as JSON.
+
+        Args:
+            receive (Receive): ASGI receive callable.
+
+        Raises:
+            AsyncViewError: raised when the body is not valid JSON.
+
+        Returns:
+            Any: the decoded request body.
+        """
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        try:
+            return self.flask_app.json.loads(b"".join(chunks))
+        except ValueError:
+            raise AsyncViewError(400, "Malformed request")
+
+    @staticmethod
+    async def _verify_identity() -> tuple[dict[str, Any], int]:
+        """Verify the access token of the current request as the Flask views
+        do (see auth/rbac.py), including the blocklist check and the user
+        lookup. The lookup uses the synchronous session, so it runs in a
+        thread, which inherits the request context.
+
+        Raises:
+            JWTExtendedException | PyJWTError: raised when the token is
+                                               missing or invalid, or its
+                                               user doesn't exist.
+
+        Returns:
+            tuple[dict[str, Any], int]: the verified token payload and the
+                                        ID of its user.
+        """
+        def verify() -> tuple[dict[str, Any], int]:
+            """Verify the token and look up its user."""
+            return verify_identity(), current_user.id
+        return await asyncio.to_thread(verify)
+
+    async def _shared(self, key: Any,
+                      fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a coroutine, sharing it with identical concurrent requests
+        (see dndbehind/singleflight.py).
+
+        Args:
+            key (Any): identifies the computation.
+            fn (Callable[[], Awaitable[Any]]): function returning the
+                                               coroutine.
+
+        Returns:
+            Any: the result, which must not be modified.
+        """
+        if not self.flask_app.config["SINGLE_FLIGHT_ENABLED"]:
+            return await fn()
+        return await self.single_flight.do_async(key, fn)
+
+    async def login(self, scope: Scope, receive: Receive) -> dict[str, str]:
+        """Async variant of auth.login_user.
+
+        Returns:
+            dict[str, str]: the access token.
+        """
+        credentials = await self._read_json(receive)
+        if not isinstance(credentials, dict):
+            raise AsyncViewError(400, "Username and password are required.")
+        username = credentials.get("username", None)
+        password = credentials.get("password", None)
+
+        if not username or not password:
+            raise AsyncViewError(400, "Username and password are required.")
+
+        client = scope.get("client")
+        ip = client[0] if client else None
+
+        def audit(action: str, actor_id: int | None = None,
+                  **details: Any) -> None:
+            """Queue an audit event of this login without blocking."""
+            self.flask_app.extensions["audit_log"].record(
+                action, actor_id=actor_id, success=action == "login", ip=ip,
+                block=False, **details)
+
+        async with self.session() as session:
+            user = await session.scalar(
+                sa.select(models.User)
+                .options(orm.selectinload(models.User.roles))
+                .where(models.User.username == username))
+            if user is None:
+                audit("login_failed", username=username,
+                      reason="unknown user")
+                raise AsyncViewError(401, "Invalid username or password.")
+
+            loop = asyncio.get_running_loop()
+            password_ok = await loop.run_in_executor(
+                self.hash_executor, user.check_password, password)
+            if not password_ok:
+                audit("login_failed", user.id, username=username,
+                      reason="wrong password")
+                raise AsyncViewError(401, "Invalid username or password.")
+
+            if user.disabled:
+                audit("login_failed", user.id, username=username,
+                      reason="disabled")
+                raise AsyncViewError(401, "User account is disabled.")
+
+            user.last_logged_in = datetime.now(timezone.utc)
+            await session.commit()
+        audit("login", user.id)
+
+        user_roles = [role.name for role in user.roles]
+        with self.flask_app.app_context():
+            token = create_access_token(
+                identity=str(user.id),
+                additional_claims={"roles": user_roles})
+        return {"access_token": token}
+
+    async def whoami(self, scope: Scope, receive: Receive) -> dict[str, Any]:
+        """Async variant of auth.whoami.
+
+        Returns:
+            dict[str, Any]: the authenticated user.
+        """
+        await self._verify_identity()
+        return {"logged_in_as": current_user.as_dict()}
+
+    async def get_character(self, scope: Scope,
+                            receive: Receive,
+                            character_id: int) -> Response:
+        """Async variant of mgmt.get_character.
+        Access is granted to the owner of the character and to the
+        CHARACTER_READ_ROLES.
+
+        Args:
+            character_id (int): ID of the character to retrieve.
+
+        Returns:
+            Response: the character data, with its version as ETag.
+        """
+        jwt_data, user_id = await self._verify_identity()
+
+        async def load() -> dict[str, Any] | None:
+            """Load the character's data."""
+            async with self.session() as session:
+                character = await session.get(models.Character, character_id)
+            return None if character is None else character.as_dict()
+
+        # Concurrent requests share the query; access is checked per caller
+        character = await self._shared(("character", character_id), load)
+        if character is None:
+            raise AsyncViewError(404, "Unknown character")
+
+        if not accessible_resources({character_id: character["owner_id"]},
+                                    user_id, jwt_data, *CHARACTER_READ_ROLES):
+            raise AsyncViewError(403, "Access denied.")
+
+        response = self._json_response(200, {"character": character})
+        response.set_etag(str(character["version"]))
+        return response
+
+    async def get_characters(self, scope: Scope,
+                             receive: Receive) -> dict[str, Any]:
+        """Async variant of mgmt.get_characters.
+
+        Returns:
+            dict[str, Any]: a result per requested ID.
+        """
+        jwt_data, user_id = await self._verify_identity()
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        try:
+            ids = parse_ids(query.get("ids", []),
+                            self.flask_app.config["MULTI_GET_MAX_IDS"])
+        except ValueError as e:
+            raise AsyncViewError(400, str(e))
+
+        async def load() -> dict[int, dict[str, Any]]:
+            """Load the characters, by ID."""
+            async with self.session() as session:
+                rows = await session.execute(
+                    sa.select(*models.Character.as_dict_columns())
+                    .where(models.Character.id.in_(ids)))
+            return {row["id"]: row for row in rows_as_dicts(rows)}
+
+        characters = await self._shared(("characters", frozenset(ids)), load)
+        granted = accessible_resources(
+            {character_id: character["owner_id"]
+             for character_id, character in characters.items()},
+            user_id, jwt_data, *CHARACTER_READ_ROLES)
+        return {"results": multi_get_results(ids, characters, granted)}
+
+    async def list_backgrounds(self, scope: Scope,
+                               receive: Receive) -> list[dict[str, Any]]:
+        """Async variant of mgmt.list_backgounds.
+
+        Returns:
+            list[dict[str, Any]]: all background data.
+        """
+        # The check looks up the user with the synchronous session
+        if not await asyncio.to_thread(check_role, *BACKGROUND_ROLES):
+            raise AsyncViewError(403, "Access denied.")
+
+        async def load() -> list[dict[str, Any]]:
+            """Load all backgrounds."""
+            async with self.session() as session:
+                backgrounds = await session.execute(
+                    sa.select(*models.Background.as_dict_columns()))
+            return rows_as_dicts(backgrounds)
+
+        return await self._shared(("backgrounds",), load)
+
+    async def character_events(self, scope: Scope, receive: Receive,
+                               send: Send, character_id: int) -> None:
+        """Async variant of changes.character_events.
+        Idle connections only cost a subscription and a task, so a single
+        worker can serve thousands of them.
+
+        Args:
+            character_id (int): ID of the character to subscribe to.
+        """
+        jwt_data, user_id = await self._verify_identity()
+
+        async with self.session() as session:
+            character = await session.get(models.Character, character_id)
+        if character is None:
+            raise AsyncViewError(404, "Unknown character")
+
+        if not accessible_resources({character_id: character.owner_id},
+                                    user_id, jwt_data, *CHARACTER_READ_ROLES):
+            raise AsyncViewError(403, "Access denied.")
+
+        live_changes = self.flask_app.extensions["live_changes"]
+        try:
+            subscription = live_changes.subscribe(f"character:{character_id}")
+        except OverflowError:
+            raise AsyncViewError(503, "Too many subscribers, try again later.")
+
+        dumps = self.flask_app.json.dumps
+        heartbeat = self.flask_app.config["CHANGES_HEARTBEAT"]
+        disconnected = asyncio.ensure_future(
+            self._wait_for_disconnect(receive))
+        try:
+            # Read after subscribing, so no change after the snapshot is missed
+            async with self.session() as session:
+                character = await session.get(models.Character, character_id)
+            if character is None:
+                # Deleted since the access check; nothing was sent yet
+                raise AsyncViewError(404, "Unknown character")
+
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            })
+            chunks = ["retry: 3000\n\n",
+                      sse_message("character", dumps(character.as_dict()))]
+
+            while not disconnected.done():
+                await send({"type": "http.response.body",
+                            "body": "".join(chunks).encode("utf-8"),
+                            "more_body": True})
+                chunks = []
+                events = await subscription.wait_async(heartbeat)
+                if not events:
+                    chunks.append(": heartbeat\n\n")
+                for event in events:
+                    if event["operation"] == "delete":
+                        chunks.append(sse_message(
+                            "delete", dumps(event["entity_id"]), event["id"]))
+                        await send({"type": "http.response.body",
+                                    "body": "".join(chunks).encode("utf-8")})
+                        return
+                    chunks.append(sse_message(
+                        "character", dumps(event["payload"]), event["id"]))
+        finally:
+            disconnected.cancel()
+            live_changes.unsubscribe(subscription)
+
+    @staticmethod
+    async def _wait_for_disconnect(receive: Receive) -> None:
+        """Wait until the client disconnects.
+
+        Args:
+            receive (Receive): ASGI receive callable.
+        """
+        while (await receive())["type"] != "http.disconnect":
+            pass
@@ -0,0 +1,20 @@
+"""ASGI entry point for production servers.
+
+The application itself is WSGI; this module wraps it in an ASGI adapter so
+it can be served by ASGI servers such as uvicorn:
+
+    uvicorn dndbehind.asgi:app
+
+By default requests are handled by the WSGI application in a thread pool.
+With ASYNC_VIEWS enabled, the hot endpoints are served by the async views in
+dndbehind/aio.py instead.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from .wsgi import app as wsgi_app
+
+if wsgi_app.config["ASYNC_VIEWS"]:
+    from .aio import AsyncApp
+    app = AsyncApp(wsgi_app)
+else:
+    app = WsgiToAsgi(wsgi_app)
@@ -0,0 +1,7 @@
+"""The audit log module."""
+
+from flask import Blueprint
+
+bp = Blueprint("audit", __name__)
+
+from . import routes    # noqa: F401, E402
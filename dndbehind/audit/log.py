@@ -0,0 +1,280 @@
+"""Buffered, asynchronous audit log of security-relevant actions.
+
+Views record events with audit(), which only puts them on an in-memory
+queue: logging in never waits for an audit write. A background thread takes
+the events off the queue and writes them in batches to the AUDIT_SINK:
+
+- "database": the append-only audit_event table, queried with GET /audit.
+- "file": NDJSON files in AUDIT_DIR, one per worker process, rotated when
+  they reach AUDIT_FILE_MAX_BYTES.
+- "none": events are discarded.
+
+The queue holds at most AUDIT_QUEUE_SIZE events. When the writer falls
+behind that far, recording waits up to ENQUEUE_TIMEOUT seconds for room,
+and then drops the event, counting it in dndbehind_audit_events_total.
+Failed writes are retried, keeping the batch. On a graceful shutdown the
+writer drains the queue before the process exits.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from flask import Flask, current_app, has_request_context, request
+import msgspec
+import sqlalchemy as sa
+
+from .. import db
+from ..metrics import AUDIT_EVENTS
+from ..models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds a full queue may delay a request before the event is dropped
+ENQUEUE_TIMEOUT = 1.0
+# Longest wait between retries of a failed write
+MAX_RETRY_DELAY = 30.0
+
+
+class DatabaseSink:
+    """Writes audit events to the audit_event table."""
+
+    def __init__(self, app: Flask) -> None:
+        """Initialize the sink.
+
+        Args:
+            app (Flask): application whose database to write to.
+        """
+        self.app = app
+
+    def write(self, events: list[dict[str, Any]]) -> None:
+        """Insert a batch of events in one transaction.
+
+        Args:
+            events (list[dict[str, Any]]): the events.
+        """
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.execute(sa.insert(AuditEvent.__table__), events)
+
+
+class FileSink:
+    """Appends audit events to rotated NDJSON files."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        """Initialize the sink.
+
+        Args:
+            directory (str): directory to write the files to.
+            max_bytes (int): size at which a file is rotated.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._encoder = msgspec.json.Encoder()
+
+    def path(self) -> str:
+        """Return the path of this process's current file.
+        Every worker process writes its own file, so lines of concurrent
+        writers never interleave.
+
+        Returns:
+            str: the path.
+        """
+        return os.path.join(self.directory, f"audit-{os.getpid()}.ndjson")
+
+    def write(self, events: list[dict[str, Any]]) -> None:
+        """Append a batch of events, one JSON document per line.
+        The current file is renamed to audit-<pid>-<timestamp>.ndjson when
+        it reaches the maximum size.
+
+        Args:
+            events (list[dict[str, Any]]): the events.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path()
+        lines = b"".join(self._encoder.encode(event) + b"\n"
+                         for event in events)
+        with open(path, "ab") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if size >= self.max_bytes:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+            os.replace(path, f"{path[:-len('.ndjson')]}-{stamp}.ndjson")
+
+
+class AuditLog:
+    """Flask extension queueing audit events for a background writer."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        self.sink: DatabaseSink | FileSink | None = None
+        self._queue: queue.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Create the sink and queue configured for an application.
+
+        Args:
+            app (Flask): the Flask application.
+
+        Raises:
+            ValueError: raised when AUDIT_SINK is unknown.
+        """
+        config = app.config
+        sink = config["AUDIT_SINK"]
+        if sink == "database":
+            self.sink = DatabaseSink(app)
+        elif sink == "file":
+            self.sink = FileSink(config["AUDIT_DIR"],
+                                 config["AUDIT_FILE_MAX_BYTES"])
+        elif sink != "none":
+            raise ValueError(f"Unknown audit sink {sink!r}")
+        self.batch_size = config["AUDIT_BATCH_SIZE"]
+        self.flush_interval = config["AUDIT_FLUSH_INTERVAL"]
+        self._queue = queue.Queue(config["AUDIT_QUEUE_SIZE"])
+        if self.sink is not None:
+            atexit.register(self.close)
+        app.extensions["audit_log"] = self
+
+    def record(self, action: str, actor_id: int | None = None,
+               target: str | None = None, success: bool = True,
+               ip: str | None = None, block: bool = True,
+               **details: Any) -> None:
+        """Queue an audit event.
+
+        Args:
+            action (str): what happened, e.g. "login" or "roles_added".
+            actor_id (int | None, optional): ID of the user who did it.
+                                             Defaults to None.
+            target (str | None, optional): what it was done to, e.g.
+                                           "user:42". Defaults to None.
+            success (bool, optional): whether it succeeded. Defaults to
+                                      True.
+            ip (str | None, optional): client address. Defaults to the
+                                       address of the current request.
+            block (bool, optional): whether to wait up to ENQUEUE_TIMEOUT
+                                    for room in a full queue; event loops
+                                    must not. Defaults to True.
+            details (Any): further JSON-serializable information.
+        """
+        if self.sink is None:
+            return
+        if ip is None and has_request_context():
+            ip = request.remote_addr
+        event = {
+            "created_at": datetime.now(timezone.utc),
+            "action": action,
+            "actor_id": actor_id,
+            "target": target,
+            "success": success,
+            "ip": ip,
+            "details": details or None,
+        }
+        self._start()
+        try:
+            self._queue.put(event, block, ENQUEUE_TIMEOUT)
+        except queue.Full:
+            AUDIT_EVENTS.labels("dropped").inc()
+            logger.error("Audit queue full; dropped %s event", action)
+
+    def _start(self) -> None:
+        """Start the writer thread unless it's running.
+        Threads don't survive forking, so the writer starts lazily in every
+        worker process on its first event.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="audit-writer")
+            self._thread.start()
+
+    def _next_batch(self) -> list[dict[str, Any]]:
+        """Wait up to a flush interval for events, and take up to a batch.
+
+        Returns:
+            list[dict[str, Any]]: the events; empty if there were none.
+        """
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        """Write a batch, retrying until it succeeds or the log is closed.
+
+        Args:
+            batch (list[dict[str, Any]]): the events.
+        """
+        delay = 0.1
+        while True:
+            try:
+                self.sink.write(batch)
+            except Exception:
+                logger.exception("Writing %d audit events failed",
+                                 len(batch))
+                if self._stopping.is_set():
+                    AUDIT_EVENTS.labels("dropped").inc(len(batch))
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            else:
+                AUDIT_EVENTS.labels("written").inc(len(batch))
+                return
+
+    def _run(self) -> None:
+        """Write batches until the log is closed and the queue is empty."""
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            elif self._stopping.is_set():
+                return
+
+    def close(self, timeout: float | None = None) -> None:
+        """Write the queued events and stop the writer thread.
+        Runs at exit; a later event starts a new writer.
+
+        Args:
+            timeout (float | None, optional): seconds to wait for the queue
+                                              to be written. Defaults to
+                                              None, to wait until it is.
+        """
+        self._stopping.set()
+        with self._lock:
+            if self._thread is not None:
+                self._thread.join(timeout)
+                self._thread = None
+
+
+def audit(action: str, **kwargs: Any) -> None:
+    """Queue an audit event with the current application's audit log.
+
+    Args:
+        action (str): what happened; see AuditLog.record for the other
+                      arguments.
+    """
+    current_app.extensions["audit_log"].record(action, **kwargs)
@@ -0,0 +1,57 @@
+"""Routes for querying the audit log."""
+from flask import current_app, jsonify, request, Response
+import sqlalchemy as sa
+
+from . import bp
+from .. import db
+from ..auth.rbac import role_required
+from ..models import AuditEvent
+from ..serialization import rows_as_dicts
+
+
+@bp.route("/audit", methods=["GET"])
+@role_required("admin")
+def list_audit_events() -> Response:
+    """List audit events, newest first.
+    Events are written asynchronously, so the latest ones may not be listed
+    for up to AUDIT_FLUSH_INTERVAL seconds.
+
+    Query parameters:
+        before: only list events with a lower ID, to page back; use the
+                returned "next".
+        limit: maximum number of events (at most AUDIT_PAGE_SIZE).
+        action: only list events of this action.
+        actor_id: only list events of this user.
+
+    Returns:
+        Response: JSON document with the events and the "next" cursor (null
+                  on the last page), 400 for invalid parameters, or 501 if
+                  the events aren't written to the database.
+    """
+    config = current_app.config
+    if config["AUDIT_SINK"] != "database":
+        return jsonify(msg="The audit log isn't stored in the database."), 501
+
+    page_size = config["AUDIT_PAGE_SIZE"]
+    try:
+        before = request.args.get("before", type=int)
+        actor_id = request.args.get("actor_id", type=int)
+        limit = int(request.args.get("limit", page_size))
+    except ValueError:
+        return jsonify(msg="before, actor_id and limit must be numbers."), 400
+    if limit < 1:
+        return jsonify(msg="limit must be positive."), 400
+    limit = min(limit, page_size)
+
+    query = sa.select(*AuditEvent.as_dict_columns())
+    if before is not None:
+        query = query.where(AuditEvent.id < before)
+    if actor_id is not None:
+        query = query.where(AuditEvent.actor_id == actor_id)
+    if "action" in request.args:
+        query = query.where(AuditEvent.action == request.args["action"])
+    events = rows_as_dicts(db.session.execute(
+        query.order_by(AuditEvent.id.desc()).limit(limit)))
+
+    return jsonify(events=events,
+                   next=events[-1]["id"] if len(events) == limit else None)
@@ -1,7 +1,9 @@
 from typing import Any
 
 from .. import jwt
+from ..metrics import JWT_USER_LOOKUPS
 from ..models import User, db
+from ..tracing import tracer
 
 
 @jwt.user_lookup_loader
@@ -22,4 +24,7 @@ def user_lookup_callback(_jwt_header: dict[str, Any],
         User | None: The user object if found, or None if not found.
     """
     identity = jwt_data["sub"]
-    return db.session.get(User, identity)
+    with tracer.start_as_current_span("jwt.user_lookup"):
+        user = db.session.get(User, identity)
+    JWT_USER_LOOKUPS.labels("hit" if user is not None else "miss").inc()
+    return user
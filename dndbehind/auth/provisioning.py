@@ -0,0 +1,225 @@
+"""Bulk creation of users, for onboarding a whole group at once.
+
+Creating users one request at a time costs a password hash and a commit per
+user. provision_users instead:
+
+1. checks all usernames and emails with one query, and the role names with
+   another, and rejects duplicates within the batch itself;
+2. hashes the passwords of the remaining users in parallel. argon2-cffi
+   releases the GIL while hashing, so a thread pool of BULK_HASH_WORKERS
+   threads uses as many cores as a process pool would, without pickling
+   passwords to other processes;
+3. inserts the users and their user_role rows in transactions of
+   BULK_USERS_BATCH_SIZE users, each with one executemany per table. A batch
+   that fails because a conflicting user was created concurrently is
+   retried user by user, so only the conflicting users fail.
+
+The outcome is reported per input row.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Literal, TypedDict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import msgspec
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.exc import IntegrityError
+
+from ..metrics import PASSWORD_HASH_TIME
+from ..models import Role, User, password_hasher, user_roles_table
+from ..schemas import UserProvision
+from ..tracing import tracer
+
+
+class ProvisionResult(TypedDict, total=False):
+    """Outcome of one row of a bulk user creation."""
+    index: int
+    username: str
+    status: Literal["created", "conflict", "invalid"]
+    id: int
+    msg: str
+
+
+def _hash_executor() -> ThreadPoolExecutor:
+    """Return the current application's password hashing threads.
+    The pool is created on first use, in the worker process using it.
+
+    Returns:
+        ThreadPoolExecutor: the pool.
+    """
+    executor = current_app.extensions.get("bulk_hash_executor")
+    if executor is None:
+        executor = current_app.extensions["bulk_hash_executor"] = \
+            ThreadPoolExecutor(
+                max_workers=current_app.config["BULK_HASH_WORKERS"],
+                thread_name_prefix="bulk-hash")
+    return executor
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash passwords in parallel.
+
+    Args:
+        passwords (list[str]): the passwords.
+
+    Returns:
+        list[str]: their hashes, in the same order.
+    """
+    hasher = password_hasher()
+
+    def hash_one(password: str) -> str:
+        """Hash one password, timing it like User.set_password."""
+        with PASSWORD_HASH_TIME.labels("hash").time():
+            return hasher.hash(password)
+
+    with tracer.start_as_current_span(
+            "argon2.hash_many", attributes={"argon2.count": len(passwords)}):
+        return list(_hash_executor().map(hash_one, passwords))
+
+
+def _batches(items: list[Any], size: int) -> Iterator[list[Any]]:
+    """Split a list into consecutive batches of at most size items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert(session: orm.Session, rows: list[dict[str, Any]],
+            role_ids: dict[str, int]) -> list[int]:
+    """Insert users and their roles, without committing.
+
+    Args:
+        session (orm.Session): session to insert with.
+        rows (list[dict[str, Any]]): user columns, and "roles" with the
+                                     users' role names.
+        role_ids (dict[str, int]): IDs of the roles by name.
+
+    Returns:
+        list[int]: IDs of the new users, in the order of the rows.
+    """
+    user_ids = session.scalars(
+        sa.insert(User).returning(User.id, sort_by_parameter_order=True),
+        [{key: value for key, value in row.items() if key != "roles"}
+         for row in rows]).all()
+    assignments = [{"user_id": user_id, "role_id": role_ids[name]}
+                   for user_id, row in zip(user_ids, rows)
+                   for name in row["roles"]]
+    if assignments:
+        session.execute(sa.insert(user_roles_table), assignments)
+    return user_ids
+
+
+def provision_users(session: orm.Session, users: list[UserProvision],
+                    batch_size: int) -> list[ProvisionResult]:
+    """Create many users with their roles.
+
+    Args:
+        session (orm.Session): session to create the users with; committed
+                               after every batch.
+        users (list[UserProvision]): the users.
+        batch_size (int): maximum number of users per transaction.
+
+    Returns:
+        list[ProvisionResult]: the outcome for every user, in input order.
+    """
+    results: list[ProvisionResult] = [
+        {"index": index, "username": user.username}
+        for index, user in enumerate(users)]
+
+    usernames = {user.username for user in users}
+    emails = {user.email for user in users}
+    taken = session.execute(
+        sa.select(User.username, User.email)
+        .where(User.username.in_(usernames) | User.email.in_(emails))).all()
+    taken_usernames = {row.username for row in taken}
+    taken_emails = {row.email for row in taken}
+    role_names = {name for user in users for name in user.roles}
+    role_ids = dict(session.execute(
+        sa.select(Role.name, Role.id).where(Role.name.in_(role_names))).all())
+
+    valid = []
+    for result, user in zip(results, users):
+        unknown = sorted(set(user.roles) - role_ids.keys())
+        if unknown:
+            result["status"] = "invalid"
+            result["msg"] = f"Unknown roles: {', '.join(unknown)}."
+        elif user.username in taken_usernames:
+            result["status"] = "conflict"
+            result["msg"] = "Username already registered."
+        elif user.email in taken_emails:
+            result["status"] = "conflict"
+            result["msg"] = "Email address already registered."
+        else:
+            # Later rows with the same username or email conflict with this
+            taken_usernames.add(user.username)
+            taken_emails.add(user.email)
+            valid.append((result, user))
+
+    hashes = hash_passwords([user.password for _, user in valid])
+    rows = [{"username": user.username, "email": user.email,
+             "password_hash": password_hash, "disabled": False,
+             "roles": sorted(set(user.roles))}
+            for (_, user), password_hash in zip(valid, hashes)]
+
+    for batch in _batches(list(zip(valid, rows)), batch_size):
+        batch_rows = [row for _, row in batch]
+        try:
+            user_ids = _insert(session, batch_rows, role_ids)
+            session.commit()
+        except IntegrityError:
+            # A conflicting user was created since the check
+            session.rollback()
+            user_ids = []
+            for row in batch_rows:
+                try:
+                    with session.begin_nested():
+                        user_ids.extend(_insert(session, [row], role_ids))
+                except IntegrityError:
+                    user_ids.append(None)
+            session.commit()
+
+        for ((result, _), _), user_id in zip(batch, user_ids):
+            if user_id is None:
+                result["status"] = "conflict"
+                result["msg"] = "Username or email address already " \
+                                "registered."
+            else:
+                result["status"] = "created"
+                result["id"] = user_id
+    return results
+
+
+@click.group("users")
+def users_cli() -> None:
+    """Manage users."""
+
+
+@users_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def import_users(path: str) -> None:
+    """Create the users in a JSON file.
+    The file holds a list of objects with username, email, password and
+    optionally roles, like the body of POST /auth/users.
+    """
+    from .. import db
+
+    with open(path, "rb") as f:
+        try:
+            users = msgspec.json.decode(f.read(), type=list[UserProvision])
+        except msgspec.DecodeError as e:
+            raise click.ClickException(f"Invalid user file: {e}")
+
+    results = provision_users(db.session, users,
+                              current_app.config["BULK_USERS_BATCH_SIZE"])
+    created = 0
+    for result in results:
+        if result["status"] == "created":
+            created += 1
+        else:
+            click.echo(f"Row {result['index']} ({result['username']}): "
+                       f"{result['msg']}", err=True)
+    click.echo(f"Created {created} of {len(results)} users.")
+    if created < len(results):
+        raise click.exceptions.Exit(1)
@@ -1,12 +1,22 @@
-"""Role based access control functionality."""
+"""Role based access control functionality.
+
+The decorators and the async views (see aio.py) verify tokens and check roles
+with the same functions, so both deployment modes enforce the same rules.
+"""
 
 from functools import wraps
-from typing import Callable, Any
+from typing import Callable, Any, Mapping
 
 from flask import Response, jsonify, request
 from flask_jwt_extended import verify_jwt_in_request, current_user
 
 from ..models import User
+from ..tracing import tracer
+
+# Roles granting access to resources served by both the Flask views and
+# their async variants, regardless of ownership
+CHARACTER_READ_ROLES = ("operator",)
+BACKGROUND_ROLES = ("maintainer",)
 
 
 def _has_role(jwt_data: dict[str, Any], role_name: str) -> bool:
@@ -23,6 +33,59 @@ def _has_role(jwt_data: dict[str, Any], role_name: str) -> bool:
     return "roles" in jwt_data and role_name in jwt_data["roles"]
 
 
+def has_any_role(jwt_data: dict[str, Any], *role_names: str) -> bool:
+    """Check if JWT data contains any of the specified roles.
+
+    Args:
+        jwt_data (dict): JSON Web Token data as a dictionary
+        role_names (str): unique names of the roles to check for
+
+    Returns:
+        bool: True if one of the roles is in jwt_data, False otherwise
+    """
+    return any(_has_role(jwt_data, role_name) for role_name in role_names)
+
+
+def verify_identity() -> dict[str, Any]:
+    """Verify the JWT of the current request and load its user, in a tracing
+    span. Besides the signature, expiry and type of the token, this runs the
+    blocklist check and the user lookup: tokens of deleted users are
+    rejected.
+
+    Raises:
+        JWTExtendedException | PyJWTError: raised when the token is missing
+                                           or invalid, or its user doesn't
+                                           exist; the application's error
+                                           handlers turn these into 401 and
+                                           422 responses.
+
+    Returns:
+        dict[str, Any]: JWT data; the user is available as current_user.
+    """
+    with tracer.start_as_current_span("jwt.verify"):
+        _, jwt_data = verify_jwt_in_request()
+    return jwt_data
+
+
+def check_role(*role_names: str) -> bool:
+    """Verify the JWT of the current request and check its roles, in a
+    tracing span.
+
+    Args:
+        role_names (str): Names of the roles to check for (e.g., "admin",
+                          "operator")
+
+    Returns:
+        bool: True if the user has one of the roles, False otherwise.
+    """
+    with tracer.start_as_current_span(
+            "rbac.role_required",
+            attributes={"rbac.roles": role_names}) as span:
+        granted = has_any_role(verify_identity(), *role_names)
+        span.set_attribute("rbac.granted", granted)
+    return granted
+
+
 def self_or_role_required(user_id_arg_name: str,
                           *role_names: tuple[str]) -> Callable:
     """Decorator for functions requiring either self or role-based access.
@@ -50,16 +113,20 @@ def self_or_role_required(user_id_arg_name: str,
                 access is granted, or a JSON response with an access denied
                 message if access is denied.
             """
-            _, jwt_data = verify_jwt_in_request()
-
-            target_user = User.from_id(request.view_args[user_id_arg_name])
-            if target_user == current_user:
+            with tracer.start_as_current_span(
+                    "rbac.self_or_role_required",
+                    attributes={"rbac.roles": role_names}) as span:
+                jwt_data = verify_identity()
+
+                target_user = User.from_id(
+                    request.view_args[user_id_arg_name])
+                granted = target_user == current_user \
+                    or has_any_role(jwt_data, *role_names)
+                span.set_attribute("rbac.granted", granted)
+
+            if granted:
                 return fn(*args, **kwargs)
 
-            for role_name in role_names:
-                if _has_role(jwt_data, role_name):
-                    return fn(*args, **kwargs)
-
             return jsonify(msg="Access denied."), 403
 
         return wrapper
@@ -68,10 +135,12 @@ def self_or_role_required(user_id_arg_name: str,
 
 def owner_or_role_required(resource_type: type,
                            resource_id_arg_name: str,
-                           *role_names: tuple[str]) -> Callable:
+                           *role_names: tuple[str],
+                           load_options: tuple[Any, ...] = ()) -> Callable:
     """Decorator for functions requiring either owner or role-based access.
     This decorator checks if the current user is either the owner of the
-    resource or has one of the specified roles.
+    resource or has one of the specified roles. The resource stays in the
+    session's identity map, so the view can get it without another query.
 
     Args:
         resource_type (type): Description of the resource type
@@ -80,6 +149,9 @@ def owner_or_role_required(resource_type: type,
                                     arguments (e.g., "character_id")
         role_names (str): Names of the roles to check for (e.g., "admin",
                           "operator")
+        load_options (tuple, optional): loader options for loading the
+                                        resource, e.g. to defer columns the
+                                        view doesn't need. Defaults to ().
     """
     def inner_decorator(fn: Callable) -> Callable:
         """Inner decorator function to wrap the target function.
@@ -105,23 +177,61 @@ def owner_or_role_required(resource_type: type,
             Returns:
                 _type_: _description_
             """
-            _, jwt_data = verify_jwt_in_request()
-
-            resource_id = request.view_args[resource_id_arg_name]
-            resource = resource_type.query.get(resource_id)
-            if resource.owner == current_user:
+            with tracer.start_as_current_span(
+                    "rbac.owner_or_role_required",
+                    attributes={"rbac.roles": role_names}) as span:
+                jwt_data = verify_identity()
+
+                resource_id = request.view_args[resource_id_arg_name]
+                resource = resource_type.query.options(*load_options) \
+                    .get(resource_id)
+                if resource is None:
+                    return jsonify(msg="Unknown resource."), 404
+                granted = resource.owner == current_user \
+                    or has_any_role(jwt_data, *role_names)
+                span.set_attribute("rbac.granted", granted)
+
+            if granted:
                 return fn(*args, **kwargs)
 
-            for role_name in role_names:
-                if _has_role(jwt_data, role_name):
-                    return fn(*args, **kwargs)
-
             return jsonify(msg="Access denied."), 403
 
         return wrapper
     return inner_decorator
 
 
+def accessible_resources(owner_ids: Mapping[int, int], user_id: int,
+                         jwt_data: dict[str, Any],
+                         *role_names: tuple[str]) -> set[int]:
+    """Evaluate owner or role-based access to many resources in one pass.
+    This is the bulk counterpart of owner_or_role_required, for views that
+    load a set of resources with a single query. The JWT must already be
+    verified.
+
+    Args:
+        owner_ids (Mapping[int, int]): owner ID by resource ID.
+        user_id (int): ID of the current user.
+        jwt_data (dict[str, Any]): JSON Web Token data as a dictionary.
+        role_names (str): Names of the roles granting access to all
+                          resources (e.g., "admin", "operator")
+
+    Returns:
+        set[int]: IDs of the resources the current user may access.
+    """
+    with tracer.start_as_current_span(
+            "rbac.accessible_resources",
+            attributes={"rbac.roles": role_names,
+                        "rbac.resources": len(owner_ids)}) as span:
+        if has_any_role(jwt_data, *role_names):
+            granted = set(owner_ids)
+        else:
+            granted = {resource_id
+                       for resource_id, owner_id in owner_ids.items()
+                       if owner_id == user_id}
+        span.set_attribute("rbac.granted", len(granted))
+    return granted
+
+
 def role_required(*role_names: tuple[str]) -> Callable:
     """Decorator for functions requiring (a) specific role(s).
     This decorator checks if the current user has one of the specified roles.
@@ -154,11 +264,8 @@ def role_required(*role_names: tuple[str]) -> Callable:
                 access is granted, or a JSON response with an access denied
                 message if access is denied.
             """
-            _, jwt_data = verify_jwt_in_request()
-
-            for role_name in role_names:
-                if _has_role(jwt_data, role_name):
-                    return fn(*args, **kwargs)
+            if check_role(*role_names):
+                return fn(*args, **kwargs)
 
             return jsonify(msg="Access denied."), 403
         return wrapper
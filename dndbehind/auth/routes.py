@@ -1,13 +1,22 @@
 """Routes for user authentication and management."""
-from flask import request, jsonify, Response, url_for
+from collections import defaultdict
+
+from flask import current_app, request, jsonify, Response, url_for
 from flask_jwt_extended import create_access_token, jwt_required, current_user
+import sqlalchemy as sa
 from sqlalchemy.exc import IntegrityError
 
 from . import bp
 from .. import db, models
+from ..audit.log import audit
+from ..idempotency import idempotent
+from .provisioning import provision_users
 from .rbac import role_required, self_or_role_required
-from ..utils import make_standardized_response, \
-    required_keys_present, make_standardized_response
+from ..schemas import UserBulkCreate, UserCreate, UserUpdate, \
+    present_fields, validated_body
+from ..serialization import rows_as_dicts
+from ..tracing import tracer
+from ..utils import make_standardized_response
 
 
 @bp.route("/user/<int:user_id>", methods=["GET"])
@@ -29,37 +38,38 @@ def get_user(user_id: int) -> Response:
 
 
 @bp.route("/user", methods=["POST"])
-def create_user() -> Response:
+@idempotent
+@validated_body(UserCreate)
+def create_user(body: UserCreate) -> Response:
     """Creates new user according to JSON document in request body.
+    Retries with the same Idempotency-Key get the first response back.
+
+    Args:
+        body (UserCreate): validated request body.
 
     Returns:
         tuple[str, int]: message and HTTP result code
 
             On success, the message will be the new user ID and the status code
             will be 201.
+            If the request body is invalid, an appropriate message and status
+            code 400 will be returned.
             If the email address is already registered, an appropriate message
             and status code 409 will be returned.
             If any other error occurs, a generic error message and status code
             500 will be returned.
     """
-    userdata = request.get_json()
-    required_keys = {"username", "email", "password"}
-
-    if not required_keys_present(required_keys, userdata):
-        return make_standardized_response(
-            message="Missing required fields",
-            status_code=400
-        )
-
     new_user = models.User(
-        username=userdata["username"],
-        email=userdata["email"],
+        username=body.username,
+        email=body.email,
     )
 
     try:
         db.session.add(new_user)
-        new_user.set_password(userdata["password"])
+        new_user.set_password(body.password)
         db.session.commit()
+        audit("user_created", actor_id=new_user.id,
+              target=f"user:{new_user.id}")
 
         response = make_standardized_response(
             message="User created successfully.",
@@ -80,9 +90,41 @@ def create_user() -> Response:
             status_code=409)
 
 
+@bp.route("/users", methods=["POST"])
+@role_required("admin")
+@idempotent
+@validated_body(UserBulkCreate)
+def create_users(body: UserBulkCreate) -> Response:
+    """Creates many users at once, with their roles.
+    Users that can't be created don't stop the others.
+
+    Args:
+        body (UserBulkCreate): validated request body.
+
+    Returns:
+        Response: JSON document with the number of created users and a
+                  result per user: "created" with its ID, or "conflict"
+                  (username or email address taken) or "invalid" (unknown
+                  role) with a message. 400 if there are more than
+                  BULK_USERS_MAX users.
+    """
+    max_users = current_app.config["BULK_USERS_MAX"]
+    if len(body.users) > max_users:
+        return jsonify(msg=f"At most {max_users} users per request."), 400
+
+    results = provision_users(db.session, body.users,
+                              current_app.config["BULK_USERS_BATCH_SIZE"])
+    created = [result["id"] for result in results
+               if result["status"] == "created"]
+    if created:
+        audit("users_created", actor_id=current_user.id, user_ids=created)
+    return jsonify(created=len(created), results=results)
+
+
 @bp.route("/user/<int:user_id>", methods=["PUT", "PATCH"])
 @self_or_role_required("user_id", "admin")
-def update_user(user_id: int) -> Response:
+@validated_body(UserUpdate)
+def update_user(user_id: int, body: UserUpdate) -> Response:
     """Updates user according to JSON document in request body.
     The user ID is specified in the URL path.
     The user ID must be the same as the one in the JWT token, or the user must
@@ -90,47 +132,34 @@ def update_user(user_id: int) -> Response:
 
     Args:
         user_id (int): ID of the user to update.
+        body (UserUpdate): validated request body.
 
     Returns:
         Response: JSON response with status message of result.
     """
-    valid_field_set = {
-        "username",
-        "email",
-        "password",
-        "disabled",
-        "last_logged_in"
-    }
-
-    updated_userdata = request.get_json()
-    target_user = models.User.from_id(user_id)
-
-    # Check if the target user exists
-    # If not, return an error message
-    if target_user is None:
+    try:
+        target_user = models.User.from_id(user_id)
+    except LookupError:
         return jsonify(msg="Unknown user"), 404
 
-    # Check if any valid fields are present in the request
+    updated_userdata = present_fields(body)
+
+    # Check if any fields are present in the request
     # If not, return an error message
-    if not valid_field_set.intersection(updated_userdata.keys()):
+    if not updated_userdata:
         return jsonify(msg="No valid fields to update."), 400
 
-    # Check if any invalid fields are present in the request
-    # If so, return an error message
-    if set(updated_userdata.keys()).difference(valid_field_set):
-        return jsonify(msg="Invalid fields in request."), 400
-
-    if "username" in updated_userdata:
-        target_user.username = updated_userdata["username"]
-    if "email" in updated_userdata:
-        target_user.email = updated_userdata["email"]
-    if "password" in updated_userdata:
-        target_user.set_password(updated_userdata["password"])
-    if "disabled" in updated_userdata:
-        target_user.disabled = updated_userdata["disabled"]
-    if "last_logged_in" in updated_userdata:
-        target_user.last_logged_in = updated_userdata["last_logged_in"]
+    password = updated_userdata.pop("password", None)
+    if password is not None:
+        target_user.set_password(password)
+    for field, value in updated_userdata.items():
+        setattr(target_user, field, value)
     db.session.commit()
+    changed = sorted(updated_userdata)
+    if password is not None:
+        changed.append("password")
+    audit("user_updated", actor_id=current_user.id,
+          target=f"user:{user_id}", fields=changed)
 
     return jsonify(
             msg="User updated successfully.",
@@ -159,24 +188,48 @@ def login_user() -> Response:
     try:
         user = models.User.from_username(username)
     except LookupError:
+        audit("login_failed", success=False, username=username,
+              reason="unknown user")
         return jsonify(msg="Invalid username or password."), 401
 
     if not user.check_password(password):
+        audit("login_failed", actor_id=user.id, success=False,
+              username=username, reason="wrong password")
         return jsonify(msg="Invalid username or password."), 401
 
     if user.disabled:
+        audit("login_failed", actor_id=user.id, success=False,
+              username=username, reason="disabled")
         return jsonify(msg="User account is disabled."), 401
 
     user.update_login_time()
+    audit("login", actor_id=user.id)
 
     user_roles = [role.name for role in user.roles]
 
-    token = create_access_token(
-        identity=str(user.id),
-        additional_claims={"roles": user_roles})
+    with tracer.start_as_current_span("jwt.create_access_token"):
+        token = create_access_token(
+            identity=str(user.id),
+            additional_claims={"roles": user_roles})
     return jsonify(access_token=token)
 
 
+@bp.route("/jwks.json", methods=["GET"])
+def jwks() -> Response:
+    """Public keys access tokens are signed with, as a JSON Web Key Set.
+    Other services verify tokens with the key matching their "kid" header.
+    The set is empty when tokens are signed with a shared secret (HS256).
+
+    Returns:
+        Response: JSON Web Key Set.
+    """
+    keys = current_app.extensions["jwt_keys"]
+    response = jsonify(keys.jwks() if keys is not None else {"keys": []})
+    # Clients refetch the set when they see an unknown key ID
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return response
+
+
 @bp.route("/whoami", methods=["GET"])
 @jwt_required()
 def whoami() -> Response:
@@ -199,11 +252,23 @@ def list_all_user_roles() -> Response:
     Returns:
         Response: JSON with all roles assigned to all users.
     """
-    all_users = models.User.query.all()
-    result = []
-    for user in all_users:
-        result.append(user.as_dict())
-        result[-1]["roles"] = [role.as_dict() for role in user.roles]
+    result = rows_as_dicts(db.session.execute(
+        sa.select(*models.User.as_dict_columns()).order_by(models.User.id)
+    ))
+
+    # Fetch all role assignments in one query instead of one per user
+    role_columns = models.Role.as_dict_columns()
+    role_keys = tuple(column.key for column in role_columns)
+    assignments = db.session.execute(
+        sa.select(models.user_roles_table.c.user_id, *role_columns)
+        .join(models.Role, models.Role.id == models.user_roles_table.c.role_id)
+    )
+    roles_by_user = defaultdict(list)
+    for user_id, *role in assignments:
+        roles_by_user[user_id].append(dict(zip(role_keys, role)))
+
+    for user in result:
+        user["roles"] = roles_by_user[user["id"]]
 
     return jsonify(result)
 
@@ -258,6 +323,8 @@ def add_roles_to_user(user_id: int) -> Response:
         return jsonify(msg="Unknown role name."), 400
 
     db.session.commit()
+    audit("roles_added", actor_id=current_user.id, target=f"user:{user_id}",
+          roles=rolenames)
     return jsonify(msg="Roles assigned to user.")
 
 
@@ -300,4 +367,6 @@ def delete_roles_from_user(user_id: int) -> Response:
         return jsonify(msg="Unknown role"), 404
 
     db.session.commit()
+    audit("roles_removed", actor_id=current_user.id,
+          target=f"user:{user_id}", roles=rolenames)
     return jsonify(msg="Roles removed from user.")
@@ -0,0 +1,8 @@
+"""The change feed module."""
+
+from flask import Blueprint
+
+bp = Blueprint("changes", __name__)
+
+from . import routes    # noqa: F401, E402
+from . import outbox    # noqa: F401, E402
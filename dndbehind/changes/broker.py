@@ -0,0 +1,384 @@
+"""Publish/subscribe fan-out of changes to live connections.
+
+Broker is an in-process pub/sub hub: every subscription has a small bounded
+buffer, so a slow client costs at most a few messages of memory. When the
+buffer overflows, the two oldest messages are merged into one (or the oldest
+is dropped without a merge function); update events only carry the changed
+fields, so merging keeps the consumer's state complete. Subscriptions can
+be consumed from threads (Flask streaming responses) and from asyncio tasks
+(the ASGI app).
+
+OutboxRelay feeds the broker from the outbox table. As every worker writes
+its changes to the outbox, the database serves as the broker shared between
+worker processes without additional infrastructure. With the relay
+disabled, the broker only carries messages published in-process, which is
+the stand-in used by the tests.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable
+
+from flask import Flask
+import sqlalchemy as sa
+
+from .outbox import events_since, wait_for_events
+from .. import db
+from ..models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+Merge = Callable[[Any, Any], Any]
+
+
+def merge_events(older: dict[str, Any],
+                 newer: dict[str, Any]) -> dict[str, Any]:
+    """Merge two consecutive outbox events of the same entity into one.
+
+    Args:
+        older (dict[str, Any]): the earlier event.
+        newer (dict[str, Any]): the later event.
+
+    Returns:
+        dict[str, Any]: an event with the combined effect of both.
+    """
+    if newer["operation"] != "update" or older["operation"] == "delete":
+        return newer
+    return {**newer,
+            "operation": older["operation"],
+            "payload": {**older["payload"], **newer["payload"]}}
+
+
+class Subscription:
+    """Bounded buffer of the messages published to one channel."""
+
+    def __init__(self, channel: str, max_pending: int,
+                 merge: Merge | None = None) -> None:
+        """Initialize an empty subscription.
+
+        Args:
+            channel (str): the subscribed channel.
+            max_pending (int): maximum number of buffered messages.
+            merge (Merge | None, optional): function combining the two
+                                            oldest messages on overflow.
+                                            Defaults to None, which drops
+                                            the oldest message.
+        """
+        self.channel = channel
+        self.dropped = 0
+        self._merge = merge
+        self._pending: deque[Any] = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._ready_async: asyncio.Event | None = None
+
+    def deliver(self, message: Any) -> None:
+        """Buffer a message, making room by merging or dropping the oldest
+        messages if the buffer is full.
+
+        Args:
+            message (Any): the published message.
+        """
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+                if self._merge is not None and len(self._pending) > 1:
+                    oldest = self._pending.popleft()
+                    self._pending[0] = self._merge(oldest, self._pending[0])
+            self._pending.append(message)
+        self._ready.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ready_async.set)
+
+    def drain(self) -> list[Any]:
+        """Take all buffered messages.
+
+        Returns:
+            list[Any]: the messages, oldest first.
+        """
+        with self._lock:
+            messages = list(self._pending)
+            self._pending.clear()
+            self._ready.clear()
+            if self._ready_async is not None:
+                self._ready_async.clear()
+        return messages
+
+    def wait(self, timeout: float) -> list[Any]:
+        """Wait for messages from a thread.
+
+        Args:
+            timeout (float): maximum number of seconds to wait.
+
+        Returns:
+            list[Any]: the messages, or an empty list on timeout.
+        """
+        self._ready.wait(timeout)
+        return self.drain()
+
+    async def wait_async(self, timeout: float) -> list[Any]:
+        """Wait for messages from an asyncio task.
+
+        Args:
+            timeout (float): maximum number of seconds to wait.
+
+        Returns:
+            list[Any]: the messages, or an empty list on timeout.
+        """
+        if self._loop is None:
+            self._ready_async = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+            if self._ready.is_set():
+                self._ready_async.set()
+        try:
+            await asyncio.wait_for(self._ready_async.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.drain()
+
+
+class Broker:
+    """Thread safe in-process publish/subscribe hub."""
+
+    def __init__(self, max_pending: int = 8,
+                 max_subscriptions: int = 10_000,
+                 merge: Merge | None = None) -> None:
+        """Initialize the broker.
+
+        Args:
+            max_pending (int, optional): buffer size of each subscription.
+                                         Defaults to 8.
+            max_subscriptions (int, optional): maximum number of concurrent
+                                               subscriptions. Defaults to
+                                               10000.
+            merge (Merge | None, optional): function combining the two
+                                            oldest messages of a full
+                                            subscription. Defaults to None,
+                                            which drops the oldest message.
+        """
+        self.max_pending = max_pending
+        self.max_subscriptions = max_subscriptions
+        self.merge = merge
+        self._channels: dict[str, set[Subscription]] = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscription:
+        """Subscribe to a channel.
+
+        Args:
+            channel (str): name of the channel, e.g. "character:42".
+
+        Raises:
+            OverflowError: raised when the broker is at capacity.
+
+        Returns:
+            Subscription: the new subscription; unsubscribe when done.
+        """
+        subscription = Subscription(channel, self.max_pending, self.merge)
+        with self._lock:
+            if self._count >= self.max_subscriptions:
+                raise OverflowError("Too many subscriptions")
+            self._channels[channel].add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Cancel a subscription.
+
+        Args:
+            subscription (Subscription): the subscription to cancel.
+        """
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._channels[subscription.channel]
+            self._count -= 1
+
+    def publish(self, channel: str, message: Any) -> int:
+        """Deliver a message to all subscribers of a channel.
+
+        Args:
+            channel (str): name of the channel.
+            message (Any): the message.
+
+        Returns:
+            int: number of subscribers the message was delivered to.
+        """
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def __len__(self) -> int:
+        """Return the number of subscriptions."""
+        return self._count
+
+
+class OutboxRelay:
+    """Background thread publishing committed outbox events to a broker.
+    Events are published to the "<entity>:<entity_id>" channel, in commit
+    order: the relay follows the outbox with the same ID cursor as the
+    change feed, whose IDs are assigned in commit order (see outbox.py), so
+    no committed event is skipped.
+    """
+
+    def __init__(self, app: Flask, broker: Broker,
+                 poll_interval: float) -> None:
+        """Initialize the relay; it starts on the first call to start().
+
+        Args:
+            app (Flask): application whose database to read.
+            broker (Broker): broker to publish to.
+            poll_interval (float): seconds between polls for events of
+                                   other processes.
+        """
+        self.app = app
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        """Start the relay thread unless it's already running.
+        Threads don't survive forking, so the relay starts lazily in every
+        worker process on its first subscription.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Events committed from here on are relayed
+            with self.app.app_context():
+                cursor = self._latest_event_id()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(cursor,),
+                                            daemon=True, name="outbox-relay")
+            self._thread.start()
+
+    def _run(self, cursor: int) -> None:
+        """Publish events until the process exits.
+
+        Args:
+            cursor (int): ID of the last event not to publish.
+        """
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    events = events_since(db.session, cursor, 1000)
+                except Exception:
+                    logger.exception("Reading the outbox failed")
+                    events = []
+                # Don't keep a connection checked out while waiting
+                db.session.rollback()
+
+                for event in events:
+                    self.broker.publish(
+                        f"{event['entity']}:{event['entity_id']}", event)
+                if events:
+                    # Safe: no event can be committed below the cursor
+                    cursor = events[-1]["id"]
+                if len(events) < 1000:
+                    wait_for_events(self.poll_interval)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop the relay thread, e.g. before the application is discarded.
+        It stops within a poll interval; start() starts a new one.
+
+        Args:
+            timeout (float | None, optional): seconds to wait for the thread
+                                              to stop. Defaults to None, to
+                                              wait until it has.
+        """
+        self._stopping.set()
+        with self._lock:
+            if self._thread is not None:
+                self._thread.join(timeout)
+                self._thread = None
+
+    def _latest_event_id(self) -> int:
+        """Find the cursor to start relaying from.
+
+        Returns:
+            int: ID of the latest event.
+        """
+        latest = db.session.scalar(sa.select(sa.func.max(OutboxEvent.id)))
+        db.session.close()
+        return latest or 0
+
+
+class LiveChanges:
+    """Flask extension providing subscriptions to live changes."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        self.broker: Broker | None = None
+        self.relay: OutboxRelay | None = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Create the broker, and the relay if enabled.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        self.broker = Broker(app.config["CHANGES_SUBSCRIPTION_BUFFER"],
+                             app.config["CHANGES_MAX_SUBSCRIPTIONS"],
+                             merge_events)
+        if app.config["CHANGES_RELAY_ENABLED"]:
+            self.relay = OutboxRelay(app, self.broker,
+                                     app.config["CHANGES_POLL_INTERVAL"])
+        app.extensions["live_changes"] = self
+
+    def subscribe(self, channel: str) -> Subscription:
+        """Subscribe to a channel, starting the relay if necessary.
+
+        Args:
+            channel (str): name of the channel, e.g. "character:42".
+
+        Raises:
+            OverflowError: raised when the broker is at capacity.
+
+        Returns:
+            Subscription: the new subscription; unsubscribe when done.
+        """
+        if self.relay is not None:
+            self.relay.start()
+        return self.broker.subscribe(channel)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Cancel a subscription.
+
+        Args:
+            subscription (Subscription): the subscription to cancel.
+        """
+        self.broker.unsubscribe(subscription)
+
+
+def sse_message(event: str, data: str, event_id: int | None = None) -> str:
+    """Format a Server-Sent Events message.
+
+    Args:
+        event (str): event type.
+        data (str): event data, e.g. a JSON document on a single line.
+        event_id (int | None, optional): event ID. Defaults to None.
+
+    Returns:
+        str: the message, including the terminating blank line.
+    """
+    message = f"event: {event}\ndata: {data}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n" + message
+    return message
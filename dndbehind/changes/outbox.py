@@ -0,0 +1,226 @@
+"""Transactional outbox of character, user and background changes.
+
+Whenever a session flushes inserts, updates or deletes of tracked models, an
+OutboxEvent row is written in the same transaction, so the feed contains
+exactly the committed changes. Changes made with bulk Core statements
+bypass the session and are not recorded.
+
+Inserts carry the full state of the object. Updates carry only the columns
+that changed, plus the ID (and version, for versioned models): a JSON Merge
+Patch onto the previous state. Writing the whole state for every update
+would copy large text columns into the outbox on every stat change.
+
+Event IDs are used as cursors, which requires them to become visible in the
+order they are assigned: a consumer that has seen event 11 would otherwise
+never see event 10 if the transaction writing it commits later. Writers
+therefore take a lock before their first outbox insert and hold it until
+they commit or roll back, so the ID of every event is assigned after all
+events with lower IDs have been committed. SQLite serializes writers by
+itself; on PostgreSQL a transaction-level advisory lock is taken. Only the
+outbox writes are serialized, from the first flush of tracked changes to
+the end of the transaction; keep those transactions short. Other databases
+with concurrent writers need an equivalent lock in _serialize_writers.
+
+Waiting consumers in the same process are woken as soon as a transaction
+with new events commits; consumers in other processes notice them on their
+next poll.
+"""
+import threading
+from collections import UserString
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+
+from ..models import Background, Character, OutboxEvent, OutboxEventDict, \
+    User
+from ..serialization import rows_as_dicts
+
+# Tracked models, by the entity name used in the feed
+ENTITIES = {
+    Character: "character",
+    User: "user",
+    Background: "background",
+}
+
+# Attributes whose changes alone aren't worth an event: every login, and
+# every character created, would otherwise produce a user update
+_IGNORED_ATTRIBUTES = {
+    User: {"last_logged_in", "characters"},
+}
+
+# Key of the PostgreSQL advisory lock serializing outbox writers
+_OUTBOX_LOCK_KEY = 0x646e646f7574626f    # "dndoutbo"
+
+_new_events = threading.Condition()
+
+
+def _json_safe(value: Any) -> Any:
+    """Convert a column value to a type the JSON column can store.
+
+    Args:
+        value (Any): the value.
+
+    Returns:
+        Any: datetimes as ISO strings and lazy texts as str, other values
+             unchanged.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UserString):
+        return str(value)
+    return value
+
+
+def _payload(obj: Any, operation: str) -> dict[str, Any] | None:
+    """Build the JSON-safe payload of an object's event.
+
+    Args:
+        obj (Any): instance of a tracked model.
+        operation (str): "insert", "update" or "delete".
+
+    Returns:
+        dict[str, Any] | None: the object's as_dict for inserts, its changed
+                               columns for updates and None for deletes.
+    """
+    if operation == "delete":
+        return None
+    if operation == "insert":
+        values = obj.as_dict()
+    else:
+        state = sa.inspect(obj)
+        mapper = state.mapper
+        version = mapper.get_property_by_column(mapper.version_id_col).key \
+            if mapper.version_id_col is not None else None
+        values = {"id": obj.id}
+        values.update((column.key, getattr(obj, column.key))
+                      for column in obj.as_dict_columns()
+                      if state.attrs[column.key].history.added
+                      or column.key == version)
+    return {key: _json_safe(value) for key, value in values.items()}
+
+
+def _is_relevant_update(obj: Any) -> bool:
+    """Check whether a dirty object has changes worth an event.
+
+    Args:
+        obj (Any): instance of a tracked model.
+
+    Returns:
+        bool: True if an attribute other than the ignored ones changed.
+    """
+    ignored = _IGNORED_ATTRIBUTES.get(type(obj), set())
+    state = sa.inspect(obj)
+    return any(attr.history.has_changes() for attr in state.attrs
+               if attr.key not in ignored)
+
+
+def _serialize_writers(session: orm.Session) -> None:
+    """Wait until no other transaction can write outbox events.
+    The lock is held until the end of the transaction, so event IDs are
+    assigned in commit order.
+
+    Args:
+        session (orm.Session): session about to write outbox events.
+    """
+    if session.info.get("outbox_locked"):
+        return
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(sa.select(
+            sa.func.pg_advisory_xact_lock(_OUTBOX_LOCK_KEY)))
+    session.info["outbox_locked"] = True
+
+
+@sa.event.listens_for(orm.Session, "after_flush")
+def _record_changes(session: orm.Session, _flush_context: Any) -> None:
+    """Write outbox events for the changes of a flush."""
+    now = datetime.now(timezone.utc)
+    events = []
+    for operation, objects in (("insert", session.new),
+                               ("update", session.dirty),
+                               ("delete", session.deleted)):
+        for obj in objects:
+            entity = ENTITIES.get(type(obj))
+            if entity is None:
+                continue
+            if operation == "update" and not _is_relevant_update(obj):
+                continue
+            events.append({
+                "entity": entity,
+                "entity_id": obj.id,
+                "operation": operation,
+                "created_at": now,
+                "payload": _payload(obj, operation),
+            })
+
+    if events:
+        _serialize_writers(session)
+        session.connection().execute(sa.insert(OutboxEvent.__table__),
+                                     events)
+        session.info["outbox_pending"] = True
+
+
+@sa.event.listens_for(orm.Session, "after_commit")
+def _notify_consumers(session: orm.Session) -> None:
+    """Wake up consumers waiting for new events."""
+    session.info.pop("outbox_locked", None)
+    if session.info.pop("outbox_pending", False):
+        with _new_events:
+            _new_events.notify_all()
+
+
+@sa.event.listens_for(orm.Session, "after_rollback")
+def _discard_pending(session: orm.Session) -> None:
+    """Forget about events that were rolled back."""
+    session.info.pop("outbox_locked", None)
+    session.info.pop("outbox_pending", None)
+
+
+def wait_for_events(timeout: float) -> None:
+    """Block until events are committed in this process, or a timeout.
+
+    Args:
+        timeout (float): maximum number of seconds to wait.
+    """
+    with _new_events:
+        _new_events.wait(timeout)
+
+
+def events_since(session: orm.Session, cursor: int,
+                 limit: int) -> list[OutboxEventDict]:
+    """Fetch the events after a cursor, oldest first.
+    Events with IDs up to the cursor are never returned; as IDs are assigned
+    in commit order, none can appear below the cursor later.
+
+    Args:
+        session (orm.Session): session to query with.
+        cursor (int): ID of the last event the consumer has seen.
+        limit (int): maximum number of events to return.
+
+    Returns:
+        list[OutboxEventDict]: the events.
+    """
+    rows = session.execute(
+        sa.select(*OutboxEvent.as_dict_columns())
+        .where(OutboxEvent.id > cursor)
+        .order_by(OutboxEvent.id)
+        .limit(limit))
+    return rows_as_dicts(rows)
+
+
+def prune_events(session: orm.Session, max_age: timedelta) -> int:
+    """Delete events older than a maximum age.
+
+    Args:
+        session (orm.Session): session to delete with; not committed.
+        max_age (timedelta): age of the oldest event to keep.
+
+    Returns:
+        int: number of deleted events.
+    """
+    result = session.execute(
+        sa.delete(OutboxEvent)
+        .where(OutboxEvent.created_at < datetime.now(timezone.utc) - max_age))
+    return result.rowcount
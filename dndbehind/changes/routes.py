@@ -0,0 +1,113 @@
+"""Routes of the change feed."""
+import time
+from typing import Iterator
+
+from flask import current_app, jsonify, request, Response
+
+from . import bp
+from .broker import sse_message
+from .outbox import events_since, wait_for_events
+from .. import db, models
+from ..auth.rbac import CHARACTER_READ_ROLES, owner_or_role_required, \
+    role_required
+
+
+@bp.route("/changes", methods=["GET"])
+@role_required("operator", "admin")
+def list_changes() -> Response:
+    """Return the changes after a cursor, waiting for new ones if asked to.
+
+    Query parameters:
+        since: ID of the last change the consumer has seen (default 0).
+        limit: maximum number of changes to return (default
+               CHANGES_BATCH_SIZE, at most CHANGES_MAX_BATCH_SIZE).
+        wait: seconds to wait for changes when there are none yet (default
+              0, at most CHANGES_MAX_WAIT).
+
+    Returns:
+        Response: JSON document with the changes, oldest first, and the
+                  cursor to pass as "since" in the next request. "more" is
+                  true when further changes are immediately available.
+    """
+    config = current_app.config
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", config["CHANGES_BATCH_SIZE"]))
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        return jsonify(msg="since, limit and wait must be numbers."), 400
+    if since < 0 or limit < 1 or wait < 0:
+        return jsonify(msg="since, limit and wait must be positive."), 400
+
+    limit = min(limit, config["CHANGES_MAX_BATCH_SIZE"])
+    deadline = time.monotonic() + min(wait, config["CHANGES_MAX_WAIT"])
+
+    changes = events_since(db.session, since, limit)
+    while not changes and time.monotonic() < deadline:
+        # Don't hold a connection (or a snapshot) while waiting
+        db.session.rollback()
+        wait_for_events(min(config["CHANGES_POLL_INTERVAL"],
+                            deadline - time.monotonic()))
+        changes = events_since(db.session, since, limit)
+
+    return jsonify(changes=changes,
+                   cursor=changes[-1]["id"] if changes else since,
+                   more=len(changes) == limit)
+
+
+@bp.route("/character/<int:character_id>/events", methods=["GET"])
+@owner_or_role_required(models.Character, "character_id",
+                        *CHARACTER_READ_ROLES)
+def character_events(character_id: int) -> Response:
+    """Stream the state of a character as Server-Sent Events.
+    The current state is sent first as a "character" event, followed by a
+    "character" event with the changed fields for every change and a
+    "delete" event if the character is deleted. Comment lines are sent as
+    heartbeats.
+
+    Every connection occupies a worker thread; serve large numbers of
+    subscribers through the ASGI app with ASYNC_VIEWS enabled.
+
+    Args:
+        character_id (int): ID of the character to subscribe to.
+
+    Returns:
+        Response: the event stream, or 503 if there are too many
+                  subscribers.
+    """
+    live_changes = current_app.extensions["live_changes"]
+    try:
+        # Subscribe first, so no change after the snapshot is missed
+        subscription = live_changes.subscribe(f"character:{character_id}")
+    except OverflowError:
+        return jsonify(msg="Too many subscribers, try again later."), 503
+
+    snapshot = db.session.get(models.Character, character_id).as_dict()
+    # The stream outlives the request; don't hold on to a connection
+    db.session.close()
+
+    dumps = current_app.json.dumps
+    heartbeat = current_app.config["CHANGES_HEARTBEAT"]
+
+    def stream() -> Iterator[str]:
+        """Generate the events until the client disconnects."""
+        try:
+            yield "retry: 3000\n\n"
+            yield sse_message("character", dumps(snapshot))
+            while True:
+                events = subscription.wait(heartbeat)
+                if not events:
+                    yield ": heartbeat\n\n"
+                for event in events:
+                    if event["operation"] == "delete":
+                        yield sse_message("delete", dumps(event["entity_id"]),
+                                          event["id"])
+                        return
+                    yield sse_message("character", dumps(event["payload"]),
+                                      event["id"])
+        finally:
+            live_changes.unsubscribe(subscription)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
@@ -0,0 +1,288 @@
+"""Compressed storage of large text columns.
+
+CompressedText columns store text compressed with zstd (requires
+`zstandard`) or, without it, zlib. Values shorter than
+TEXT_COMPRESSION_MIN_SIZE bytes, values that don't compress, and values
+written before a column was converted are stored as plain UTF-8, so plain
+and compressed values can be mixed freely. Compressed values start with a
+0xFF byte, which never occurs in UTF-8, followed by a codec byte.
+
+Compressed values are loaded as LazyText, a string-like object that is
+decompressed on first use, e.g. when it's serialized to JSON. Rows loaded
+for access checks or stat updates never pay for decompression.
+
+A zstd dictionary trained on existing texts (`flask text-dictionary train`)
+improves the ratio of short, similar texts considerably. Every dictionary
+that was used for writing must stay listed in TEXT_COMPRESSION_DICTIONARIES
+to read the values written with it; the first one is used for new values.
+"""
+import importlib
+import importlib.util
+import threading
+import zlib
+from collections import UserString
+from typing import Any, Sequence
+
+import click
+import sqlalchemy as sa
+from flask import Flask
+
+MAGIC = b"\xff"
+ZSTD = b"z"
+ZLIB = b"g"
+
+
+class TextCodec:
+    """Compresses and decompresses the values of CompressedText columns."""
+
+    def __init__(self) -> None:
+        """Initialize a codec with the default settings."""
+        self.configure()
+
+    def configure(self, codec: str = "auto", level: int = 3,
+                  min_size: int = 256,
+                  dictionaries: Sequence[bytes] = ()) -> None:
+        """Change the settings used for new values.
+
+        Args:
+            codec (str, optional): "zstd", "zlib", "none", or "auto" for zstd
+                                   if installed and zlib otherwise. Defaults
+                                   to "auto".
+            level (int, optional): compression level. Defaults to 3.
+            min_size (int, optional): size in bytes below which values are
+                                      stored uncompressed. Defaults to 256.
+            dictionaries (Sequence[bytes], optional): trained zstd
+                                                      dictionaries; the
+                                                      first is used for
+                                                      writing. Defaults to
+                                                      ().
+
+        Raises:
+            ValueError: raised when the codec is unknown, or dictionaries are
+                        given for another codec than zstd.
+        """
+        if codec == "auto":
+            codec = "zstd" if importlib.util.find_spec("zstandard") \
+                else "zlib"
+        if codec not in ("zstd", "zlib", "none"):
+            raise ValueError(f"Unknown text compression codec {codec!r}")
+        if dictionaries and codec != "zstd":
+            raise ValueError("Compression dictionaries require zstd")
+
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+        self._dictionaries: dict[int, Any] = {}
+        self._write_dictionary = None
+        if dictionaries:
+            zstandard = importlib.import_module("zstandard")
+            for data in dictionaries:
+                dictionary = zstandard.ZstdCompressionDict(data)
+                self._dictionaries[dictionary.dict_id()] = dictionary
+            self._write_dictionary = zstandard.ZstdCompressionDict(
+                dictionaries[0])
+        # zstandard (de)compressors aren't thread safe; keep one per thread
+        self._local = threading.local()
+
+    def _zstd_compressor(self) -> Any:
+        """Return this thread's zstd compressor."""
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            zstandard = importlib.import_module("zstandard")
+            compressor = self._local.compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._write_dictionary)
+        return compressor
+
+    def _zstd_decompress(self, frame: bytes) -> bytes:
+        """Decompress a zstd frame, with the dictionary it was written with.
+
+        Args:
+            frame (bytes): the zstd frame.
+
+        Raises:
+            LookupError: raised when the frame needs an unknown dictionary.
+
+        Returns:
+            bytes: the decompressed data.
+        """
+        zstandard = importlib.import_module("zstandard")
+        dict_id = zstandard.get_frame_parameters(frame).dict_id
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            dictionary = None
+            if dict_id:
+                dictionary = self._dictionaries.get(dict_id)
+                if dictionary is None:
+                    raise LookupError(
+                        f"Unknown compression dictionary {dict_id}")
+            decompressor = decompressors[dict_id] = \
+                zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor.decompress(frame)
+
+    def compress(self, text: str) -> bytes:
+        """Encode a text for storage.
+
+        Args:
+            text (str): the text.
+
+        Returns:
+            bytes: the compressed value, or the UTF-8 encoded text if it's
+                   short or doesn't compress.
+        """
+        data = text.encode("utf-8")
+        if self.codec == "none" or len(data) < self.min_size:
+            return data
+        if self.codec == "zstd":
+            compressed = MAGIC + ZSTD + self._zstd_compressor().compress(data)
+        else:
+            compressed = MAGIC + ZLIB + zlib.compress(data, self.level)
+        return compressed if len(compressed) < len(data) else data
+
+    def decompress(self, value: bytes) -> str:
+        """Decode a stored value.
+
+        Args:
+            value (bytes): the stored value.
+
+        Raises:
+            ValueError: raised when the value has an unknown codec.
+
+        Returns:
+            str: the text.
+        """
+        if not value.startswith(MAGIC):
+            return value.decode("utf-8")
+        codec, payload = value[1:2], value[2:]
+        if codec == ZSTD:
+            return self._zstd_decompress(payload).decode("utf-8")
+        if codec == ZLIB:
+            return zlib.decompress(payload).decode("utf-8")
+        raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+codec = TextCodec()
+
+
+class LazyText(UserString):
+    """Text that is decompressed on first use."""
+
+    def __init__(self, seq: object) -> None:
+        """Wrap a compressed value, or a text.
+
+        Args:
+            seq (object): a value compressed by the codec, or any object to
+                          convert to text.
+        """
+        if isinstance(seq, bytes):
+            self.compressed: bytes | None = seq
+            self._data = None
+        else:
+            self.compressed = None
+            self._data = str(seq)
+
+    @property
+    def data(self) -> str:
+        """The text, decompressed on first access."""
+        if self._data is None:
+            self._data = codec.decompress(self.compressed)
+        return self._data
+
+    @data.setter
+    def data(self, value: str) -> None:
+        """Replace the text."""
+        self.compressed = None
+        self._data = value
+
+
+class CompressedText(sa.TypeDecorator):
+    """Text column stored compressed, loaded as LazyText."""
+    impl = sa.LargeBinary
+    cache_ok = True
+
+    @property
+    def python_type(self) -> type:
+        """Values are texts."""
+        return str
+
+    def process_bind_param(self, value: Any, dialect: sa.Dialect) -> Any:
+        """Compress a value for storage."""
+        if value is None:
+            return None
+        if isinstance(value, LazyText) and value.compressed is not None:
+            # Unchanged since it was loaded, e.g. when copying a row
+            return value.compressed
+        return codec.compress(str(value))
+
+    def process_result_value(self, value: Any, dialect: sa.Dialect) -> Any:
+        """Wrap a stored value for lazy decompression."""
+        if value is None or isinstance(value, str):
+            # SQLite keeps the text of rows written before the conversion
+            return value
+        value = bytes(value)
+        if not value.startswith(MAGIC):
+            return value.decode("utf-8")
+        return LazyText(value)
+
+
+@click.group("text-dictionary")
+def text_dictionary_cli() -> None:
+    """Manage zstd dictionaries for compressed text columns."""
+
+
+@text_dictionary_cli.command("train")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--size", default=112_640, show_default=True,
+              help="Dictionary size in bytes.")
+@click.option("--samples", default=10_000, show_default=True,
+              help="Maximum number of texts per column to train on.")
+def train_dictionary(output: str, size: int, samples: int) -> None:
+    """Train a dictionary on the stored texts and write it to OUTPUT."""
+    zstandard = importlib.import_module("zstandard")
+    from . import db
+    from .models import Background, Character
+
+    texts = []
+    for column in (Character.description, Character.backstory,
+                   Background.description):
+        texts += [str(text).encode("utf-8") for text in db.session.scalars(
+            sa.select(column).where(column.is_not(None))
+            .order_by(sa.func.random()).limit(samples))]
+    dictionary = zstandard.train_dictionary(size, texts)
+    with open(output, "wb") as f:
+        f.write(dictionary.as_bytes())
+    click.echo(f"Trained dictionary {dictionary.dict_id()} on "
+               f"{len(texts)} texts; add {output} to "
+               "TEXT_COMPRESSION_DICTIONARIES to use it.")
+
+
+class TextCompression:
+    """Flask extension configuring the codec of compressed text columns."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Configure the codec from the application's configuration.
+        The codec is shared by all applications in the process.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        dictionaries = []
+        for path in app.config["TEXT_COMPRESSION_DICTIONARIES"]:
+            with open(path, "rb") as f:
+                dictionaries.append(f.read())
+        codec.configure(app.config["TEXT_COMPRESSION"],
+                        app.config["TEXT_COMPRESSION_LEVEL"],
+                        app.config["TEXT_COMPRESSION_MIN_SIZE"],
+                        dictionaries)
+        app.cli.add_command(text_dictionary_cli)
+        app.extensions["text_compression"] = self
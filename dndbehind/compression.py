@@ -0,0 +1,193 @@
+"""Response compression for the DnD Behind API.
+
+Responses above a size threshold are compressed with the best encoding both
+the client and the server support: zstd (requires `zstandard`), brotli
+(requires `brotli`) or gzip. Compressed bodies of GET responses are kept in
+a bounded LRU cache keyed by a digest of the uncompressed body, so unchanged
+resources such as the background catalog are only compressed once.
+"""
+import gzip
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from flask import Flask, Response, current_app, request
+
+# Compressible mimetypes; everything else is sent as-is.
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "text/plain",
+    "text/html",
+    "text/css",
+    "text/csv",
+}
+
+
+def _zstd_compressor() -> Callable[[bytes], bytes]:
+    """Build a zstd compression function.
+
+    Returns:
+        Callable[[bytes], bytes]: compression function.
+    """
+    zstandard = importlib.import_module("zstandard")
+    # ZstdCompressor objects are not thread safe, so create one per call
+    return lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _brotli_compressor() -> Callable[[bytes], bytes]:
+    """Build a brotli compression function.
+
+    Returns:
+        Callable[[bytes], bytes]: compression function.
+    """
+    brotli = importlib.import_module("brotli")
+    return lambda data: brotli.compress(data, quality=5)
+
+
+def _gzip_compressor() -> Callable[[bytes], bytes]:
+    """Build a gzip compression function.
+
+    Returns:
+        Callable[[bytes], bytes]: compression function.
+    """
+    return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+
+
+# Supported encodings, in order of server preference.
+_COMPRESSORS = {
+    "zstd": _zstd_compressor,
+    "br": _brotli_compressor,
+    "gzip": _gzip_compressor,
+}
+
+
+class CompressedCache:
+    """Thread safe LRU cache of compressed bodies, bounded by total size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        """Initialize an empty cache.
+
+        Args:
+            max_bytes (int): maximum total size of the cached bodies.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[tuple[bytes, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes, encoding: str) -> bytes | None:
+        """Look up a compressed body.
+
+        Args:
+            digest (bytes): digest of the uncompressed body.
+            encoding (str): content encoding.
+
+        Returns:
+            bytes | None: the compressed body, or None if not cached.
+        """
+        with self._lock:
+            body = self._entries.get((digest, encoding))
+            if body is not None:
+                self._entries.move_to_end((digest, encoding))
+            return body
+
+    def put(self, digest: bytes, encoding: str, body: bytes) -> None:
+        """Store a compressed body, evicting least recently used bodies.
+
+        Args:
+            digest (bytes): digest of the uncompressed body.
+            encoding (str): content encoding.
+            body (bytes): the compressed body.
+        """
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if (digest, encoding) in self._entries:
+                return
+            self._entries[(digest, encoding)] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        """Remove all cached bodies."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class Compress:
+    """Flask extension compressing responses based on Accept-Encoding."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        self.compressors: dict[str, Callable[[bytes], bytes]] = {}
+        for encoding, factory in _COMPRESSORS.items():
+            try:
+                self.compressors[encoding] = factory()
+            except ImportError:
+                continue
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the compression hook on the application.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        app.extensions["compress"] = \
+            CompressedCache(app.config["COMPRESSION_CACHE_SIZE"])
+
+        if app.config["COMPRESSION_ENABLED"]:
+            app.after_request(self.compress_response)
+
+    def compress_response(self, response: Response) -> Response:
+        """Compress the response body if the client accepts it.
+
+        Args:
+            response (Response): the response to compress.
+
+        Returns:
+            Response: the (possibly) compressed response.
+        """
+        if response.direct_passthrough or response.is_streamed \
+                or "Content-Encoding" in response.headers \
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES \
+                or not 200 <= response.status_code < 300:
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        encoding = request.accept_encodings.best_match(self.compressors)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < current_app.config["COMPRESSION_MIN_SIZE"]:
+            return response
+
+        # Only reads are worth caching; writes produce unique bodies.
+        if request.method in ("GET", "HEAD"):
+            cache = current_app.extensions["compress"]
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            body = cache.get(digest, encoding)
+            if body is None:
+                body = self.compressors[encoding](data)
+                cache.put(digest, encoding, body)
+        else:
+            body = self.compressors[encoding](data)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,106 @@
+"""Batched, per-request loading of related objects.
+
+A DataLoader collects the keys of all objects needed at once and loads them
+with a single query, instead of one query per object. Loaded objects are
+cached for the rest of the request, so every key is loaded at most once,
+however many times it is requested.
+"""
+from typing import Any, Callable, Generic, Hashable, Iterable, Mapping, \
+    TypeVar
+
+import sqlalchemy as sa
+from flask import g
+
+from . import db
+from .models import Background, User
+from .serialization import rows_as_dicts
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """Deduplicating, caching batch loader."""
+
+    def __init__(self, batch_load: Callable[[list[K]], Mapping[K, V]]) -> None:
+        """Initialize a loader with an empty cache.
+
+        Args:
+            batch_load (Callable[[list[K]], Mapping[K, V]]): function loading
+                the objects of a list of distinct keys; missing keys may be
+                left out of the result.
+        """
+        self.batch_load = batch_load
+        self.batches = 0
+        self._cache: dict[K, V | None] = {}
+
+    def load_many(self, keys: Iterable[K]) -> dict[K, V | None]:
+        """Load the objects of several keys, with at most one batch.
+
+        Args:
+            keys (Iterable[K]): the keys, which may contain duplicates.
+
+        Returns:
+            dict[K, V | None]: the object of every key, or None for keys
+                               without one.
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self._cache]
+        if missing:
+            found = self.batch_load(missing)
+            self.batches += 1
+            for key in missing:
+                self._cache[key] = found.get(key)
+        return {key: self._cache[key] for key in keys}
+
+    def load(self, key: K) -> V | None:
+        """Load the object of a single key.
+
+        Args:
+            key (K): the key.
+
+        Returns:
+            V | None: the object, or None if there is none.
+        """
+        return self.load_many([key])[key]
+
+
+def _load_by_id(model: Any) -> Callable[[list[int]], dict[int, Any]]:
+    """Build a batch load function selecting a model's as_dict columns.
+
+    Args:
+        model (Any): model class with as_dict_columns.
+
+    Returns:
+        Callable[[list[int]], dict[int, Any]]: function loading the
+                                               dictionaries of a list of
+                                               IDs with one IN query.
+    """
+    def batch_load(ids: list[int]) -> dict[int, Any]:
+        """Load the dictionaries of the objects with the given IDs."""
+        rows = db.session.execute(sa.select(*model.as_dict_columns())
+                                  .where(model.id.in_(ids)))
+        return {row["id"]: row for row in rows_as_dicts(rows)}
+    return batch_load
+
+
+# Batch load functions, by loader name
+BATCH_LOADERS = {
+    "user": _load_by_id(User),
+    "background": _load_by_id(Background),
+}
+
+
+def get_loader(name: str) -> DataLoader:
+    """Return the loader of the current request, creating it on first use.
+
+    Args:
+        name (str): name of the loader, a key of BATCH_LOADERS.
+
+    Returns:
+        DataLoader: the loader.
+    """
+    loaders = g.setdefault("dataloaders", {})
+    if name not in loaders:
+        loaders[name] = DataLoader(BATCH_LOADERS[name])
+    return loaders[name]
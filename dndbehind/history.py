@@ -0,0 +1,363 @@
+"""Version history of characters, stored as snapshots and deltas.
+
+Every version of a character gets a CharacterHistory row, written in the
+same transaction as the change itself. Version 1, and every
+SNAPSHOT_INTERVAL-th version after it, is a full snapshot of the editable
+fields. The versions in between are deltas onto the previous version: the
+new values of changed columns, and for the large text columns a diff by
+sentence, so fixing a typo in a long backstory doesn't copy the whole text.
+The data of every row is stored compressed, like the texts themselves.
+
+A version is reconstructed from the latest snapshot at or before it, plus at
+most SNAPSHOT_INTERVAL - 1 deltas, all read with a single query.
+compact_history (`flask history compact`) removes old versions, turning the
+oldest kept version into a snapshot.
+
+Like the outbox, changes made with bulk Core statements bypass the session
+and are not recorded; versions without a snapshot to start from can't be
+reconstructed.
+"""
+import difflib
+import re
+from collections import UserString
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import click
+import msgspec
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+
+from .models import Character, CharacterHistory, CharacterHistoryDict
+from .serialization import rows_as_dicts
+
+# A full snapshot is stored every SNAPSHOT_INTERVAL versions, which bounds
+# the number of deltas applied to reconstruct a version
+SNAPSHOT_INTERVAL = 20
+
+# Fields recorded in the history, and restored from it
+FIELDS = ("name", "description", "backstory", "strength", "dexterity",
+          "constitution", "intelligence", "wisdom", "charisma",
+          "background_id")
+# Fields stored as diffs in deltas
+TEXT_FIELDS = ("description", "backstory")
+
+# Texts are diffed by sentence (or line), keeping the separators
+_SENTENCE_END = re.compile(r"(?<=[.!?\n])")
+
+
+def _chunks(text: str) -> list[str]:
+    """Split a text into the sentences and lines it is diffed by."""
+    return [chunk for chunk in _SENTENCE_END.split(text) if chunk]
+
+
+def text_diff(old: str, new: str) -> list[list] | str:
+    """Compute the changes from one text to another.
+
+    Args:
+        old (str): the previous text.
+        new (str): the new text.
+
+    Returns:
+        list[list] | str: [start, end, replacement] operations replacing
+                          chunks of the old text, or the new text itself if
+                          that's smaller.
+    """
+    old_chunks, new_chunks = _chunks(old), _chunks(new)
+    matcher = difflib.SequenceMatcher(None, old_chunks, new_chunks)
+    operations = [[i1, i2, "".join(new_chunks[j1:j2])]
+                  for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                  if tag != "equal"]
+    size = sum(len(replacement) + 16 for _, _, replacement in operations)
+    return operations if size < len(new) else new
+
+
+def apply_text_diff(old: str, operations: list[list]) -> str:
+    """Apply the result of text_diff to the old text.
+
+    Args:
+        old (str): the previous text.
+        operations (list[list]): the operations.
+
+    Returns:
+        str: the new text.
+    """
+    chunks = _chunks(old)
+    # From the end, so the start and end of earlier operations stay valid
+    for start, end, replacement in reversed(operations):
+        chunks[start:end] = [replacement]
+    return "".join(chunks)
+
+
+def dump(data: dict[str, Any]) -> str:
+    """Serialize a snapshot or delta for the data column.
+
+    Args:
+        data (dict[str, Any]): the snapshot or delta.
+
+    Returns:
+        str: JSON document.
+    """
+    return msgspec.json.encode(data).decode("utf-8")
+
+
+def _value(value: Any) -> Any:
+    """Convert lazily decompressed texts to str."""
+    return str(value) if isinstance(value, UserString) else value
+
+
+def _snapshot(character: Character) -> dict[str, Any]:
+    """Return the recorded fields of a character."""
+    return {field: _value(getattr(character, field)) for field in FIELDS}
+
+
+def _delta(character: Character,
+           previous: dict[str, Any]) -> dict[str, Any]:
+    """Return the changes of a character's flushed update.
+
+    Args:
+        character (Character): the updated character.
+        previous (dict[str, Any]): values of text fields that were changed
+                                   without being loaded first.
+
+    Returns:
+        dict[str, Any]: the new values of the changed fields, as diffs for
+                        text fields.
+    """
+    state = sa.inspect(character)
+    delta = {}
+    for field in FIELDS:
+        history = state.attrs[field].history
+        if not history.added:
+            continue
+        new = _value(history.added[0])
+        if field not in TEXT_FIELDS:
+            delta[field] = new
+            continue
+        old = _value(history.deleted[0]) if history.deleted \
+            else previous.get(field)
+        if old == new:
+            continue
+        delta[field] = new if old is None or new is None \
+            else text_diff(old, new)
+    return delta
+
+
+@sa.event.listens_for(orm.Session, "before_flush")
+def _load_previous_texts(session: orm.Session, _flush_context: Any,
+                         _instances: Any) -> None:
+    """Read the old values of texts that are replaced without being loaded,
+    as PATCH does, while the row still holds them."""
+    replaced = {}
+    for obj in session.dirty:
+        if not isinstance(obj, Character):
+            continue
+        state = sa.inspect(obj)
+        fields = [field for field in TEXT_FIELDS
+                  if state.attrs[field].history.added
+                  and not state.attrs[field].history.deleted]
+        if fields:
+            replaced[obj.id] = fields
+
+    previous: dict[int, dict[str, Any]] = {}
+    if replaced:
+        rows = session.execute(
+            sa.select(Character.id, *(getattr(Character, field)
+                                      for field in TEXT_FIELDS))
+            .where(Character.id.in_(replaced)))
+        for row in rows_as_dicts(rows):
+            previous[row["id"]] = {field: _value(row[field])
+                                   for field in replaced[row["id"]]}
+    session.info["history_previous"] = previous
+
+
+@sa.event.listens_for(orm.Session, "after_flush")
+def _record_versions(session: orm.Session, _flush_context: Any) -> None:
+    """Write history entries for the characters inserted or updated by a
+    flush."""
+    previous = session.info.pop("history_previous", {})
+    now = datetime.now(timezone.utc)
+    entries = []
+    for obj in session.new:
+        if isinstance(obj, Character):
+            entries.append({
+                "character_id": obj.id, "version": obj.version,
+                "created_at": now, "snapshot": True, "changed": list(FIELDS),
+                "data": dump(_snapshot(obj))})
+    for obj in session.dirty:
+        if not isinstance(obj, Character) \
+                or not session.is_modified(obj, include_collections=False):
+            continue
+        delta = _delta(obj, previous.get(obj.id, {}))
+        snapshot = obj.version % SNAPSHOT_INTERVAL == 1
+        entries.append({
+            "character_id": obj.id, "version": obj.version,
+            "created_at": now, "snapshot": snapshot,
+            "changed": list(delta),
+            "data": dump(_snapshot(obj) if snapshot else delta)})
+
+    if entries:
+        session.connection().execute(sa.insert(CharacterHistory.__table__),
+                                     entries)
+
+
+def _replay(rows: list[dict[str, Any]]) -> dict[str, Any] | None:
+    """Reconstruct the state after a snapshot and the deltas following it.
+
+    Args:
+        rows (list[dict[str, Any]]): history entries with "snapshot" and
+                                     "data", starting with a snapshot.
+
+    Returns:
+        dict[str, Any] | None: the state, or None if the first entry isn't
+                               a snapshot.
+    """
+    if not rows or not rows[0]["snapshot"]:
+        return None
+    state = msgspec.json.decode(str(rows[0]["data"]))
+    for row in rows[1:]:
+        for field, value in msgspec.json.decode(str(row["data"])).items():
+            if field in TEXT_FIELDS and isinstance(value, list):
+                value = apply_text_diff(state[field] or "", value)
+            state[field] = value
+    return state
+
+
+def version_at(session: orm.Session, character_id: int,
+               version: int) -> dict[str, Any] | None:
+    """Reconstruct a version of a character.
+
+    Args:
+        session (orm.Session): session to query with.
+        character_id (int): ID of the character.
+        version (int): the version.
+
+    Returns:
+        dict[str, Any] | None: the recorded fields of the character at that
+                               version, or None if the version isn't in the
+                               history.
+    """
+    base = sa.select(sa.func.max(CharacterHistory.version)).where(
+        CharacterHistory.character_id == character_id,
+        CharacterHistory.snapshot.is_(True),
+        CharacterHistory.version <= version).scalar_subquery()
+    rows = rows_as_dicts(session.execute(
+        sa.select(CharacterHistory.version, CharacterHistory.snapshot,
+                  CharacterHistory.data)
+        .where(CharacterHistory.character_id == character_id,
+               CharacterHistory.version >= base,
+               CharacterHistory.version <= version)
+        .order_by(CharacterHistory.version)))
+    if not rows or rows[-1]["version"] != version \
+            or len(rows) != version - rows[0]["version"] + 1:
+        return None
+    return _replay(rows)
+
+
+def list_versions(session: orm.Session, character_id: int,
+                  before: int | None,
+                  limit: int) -> list[CharacterHistoryDict]:
+    """List the recorded versions of a character, newest first.
+
+    Args:
+        session (orm.Session): session to query with.
+        character_id (int): ID of the character.
+        before (int | None): only list versions before this one.
+        limit (int): maximum number of versions to return.
+
+    Returns:
+        list[CharacterHistoryDict]: the versions, with their creation time
+                                    and the fields they changed.
+    """
+    query = sa.select(*CharacterHistory.as_dict_columns()).where(
+        CharacterHistory.character_id == character_id)
+    if before is not None:
+        query = query.where(CharacterHistory.version < before)
+    return rows_as_dicts(session.execute(
+        query.order_by(CharacterHistory.version.desc()).limit(limit)))
+
+
+def compact_history(session: orm.Session, keep_versions: int,
+                    max_age: timedelta | None) -> int:
+    """Delete old versions of all characters.
+    A version is deleted when it's older than max_age and not one of the
+    keep_versions latest versions of its character. The oldest kept version
+    becomes a snapshot, so all kept versions can still be reconstructed.
+
+    Args:
+        session (orm.Session): session to delete with; not committed.
+        keep_versions (int): number of latest versions to always keep; at
+                             least 1.
+        max_age (timedelta | None): age up to which all versions are kept,
+                                    or None to only keep keep_versions.
+
+    Returns:
+        int: number of deleted versions.
+    """
+    keep_versions = max(keep_versions, 1)
+    cutoff = datetime.now(timezone.utc) - max_age if max_age else None
+    history = CharacterHistory
+    character_ids = session.scalars(
+        sa.select(history.character_id)
+        .group_by(history.character_id)
+        .having(sa.func.count() > keep_versions)).all()
+
+    deleted = 0
+    for character_id in character_ids:
+        of_character = history.character_id == character_id
+        keep_from = session.scalar(
+            sa.select(history.version).where(of_character)
+            .order_by(history.version.desc())
+            .offset(keep_versions - 1).limit(1))
+        if cutoff is not None:
+            recent = session.scalar(
+                sa.select(sa.func.min(history.version))
+                .where(of_character, history.created_at >= cutoff))
+            if recent is not None:
+                keep_from = min(keep_from, recent)
+
+        oldest = session.execute(
+            sa.select(history.id, history.snapshot)
+            .where(of_character, history.version == keep_from)).one()
+        if not oldest.snapshot:
+            state = version_at(session, character_id, keep_from)
+            if state is None:
+                # No snapshot to start from: nothing can be reconstructed
+                # anyway
+                continue
+            session.execute(
+                sa.update(history).where(history.id == oldest.id)
+                .values(snapshot=True, data=dump(state)))
+        deleted += session.execute(
+            sa.delete(history)
+            .where(of_character, history.version < keep_from)).rowcount
+    return deleted
+
+
+@click.group("history")
+def history_cli() -> None:
+    """Manage the version history of characters."""
+
+
+@history_cli.command("compact")
+@click.option("--keep-versions", type=int, default=None,
+              help="Versions to keep per character [default: "
+                   "HISTORY_KEEP_VERSIONS].")
+@click.option("--max-age-days", type=float, default=None,
+              help="Keep all versions up to this age [default: "
+                   "HISTORY_MAX_AGE_DAYS].")
+def compact(keep_versions: int | None, max_age_days: float | None) -> None:
+    """Delete old character versions."""
+    from flask import current_app
+    from . import db
+
+    config = current_app.config
+    if keep_versions is None:
+        keep_versions = config["HISTORY_KEEP_VERSIONS"]
+    if max_age_days is None:
+        max_age_days = config["HISTORY_MAX_AGE_DAYS"]
+    deleted = compact_history(
+        db.session, keep_versions,
+        timedelta(days=max_age_days) if max_age_days else None)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} character versions.")
@@ -0,0 +1,365 @@
+"""Idempotency keys for POST requests.
+
+A client that doesn't know whether its POST succeeded (a timeout, a dropped
+connection) can only retry safely if the server recognizes the retry. Views
+decorated with idempotent accept an Idempotency-Key header: the first request
+with a key runs the view and stores its response for IDEMPOTENCY_TTL seconds,
+and retries with the same key get the stored response back, marked with
+Idempotent-Replayed, without running the view again, so a retried signup
+neither fails with 409 nor costs another password hash.
+
+Keys are scoped to the caller's identity, method and path. A stored request
+fingerprint, the digest of the body, detects a key reused for a different
+request (422). A retry arriving while the first request still runs gets 409.
+Server errors (5xx) and exceptions are not stored, so they can be retried.
+A claim is leased for IDEMPOTENCY_LEASE seconds: if the worker running the
+first request dies before storing its response, the next retry after the
+lease has expired takes the key over and runs the view.
+
+Responses are stored according to IDEMPOTENCY_STORE:
+
+- "database": the idempotency_key table, shared by all workers. Claiming a
+  key commits, before the view runs. `flask idempotency purge` deletes
+  expired keys.
+- "memory": a bounded dictionary per worker process, for single-process
+  deployments and development.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Callable, TypedDict
+
+import click
+from flask import Flask, Response, current_app, jsonify, make_response, \
+    request
+from flask_jwt_extended import get_jwt_identity
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .metrics import IDEMPOTENT_REQUESTS
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Headers of stored responses that are recomputed for every response
+_UNSTORED_HEADERS = {"content-length", "server-timing"}
+
+
+class StoredResponse(TypedDict):
+    """Response stored for an idempotency key."""
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+
+
+# The request fingerprint stored with a key, and its response; None while
+# the first request is running
+Claimed = tuple[str, StoredResponse | None]
+
+
+class MemoryStore:
+    """Idempotency keys in a bounded dictionary of this process."""
+
+    def __init__(self, max_keys: int) -> None:
+        """Initialize an empty store.
+
+        Args:
+            max_keys (int): number of keys above which the oldest are
+                            forgotten.
+        """
+        self.max_keys = max_keys
+        # Key -> [expiry time, fingerprint, response, lease expiry time], in
+        # insertion and so, with a constant TTL, expiry order
+        self._entries: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, fingerprint: str, ttl: float,
+              lease: float) -> Claimed | None:
+        """Claim a key for a new request, unless it's already known.
+
+        Args:
+            key (str): the scoped key.
+            fingerprint (str): fingerprint of the request.
+            ttl (float): seconds to keep the key.
+            lease (float): seconds after which a claim without a response
+                           is considered abandoned.
+
+        Returns:
+            Claimed | None: None if the key was claimed for this request,
+                            otherwise the fingerprint and response stored
+                            for it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest[0] > now:
+                    break
+                self._entries.popitem(last=False)
+
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now \
+                    and (entry[2] is not None or entry[3] > now):
+                return entry[1], entry[2]
+            self._entries.pop(key, None)
+            self._entries[key] = [now + ttl, fingerprint, None, now + lease]
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        return None
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        """Store the response of a claimed key.
+
+        Args:
+            key (str): the scoped key.
+            response (StoredResponse): the response.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] = response
+
+    def release(self, key: str) -> None:
+        """Forget a claimed key, so the request can be retried.
+
+        Args:
+            key (str): the scoped key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DatabaseStore:
+    """Idempotency keys in the idempotency_key table."""
+
+    def begin(self, key: str, fingerprint: str, ttl: float,
+              lease: float) -> Claimed | None:
+        """Claim a key for a new request, unless it's already known.
+        The claim is committed, so concurrent retries see it. Expired keys
+        and abandoned claims are replaced.
+
+        Args:
+            key (str): the scoped key.
+            fingerprint (str): fingerprint of the request.
+            ttl (float): seconds to keep the key.
+            lease (float): seconds after which a claim without a response
+                           is considered abandoned.
+
+        Returns:
+            Claimed | None: None if the key was claimed for this request,
+                            otherwise the fingerprint and response stored
+                            for it.
+        """
+        now = datetime.now(timezone.utc)
+        session = db.session
+        try:
+            session.execute(sa.delete(IdempotencyKey).where(
+                IdempotencyKey.key == key,
+                sa.or_(IdempotencyKey.expires_at < now,
+                       sa.and_(IdempotencyKey.status.is_(None),
+                               IdempotencyKey.locked_until < now))))
+            session.execute(sa.insert(IdempotencyKey).values(
+                key=key, fingerprint=fingerprint, created_at=now,
+                expires_at=now + timedelta(seconds=ttl),
+                locked_until=now + timedelta(seconds=lease)))
+            session.commit()
+            return None
+        except IntegrityError:
+            session.rollback()
+
+        row = session.execute(
+            sa.select(IdempotencyKey.fingerprint, IdempotencyKey.status,
+                      IdempotencyKey.headers, IdempotencyKey.body)
+            .where(IdempotencyKey.key == key)).one_or_none()
+        if row is None or row.status is None:
+            # Still running, or released in the meantime: either way the
+            # client should retry
+            return (fingerprint if row is None else row.fingerprint), None
+        return row.fingerprint, {
+            "status": row.status,
+            "headers": [tuple(header) for header in row.headers],
+            "body": row.body,
+        }
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        """Store the response of a claimed key.
+
+        Args:
+            key (str): the scoped key.
+            response (StoredResponse): the response.
+        """
+        db.session.execute(
+            sa.update(IdempotencyKey).where(IdempotencyKey.key == key)
+            .values(status=response["status"],
+                    headers=response["headers"], body=response["body"],
+                    locked_until=None))
+        db.session.commit()
+
+    def release(self, key: str) -> None:
+        """Delete a claimed key, so the request can be retried.
+
+        Args:
+            key (str): the scoped key.
+        """
+        db.session.rollback()
+        db.session.execute(
+            sa.delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        db.session.commit()
+
+
+class Idempotency:
+    """Flask extension providing the idempotency key store."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        self.store: MemoryStore | DatabaseStore | None = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Create the store configured for an application.
+
+        Args:
+            app (Flask): the Flask application.
+
+        Raises:
+            ValueError: raised when IDEMPOTENCY_STORE is unknown.
+        """
+        store = app.config["IDEMPOTENCY_STORE"]
+        if store == "database":
+            self.store = DatabaseStore()
+        elif store == "memory":
+            self.store = MemoryStore(app.config["IDEMPOTENCY_MEMORY_KEYS"])
+        else:
+            raise ValueError(f"Unknown idempotency store {store!r}")
+        self.ttl = app.config["IDEMPOTENCY_TTL"]
+        self.lease = app.config["IDEMPOTENCY_LEASE"]
+        app.extensions["idempotency"] = self
+
+
+def _scoped_key(key: str) -> str:
+    """Digest of an idempotency key, the caller's identity and the endpoint.
+
+    Args:
+        key (str): the Idempotency-Key header.
+
+    Returns:
+        str: hex digest identifying the key in the store.
+    """
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        # The view doesn't verify tokens: anonymous
+        identity = None
+    scope = "\0".join((str(identity), request.method, request.path, key))
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+
+
+def idempotent(fn: Callable) -> Callable:
+    """Decorator for POST views accepting an Idempotency-Key header.
+    Must be applied after the access checks, so the key is scoped to the
+    verified identity, and before body validation.
+
+    Args:
+        fn (Callable): the view.
+
+    Returns:
+        Callable: the view, replaying stored responses for known keys.
+    """
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Response:
+        """Run the view once per idempotency key.
+
+        Returns:
+            Response: the response of the view, the stored response of an
+                      earlier request with the same key, 400 for an invalid
+                      key, 409 while the first request with the key still
+                      runs, or 422 if the key was used for another request.
+        """
+        key = request.headers.get(HEADER)
+        if key is None:
+            return fn(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify(
+                msg=f"{HEADER} must have 1 to {MAX_KEY_LENGTH} "
+                    "characters."), 400
+
+        extension = current_app.extensions["idempotency"]
+        store = extension.store
+        scoped_key = _scoped_key(key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        claimed = store.begin(scoped_key, fingerprint, extension.ttl,
+                              extension.lease)
+        if claimed is not None:
+            stored_fingerprint, stored = claimed
+            if stored_fingerprint != fingerprint:
+                IDEMPOTENT_REQUESTS.labels("mismatch").inc()
+                return jsonify(msg=f"{HEADER} was used for a different "
+                                   "request."), 422
+            if stored is None:
+                IDEMPOTENT_REQUESTS.labels("in_progress").inc()
+                return jsonify(msg=f"A request with this {HEADER} is "
+                                   "still in progress."), 409
+            IDEMPOTENT_REQUESTS.labels("replayed").inc()
+            response = current_app.response_class(
+                stored["body"], stored["status"], stored["headers"])
+            response.headers[REPLAYED_HEADER] = "true"
+            return response
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except BaseException:
+            store.release(scoped_key)
+            raise
+        if response.status_code >= 500:
+            store.release(scoped_key)
+            return response
+
+        IDEMPOTENT_REQUESTS.labels("executed").inc()
+        store.complete(scoped_key, {
+            "status": response.status_code,
+            "headers": [(name, value) for name, value in response.headers
+                        if name.lower() not in _UNSTORED_HEADERS],
+            "body": response.get_data(),
+        })
+        return response
+
+    return wrapper
+
+
+def purge_expired(session: orm.Session) -> int:
+    """Delete the expired keys of the database store.
+
+    Args:
+        session (orm.Session): session to delete with; not committed.
+
+    Returns:
+        int: number of deleted keys.
+    """
+    return session.execute(sa.delete(IdempotencyKey).where(
+        IdempotencyKey.expires_at < datetime.now(timezone.utc))).rowcount
+
+
+@click.group("idempotency")
+def idempotency_cli() -> None:
+    """Manage stored idempotency keys."""
+
+
+@idempotency_cli.command("purge")
+def purge() -> None:
+    """Delete expired idempotency keys."""
+    deleted = purge_expired(db.session)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} expired idempotency keys.")
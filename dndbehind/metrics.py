@@ -0,0 +1,166 @@
+"""Prometheus metrics for the DnD Behind API.
+
+Metrics are collected in-process with prometheus_client and exposed on
+/metrics. Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+shared by the workers; /metrics then aggregates the metrics of all worker
+processes (see gunicorn.conf.py).
+"""
+import os
+import time
+
+from flask import Flask, Response, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, \
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from sqlalchemy.pool import QueuePool
+
+REQUEST_LATENCY = Histogram(
+    "dndbehind_request_duration_seconds",
+    "Request latency per route",
+    ["endpoint", "method"])
+REQUESTS = Counter(
+    "dndbehind_requests_total",
+    "Requests per route and status code",
+    ["endpoint", "method", "status"])
+REQUEST_DB_TIME = Histogram(
+    "dndbehind_request_db_duration_seconds",
+    "Time spent executing SQL statements per request",
+    ["endpoint"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+RESPONSE_SIZE = Histogram(
+    "dndbehind_response_size_bytes",
+    "Size of response bodies as sent",
+    ["endpoint"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+PASSWORD_HASH_TIME = Histogram(
+    "dndbehind_password_hash_duration_seconds",
+    "Time spent hashing and verifying passwords with Argon2",
+    ["operation"],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5))
+JWT_USER_LOOKUPS = Counter(
+    "dndbehind_jwt_user_lookups_total",
+    "Users looked up for JWT identities, by result (hit or miss)",
+    ["result"])
+JWT_DECODE_CACHE = Counter(
+    "dndbehind_jwt_decode_cache_total",
+    "Access token verifications, by result: hit (payload cached) or miss "
+    "(signature verified)",
+    ["result"])
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "dndbehind_single_flight_requests_total",
+    "Coalescible reads, by role: leader (computed the result) or shared "
+    "(waited for a concurrent identical read)",
+    ["role"])
+AUDIT_EVENTS = Counter(
+    "dndbehind_audit_events_total",
+    "Audit events, by outcome: written, or dropped because the queue was "
+    "full or the log closed while writes failed",
+    ["outcome"])
+IDEMPOTENT_REQUESTS = Counter(
+    "dndbehind_idempotent_requests_total",
+    "Requests with an Idempotency-Key, by result: executed, replayed, "
+    "in_progress or mismatch (key reused for another request)",
+    ["result"])
+POOL_CHECKOUT_WAIT = Histogram(
+    "dndbehind_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the database pool",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        """Check out a connection, timing the wait."""
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+class Metrics:
+    """Flask extension recording request metrics and serving /metrics."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the metrics hooks and the /metrics endpoint.
+        Must be called before the database is initialized, to time pool
+        checkouts, and before other extensions modifying the response, so
+        that its hooks see the final response.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        if not app.config["METRICS_ENABLED"]:
+            return
+
+        app.before_request(self._start_timer)
+        app.after_request(self._record_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics,
+                         methods=["GET"])
+
+        engine_options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        engine_options.setdefault("poolclass", TimedQueuePool)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
+
+    @staticmethod
+    def _start_timer() -> None:
+        """Record the start time of the current request."""
+        request.environ["dndbehind.request_start"] = time.perf_counter()
+
+    @staticmethod
+    def _record_request(response: Response) -> Response:
+        """Record the metrics of the current request.
+
+        Args:
+            response (Response): the response to the current request.
+
+        Returns:
+            Response: the unmodified response.
+        """
+        start = request.environ.get("dndbehind.request_start")
+        if start is None:
+            return response
+
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(
+            time.perf_counter() - start)
+        REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+
+        stats, _ = request.environ.get("dndbehind.query_stats", (None, None))
+        if stats is not None:
+            REQUEST_DB_TIME.labels(endpoint).observe(stats.duration)
+
+        # Streamed bodies are unknown yet, and must not be buffered
+        if not response.is_streamed:
+            size = response.calculate_content_length()
+            if size is not None:
+                RESPONSE_SIZE.labels(endpoint).observe(size)
+
+        return response
+
+    @staticmethod
+    def metrics() -> Response:
+        """Expose all metrics in the Prometheus text format.
+
+        Returns:
+            Response: the metrics of this process, or of all worker
+                      processes when PROMETHEUS_MULTIPROC_DIR is set.
+        """
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry),
+                        mimetype=CONTENT_TYPE_LATEST)
@@ -1,52 +1,85 @@
 """Routes for management of relatively static application data."""
 
-from flask import request, jsonify, Response
+from typing import Any, Iterable
+
+from flask import current_app, jsonify, request, Response, url_for
+from flask_jwt_extended import current_user, get_jwt, jwt_required
+import msgspec
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+from sqlalchemy.orm.exc import StaleDataError
 
 from . import bp
-from .. import db, models
-from ..auth.rbac import role_required,  owner_or_role_required
+from .. import db, history, models
+from ..audit.log import audit
+from ..auth.rbac import BACKGROUND_ROLES, CHARACTER_READ_ROLES, \
+    accessible_resources, role_required, owner_or_role_required
+from ..compressed import LazyText
+from ..dataloaders import get_loader
+from ..idempotency import idempotent
+from ..patch import PatchConflict, PatchError, apply_patch, \
+    referenced_members
+from ..schemas import BackgroundCreate, CharacterCreate, CharacterUpdate, \
+    PatchOperation, present_fields, validated_body
+from ..serialization import rows_as_dicts
+from ..singleflight import shared, shared_response
+
+MERGE_PATCH = "application/merge-patch+json"
+JSON_PATCH = "application/json-patch+json"
+
+# Expandable relations of characters: foreign key and data loader name
+CHARACTER_EXPANSIONS = {
+    "owner": ("owner_id", "user"),
+    "background": ("background_id", "background"),
+}
+
+_merge_patch_decoder = msgspec.json.Decoder(CharacterUpdate)
+_json_patch_decoder = msgspec.json.Decoder(list[PatchOperation])
 
 
 @bp.route("/background", methods=["POST"])
 @role_required("maintainer")
-def create_background() -> Response:
+@idempotent
+@validated_body(BackgroundCreate)
+def create_background(body: BackgroundCreate) -> Response:
     """Add a new D&D background.
 
+    Args:
+        body (BackgroundCreate): validated request body.
+
     Raises:
         e: raised on DB error.
 
     Returns:
         Response: JSON document with the new background data.
     """
-    background_data = request.get_json()
-    background_name = background_data.get("name", None)
-    background_desc = background_data.get("description", None)
-
-    if background_name is None or background_desc is None:
-        return jsonify(msg="Background name and description required."), 400
-
     try:
-        new_background = models.Background(name=background_name,
-                                           description=background_desc)
+        new_background = models.Background(name=body.name,
+                                           description=body.description)
         db.session.add(new_background)
         db.session.commit()
+        audit("background_created", actor_id=current_user.id,
+              target=f"background:{new_background.id}")
         return jsonify(new_background.as_dict())
     except Exception as e:
         raise e
 
 
 @bp.route("/background", methods=["GET"])
-@role_required("maintainer")
+@role_required(*BACKGROUND_ROLES)
 def list_backgounds() -> Response:
     """Return list with all data for all backgrounds.
 
     Returns:
         Response: JSON document with all background data.
     """
-    backgrounds = models.Background.query.all()
-    return jsonify([
-        background.as_dict() for background in backgrounds
-    ])
+    def build() -> Response:
+        """Load and serialize all backgrounds."""
+        backgrounds = db.session.execute(
+            sa.select(*models.Background.as_dict_columns())
+        )
+        return jsonify(rows_as_dicts(backgrounds))
+    return shared_response(("backgrounds",), build)
 
 
 @bp.route("/background/<int:background_id>", methods=["PUT"])
@@ -64,10 +97,15 @@ def update_background(background_id: int) -> Response:
 
 
 @bp.route("/character/<int:character_id>", methods=["GET"])
-@owner_or_role_required(models.Character, "character_id", "operator")
+@owner_or_role_required(models.Character, "character_id",
+                        *CHARACTER_READ_ROLES)
 def get_character(character_id: int) -> Response:
     """Get character data for a specific character.
 
+    Query parameters:
+        expand: relations to include, comma separated: "owner" and/or
+                "background".
+
     Args:
         character_id (int): ID of the character to retrieve.
 
@@ -75,6 +113,428 @@ def get_character(character_id: int) -> Response:
         Response: JSON response with character data or 403 if not owner of
                   character and not operator.
     """
-    return jsonify(
-        {"character": models.Character.query.get(character_id).as_dict()}
-    )
+    try:
+        expand = parse_expand(request.args.getlist("expand"))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    # Loaded by the access check
+    character = db.session.get(models.Character, character_id)
+    # Concurrent requests for the character share the response, except
+    # where it depends on the caller: whether the owner is fully visible
+    full_owner = "owner" in expand and bool(accessible_resources(
+        {character.owner_id: character.owner_id}, current_user.id,
+        get_jwt(), "admin"))
+
+    def build() -> Response:
+        """Serialize the leader's character, expanded."""
+        character_data = character.as_dict()
+        expand_characters([character_data], expand)
+        response = jsonify({"character": character_data})
+        response.set_etag(str(character.version))
+        return response
+    return shared_response(
+        ("character", character_id, tuple(expand), full_owner), build)
+
+
+def parse_expand(values: Iterable[str]) -> list[str]:
+    """Parse the "expand" query parameters of a character request.
+
+    Args:
+        values (Iterable[str]): the parameter values, each holding one or
+                                more comma separated relation names.
+
+    Raises:
+        ValueError: raised when a relation can't be expanded.
+
+    Returns:
+        list[str]: the distinct relation names.
+    """
+    expand = list(dict.fromkeys(name for value in values
+                                for name in value.split(",") if name))
+    for name in expand:
+        if name not in CHARACTER_EXPANSIONS:
+            raise ValueError(f"Can't expand {name!r}; expandable are "
+                             f"{', '.join(CHARACTER_EXPANSIONS)}.")
+    return expand
+
+
+def expand_characters(characters: list[dict[str, Any]],
+                      expand: list[str]) -> None:
+    """Add expanded relations to character dictionaries.
+    Every relation is loaded with one query for all characters, through the
+    request's data loaders. Only the current user and admins see the full
+    data of an owner; others get the ID and username.
+
+    Args:
+        characters (list[dict[str, Any]]): dictionaries of characters the
+                                           current user may access.
+        expand (list[str]): names of the relations to add.
+    """
+    for name in expand:
+        foreign_key, loader_name = CHARACTER_EXPANSIONS[name]
+        related = get_loader(loader_name).load_many(
+            character[foreign_key] for character in characters)
+        if name == "owner":
+            visible = accessible_resources({user_id: user_id
+                                            for user_id in related},
+                                           current_user.id, get_jwt(),
+                                           "admin")
+            related = {user_id: user if user_id in visible or user is None
+                       else {"id": user["id"], "username": user["username"]}
+                       for user_id, user in related.items()}
+        for character in characters:
+            character[name] = related[character[foreign_key]]
+
+
+def parse_ids(values: Iterable[str], max_ids: int) -> list[int]:
+    """Parse the "ids" query parameters of a multi-get request.
+
+    Args:
+        values (Iterable[str]): the parameter values, each holding one or
+                                more comma separated IDs.
+        max_ids (int): maximum number of distinct IDs.
+
+    Raises:
+        ValueError: raised when an ID isn't a number, or when there are no
+                    or too many IDs.
+
+    Returns:
+        list[int]: the distinct IDs, in request order.
+    """
+    ids = []
+    for value in values:
+        for part in value.split(","):
+            try:
+                ids.append(int(part))
+            except ValueError:
+                raise ValueError(f"Invalid ID {part!r}.") from None
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("ids is required.")
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} IDs can be requested at once.")
+    return ids
+
+
+def multi_get_results(ids: list[int], characters: dict[int, Any],
+                      granted: set[int]) -> list[dict[str, Any]]:
+    """Build the per-ID results of a multi-get request.
+
+    Args:
+        ids (list[int]): the requested IDs.
+        characters (dict[int, Any]): data of the existing characters, by ID.
+        granted (set[int]): IDs of the characters the user may access.
+
+    Returns:
+        list[dict[str, Any]]: one result per ID, in request order, with the
+                              status the single GET would have returned.
+    """
+    results = []
+    for character_id in ids:
+        if character_id not in characters:
+            results.append({"id": character_id, "status": 404,
+                            "msg": "Unknown character."})
+        elif character_id not in granted:
+            results.append({"id": character_id, "status": 403,
+                            "msg": "Access denied."})
+        else:
+            results.append({"id": character_id, "status": 200,
+                            "character": characters[character_id]})
+    return results
+
+
+@bp.route("/character", methods=["GET"])
+@jwt_required()
+def get_characters() -> Response:
+    """Get the data of several characters at once, e.g. for a party view.
+    All characters are loaded with a single query, and access to them is
+    evaluated in one pass: owners get their own characters, operators all.
+
+    Query parameters:
+        ids: comma separated character IDs; may be repeated.
+        expand: relations to include, as for the single GET.
+
+    Returns:
+        Response: JSON document with a result per ID, each with the status
+                  the single GET would have returned, or 400 for invalid
+                  IDs.
+    """
+    try:
+        ids = parse_ids(request.args.getlist("ids"),
+                        current_app.config["MULTI_GET_MAX_IDS"])
+        expand = parse_expand(request.args.getlist("expand"))
+    except ValueError as e:
+        return jsonify(msg=str(e)), 400
+
+    def load() -> dict[int, dict[str, Any]]:
+        """Load the characters, by ID."""
+        return {row["id"]: row for row in rows_as_dicts(db.session.execute(
+            sa.select(*models.Character.as_dict_columns())
+            .where(models.Character.id.in_(ids))))}
+    # Concurrent requests for the same characters share the query; access
+    # and expansions are evaluated per caller, on copies
+    characters = {character_id: dict(character) for character_id, character
+                  in shared(("characters", frozenset(ids)), load).items()}
+    granted = accessible_resources(
+        {character_id: character["owner_id"]
+         for character_id, character in characters.items()},
+        current_user.id, get_jwt(), *CHARACTER_READ_ROLES)
+    expand_characters([characters[character_id] for character_id in ids
+                       if character_id in granted], expand)
+    return jsonify(results=multi_get_results(ids, characters, granted))
+
+
+@bp.route("/character", methods=["POST"])
+@jwt_required()
+@idempotent
+@validated_body(CharacterCreate)
+def create_character(body: CharacterCreate) -> Response:
+    """Create a character owned by the current user.
+
+    Args:
+        body (CharacterCreate): validated request body.
+
+    Returns:
+        Response: JSON response with the new character data and status code
+                  201, or 400 if the background doesn't exist.
+    """
+    if db.session.get(models.Background, body.background_id) is None:
+        return jsonify(msg="Unknown background."), 400
+
+    character = models.Character(owner=current_user, **present_fields(body))
+    db.session.add(character)
+    db.session.commit()
+
+    response = jsonify({"character": character.as_dict()})
+    response.status_code = 201
+    response.headers["Location"] = url_for(
+        "mgmt.get_character", character_id=character.id, _external=True)
+    response.set_etag(str(character.version))
+    return response
+
+
+def _json_value(value: object) -> object:
+    """Convert lazily decompressed texts to str, leaving other values as is.
+
+    Args:
+        value (object): a column value.
+
+    Returns:
+        object: the value as a JSON type.
+    """
+    return str(value) if isinstance(value, LazyText) else value
+
+
+def _patched_fields(character: models.Character) -> dict:
+    """Decode the PATCH request body into the fields it changes.
+
+    Args:
+        character (models.Character): the character to patch.
+
+    Raises:
+        msgspec.DecodeError: raised when the body isn't a valid patch.
+        PatchError: raised when a JSON Patch can't be applied.
+
+    Returns:
+        dict: new values of the patched fields.
+    """
+    if request.mimetype == JSON_PATCH:
+        operations = _json_patch_decoder.decode(request.get_data())
+        members = referenced_members(operations)
+        fields = members & set(CharacterUpdate.__struct_fields__)
+        # Only the members the patch refers to are loaded
+        document = {field: _json_value(getattr(character, field))
+                    for field in fields}
+        if "version" in members:
+            document["version"] = character.version
+        patched = apply_patch(document, operations)
+        if patched.get("version") != document.get("version"):
+            raise PatchError("version is read-only")
+        patched.pop("version", None)
+        # Removed members are cleared
+        patched.update((field, None) for field in fields
+                       if field not in patched)
+        body = msgspec.convert(patched, CharacterUpdate)
+    else:
+        body = _merge_patch_decoder.decode(request.get_data())
+    return present_fields(body)
+
+
+@bp.route("/character/<int:character_id>", methods=["PATCH"])
+@owner_or_role_required(
+    models.Character, "character_id", "operator",
+    load_options=(orm.defer(models.Character.description),
+                  orm.defer(models.Character.backstory)))
+def update_character(character_id: int) -> Response:
+    """Update a character with a JSON Merge Patch (RFC 7396) or a JSON Patch
+    (RFC 6902), selected by the Content-Type header.
+
+    Only the changed columns are written, and the large description and
+    backstory columns are only loaded when the patch refers to them. Every
+    update increments the character's version, which is sent as its ETag;
+    pass it in an If-Match header to make sure no one else changed the
+    character since it was read. Send "Prefer: return=minimal" to skip
+    reading back the updated character.
+
+    Args:
+        character_id (int): ID of the character to update.
+
+    Returns:
+        Response: JSON response with the updated character data, or 204 with
+                  return=minimal. 400 or 422 for invalid patches, 409 if a
+                  JSON Patch test fails or a concurrent update won, 412 if
+                  the If-Match header doesn't match, and 415 for other
+                  content types.
+    """
+    if request.mimetype not in (MERGE_PATCH, JSON_PATCH, "application/json"):
+        response = jsonify(msg=f"Use {MERGE_PATCH} or {JSON_PATCH}.")
+        response.status_code = 415
+        response.headers["Accept-Patch"] = f"{MERGE_PATCH}, {JSON_PATCH}"
+        return response
+
+    character = db.session.get(models.Character, character_id)
+    if request.if_match and not request.if_match.contains(
+            str(character.version)):
+        return jsonify(msg="Character was modified.",
+                       version=character.version), 412
+
+    try:
+        fields = _patched_fields(character)
+    except msgspec.DecodeError as e:
+        return jsonify(msg=f"Invalid patch: {e}"), 400
+    except PatchConflict as e:
+        return jsonify(msg=str(e)), 409
+    except PatchError as e:
+        return jsonify(msg=str(e)), 422
+
+    background_id = fields.get("background_id")
+    if background_id is not None and background_id != \
+            character.background_id and \
+            db.session.get(models.Background, background_id) is None:
+        return jsonify(msg="Unknown background."), 400
+
+    unloaded = sa.inspect(character).unloaded
+    for field, value in fields.items():
+        # Assigning an equal value would still write unloaded columns
+        if field in unloaded or getattr(character, field) != value:
+            setattr(character, field, value)
+
+    try:
+        db.session.flush()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify(msg="Character was modified concurrently."), 409
+    version = character.version
+    db.session.commit()
+
+    if request.headers.get("Prefer") == "return=minimal":
+        response = Response(status=204)
+    else:
+        character_data = rows_as_dicts(db.session.execute(
+            sa.select(*models.Character.as_dict_columns())
+            .where(models.Character.id == character_id)))[0]
+        response = jsonify({"character": character_data})
+    response.set_etag(str(version))
+    return response
+
+
+@bp.route("/character/<int:character_id>/history", methods=["GET"])
+@owner_or_role_required(
+    models.Character, "character_id", "operator",
+    load_options=(orm.defer(models.Character.description),
+                  orm.defer(models.Character.backstory)))
+def list_character_versions(character_id: int) -> Response:
+    """List the recorded versions of a character, newest first.
+
+    Query parameters:
+        before: only list versions before this one, to page back.
+        limit: maximum number of versions (at most HISTORY_PAGE_SIZE).
+
+    Args:
+        character_id (int): ID of the character.
+
+    Returns:
+        Response: JSON document with the versions, each with its creation
+                  time and the fields it changed, or 400 for invalid
+                  parameters.
+    """
+    page_size = current_app.config["HISTORY_PAGE_SIZE"]
+    try:
+        before = request.args.get("before", type=int)
+        limit = int(request.args.get("limit", page_size))
+    except ValueError:
+        return jsonify(msg="before and limit must be numbers."), 400
+    if limit < 1:
+        return jsonify(msg="limit must be positive."), 400
+
+    return jsonify(versions=history.list_versions(
+        db.session, character_id, before, min(limit, page_size)))
+
+
+@bp.route("/character/<int:character_id>/history/<int:version>",
+          methods=["GET"])
+@owner_or_role_required(
+    models.Character, "character_id", "operator",
+    load_options=(orm.defer(models.Character.description),
+                  orm.defer(models.Character.backstory)))
+def get_character_version(character_id: int, version: int) -> Response:
+    """Get an earlier version of a character.
+
+    Args:
+        character_id (int): ID of the character.
+        version (int): the version.
+
+    Returns:
+        Response: JSON document with the character's name, texts, abilities
+                  and background at that version, or 404 if the version
+                  isn't in the history.
+    """
+    state = history.version_at(db.session, character_id, version)
+    if state is None:
+        return jsonify(msg="Unknown version."), 404
+    return jsonify(version=version, character=state)
+
+
+@bp.route("/character/<int:character_id>/history/<int:version>/restore",
+          methods=["POST"])
+@owner_or_role_required(models.Character, "character_id", "operator")
+def restore_character_version(character_id: int, version: int) -> Response:
+    """Restore an earlier version of a character.
+    The restored fields are saved as a new version, so the restore itself
+    can be undone. Pass the current version in an If-Match header to make
+    sure no one else changed the character in the meantime.
+
+    Args:
+        character_id (int): ID of the character.
+        version (int): the version to restore.
+
+    Returns:
+        Response: JSON response with the updated character data, 404 if the
+                  version isn't in the history, 409 if a concurrent update
+                  won and 412 if the If-Match header doesn't match.
+    """
+    character = db.session.get(models.Character, character_id)
+    if request.if_match and not request.if_match.contains(
+            str(character.version)):
+        return jsonify(msg="Character was modified.",
+                       version=character.version), 412
+
+    state = history.version_at(db.session, character_id, version)
+    if state is None:
+        return jsonify(msg="Unknown version."), 404
+
+    for field, value in state.items():
+        if getattr(character, field) != value:
+            setattr(character, field, value)
+
+    try:
+        db.session.flush()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify(msg="Character was modified concurrently."), 409
+    db.session.commit()
+
+    response = jsonify({"character": character.as_dict()})
+    response.set_etag(str(character.version))
+    return response
@@ -1,14 +1,44 @@
 """Database models for the D&D Behind application."""
 from datetime import datetime, timezone
-from typing import Optional, List, TypedDict, Self, Protocol
+from typing import Optional, List, TypedDict, Self, Protocol, \
+    TYPE_CHECKING
 
-from argon2 import PasswordHasher
-from argon2.exceptions import Argon2Error
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 
 from . import db
+from .compressed import CompressedText
+from .metrics import PASSWORD_HASH_TIME
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from argon2 import PasswordHasher
+
+
+def password_hasher() -> "PasswordHasher":
+    """Return the password hasher configured for the current application.
+    argon2 is imported, and the application's hasher created, on first use.
+
+    Returns:
+        PasswordHasher: the application's hasher, or one with the library
+                        defaults outside an application context. Verifying
+                        works with either, as the hash encodes its own
+                        parameters.
+    """
+    from argon2 import PasswordHasher
+
+    if not has_app_context():
+        return PasswordHasher()
+
+    hasher = current_app.extensions.get("password_hasher")
+    if hasher is None:
+        hasher = current_app.extensions["password_hasher"] = PasswordHasher(
+            time_cost=current_app.config["ARGON2_TIME_COST"],
+            memory_cost=current_app.config["ARGON2_MEMORY_COST"],
+            parallelism=current_app.config["ARGON2_PARALLELISM"])
+    return hasher
 
 
 # Table representing user <-> role many-to-many relationship
@@ -70,8 +100,9 @@ class User(UserMixin, db.Model):
         Args:
             password (str): the password to hash
         """
-        hasher = PasswordHasher()
-        self.password_hash = hasher.hash(password)
+        with tracer.start_as_current_span("argon2.hash"), \
+                PASSWORD_HASH_TIME.labels("hash").time():
+            self.password_hash = password_hasher().hash(password)
 
     def check_password(self, password: str) -> bool:
         """Check the password against the stored hash.
@@ -82,16 +113,21 @@ class User(UserMixin, db.Model):
         Returns:
             bool: True if the password matches the stored hash, False otherwise
         """
-        hasher = PasswordHasher()
-        try:
-            return hasher.verify(self.password_hash, password)
-        except Argon2Error:
-            return False
+        hasher = password_hasher()
+        from argon2.exceptions import Argon2Error
+
+        with tracer.start_as_current_span("argon2.verify"), \
+                PASSWORD_HASH_TIME.labels("verify").time():
+            try:
+                return hasher.verify(self.password_hash, password)
+            except Argon2Error:
+                return False
 
     def update_login_time(self) -> None:
         """Update the last logged-in time for the user."""
-        self.last_logged_in = datetime.now(timezone.utc)
-        db.session.commit()
+        with tracer.start_as_current_span("user.update_login_time"):
+            self.last_logged_in = datetime.now(timezone.utc)
+            db.session.commit()
 
     def is_disabled(self) -> bool:
         """Check if the user is disabled.
@@ -123,6 +159,19 @@ class User(UserMixin, db.Model):
             "disabled": self.disabled
         }
 
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns that make up the dictionary returned by as_dict.
+        Selecting these columns directly yields rows that can be serialized
+        without hydrating User objects.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns, in as_dict
+                                                   order.
+        """
+        return (cls.id, cls.username, cls.email, cls.last_logged_in,
+                cls.disabled)
+
     @classmethod
     def from_id(cls, user_id: int) -> Self:
         """Construct User object from data retrieved from DB by user id.
@@ -219,6 +268,16 @@ class Role(db.Model):
             "description": self.description
         }
 
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns that make up the dictionary returned by as_dict.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns, in as_dict
+                                                   order.
+        """
+        return (cls.id, cls.name, cls.description)
+
 
 class CharacterDict(TypedDict):
     """TypedDict for Character model."""
@@ -234,19 +293,24 @@ class CharacterDict(TypedDict):
     charisma: int
     owner_id: int
     background_id: int
+    version: int
 
 
 class Character(db.Model):
-    """D&D 5E Character model."""
+    """D&D 5E Character model.
+    Every UPDATE checks and increments the version column, so concurrent
+    writers can't silently overwrite each other's changes: the loser's flush
+    raises StaleDataError.
+    """
     __table_name__ = "character"
 
     id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
     name: orm.Mapped[str] = orm.mapped_column(sa.String(254),
                                               nullable=False,
                                               index=True)
-    description: orm.Mapped[str] = orm.mapped_column(sa.String(1_000_000),
+    description: orm.Mapped[str] = orm.mapped_column(CompressedText(),
                                                      nullable=True)
-    backstory: orm.Mapped[str] = orm.mapped_column(sa.String(1_000_000),
+    backstory: orm.Mapped[str] = orm.mapped_column(CompressedText(),
                                                    nullable=True)
     strength: orm.Mapped[int] = orm.mapped_column(sa.Integer(),
                                                   nullable=False)
@@ -268,6 +332,13 @@ class Character(db.Model):
         sa.ForeignKey("background.id"))
     background: orm.Mapped["Background"] = orm.relationship()
 
+    version: orm.Mapped[int] = orm.mapped_column(sa.Integer(),
+                                                 nullable=False,
+                                                 default=1,
+                                                 server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self) -> str:
         """Return a string representation of the character object.
 
@@ -298,9 +369,74 @@ class Character(db.Model):
             "wisdom": self.wisdom,
             "charisma": self.charisma,
             "owner_id": self.owner_id,
-            "background_id": self.background_id
+            "background_id": self.background_id,
+            "version": self.version
         }
 
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns that make up the dictionary returned by as_dict.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns, in as_dict
+                                                   order.
+        """
+        return (cls.id, cls.name, cls.description, cls.backstory,
+                cls.strength, cls.dexterity, cls.constitution,
+                cls.intelligence, cls.wisdom, cls.charisma, cls.owner_id,
+                cls.background_id, cls.version)
+
+
+class CharacterHistoryDict(TypedDict):
+    """TypedDict for the listing of a CharacterHistory entry."""
+    version: int
+    created_at: datetime
+    changed: list[str]
+
+
+class CharacterHistory(db.Model):
+    """A version of a character, as a full snapshot or as a delta onto the
+    previous version (see history.py). Every character version has one row,
+    until old versions are compacted away.
+    """
+    __table_name__ = "character_history"
+    __table_args__ = (sa.UniqueConstraint("character_id", "version"),)
+
+    id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
+    character_id: orm.Mapped[int] = orm.mapped_column(
+        sa.ForeignKey("character.id", ondelete="CASCADE"),
+        nullable=False)
+    version: orm.Mapped[int] = orm.mapped_column(sa.Integer(),
+                                                 nullable=False)
+    created_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime(),
+                                                         nullable=False)
+    snapshot: orm.Mapped[bool] = orm.mapped_column(sa.Boolean(),
+                                                   nullable=False)
+    # Names of the fields changed by this version
+    changed: orm.Mapped[list] = orm.mapped_column(sa.JSON(),
+                                                  nullable=False)
+    # JSON document with the snapshot or delta
+    data: orm.Mapped[str] = orm.mapped_column(CompressedText(),
+                                              nullable=False)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the history entry.
+
+        Returns:
+            str: string representation of the history entry
+        """
+        return f"<CharacterHistory character {self.character_id} " \
+            f"version {self.version}>"
+
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns of a history entry as listed by the history endpoint.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns.
+        """
+        return (cls.version, cls.created_at, cls.changed)
+
 
 class BackgroundDict(TypedDict):
     """TypedDict for Background model."""
@@ -318,7 +454,7 @@ class Background(db.Model):
                                               nullable=False,
                                               unique=True,
                                               index=True)
-    description: orm.Mapped[str] = orm.mapped_column(sa.String(100_000),
+    description: orm.Mapped[str] = orm.mapped_column(CompressedText(),
                                                      nullable=False)
 
     def __repr__(self) -> str:
@@ -344,3 +480,154 @@ class Background(db.Model):
             "name": self.name,
             "description": self.description
         }
+
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns that make up the dictionary returned by as_dict.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns, in as_dict
+                                                   order.
+        """
+        return (cls.id, cls.name, cls.description)
+
+
+class OutboxEventDict(TypedDict):
+    """TypedDict for OutboxEvent model."""
+    id: int
+    entity: str
+    entity_id: int
+    operation: str
+    created_at: datetime
+    payload: Optional[dict]
+
+
+class OutboxEvent(db.Model):
+    """Change of a character, user or background, in commit order.
+    Rows are written in the same transaction as the change itself (see
+    changes/outbox.py); the ID is the cursor of the change feed.
+    """
+    __table_name__ = "outbox_event"
+    # Never reuse IDs of pruned events, which would move cursors backwards
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
+    entity: orm.Mapped[str] = orm.mapped_column(sa.String(32),
+                                                nullable=False)
+    entity_id: orm.Mapped[int] = orm.mapped_column(sa.Integer(),
+                                                   nullable=False)
+    operation: orm.Mapped[str] = orm.mapped_column(sa.String(8),
+                                                   nullable=False)
+    created_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime(),
+                                                         nullable=False,
+                                                         index=True)
+    payload: orm.Mapped[Optional[dict]] = orm.mapped_column(sa.JSON(),
+                                                            nullable=True)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the outbox event.
+
+        Returns:
+            str: string representation of the outbox event
+        """
+        return f"<OutboxEvent ID {self.id} - {self.operation} " \
+            f"{self.entity} {self.entity_id}>"
+
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns of an event as delivered by the change feed.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns.
+        """
+        return (cls.id, cls.entity, cls.entity_id, cls.operation,
+                cls.created_at, cls.payload)
+
+
+class AuditEventDict(TypedDict):
+    """TypedDict for AuditEvent model."""
+    id: int
+    created_at: datetime
+    action: str
+    actor_id: Optional[int]
+    target: Optional[str]
+    success: bool
+    ip: Optional[str]
+    details: Optional[dict]
+
+
+class AuditEvent(db.Model):
+    """Security-relevant action, such as a login or a role change.
+    Rows are only ever inserted, in batches by the audit log's writer thread
+    (see audit/log.py). Actors are plain IDs rather than foreign keys, so
+    events outlive the users they refer to.
+    """
+    __table_name__ = "audit_event"
+    # Never reuse IDs, which are the cursors of the audit API
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: orm.Mapped[int] = orm.mapped_column(primary_key=True)
+    created_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime(),
+                                                         nullable=False,
+                                                         index=True)
+    action: orm.Mapped[str] = orm.mapped_column(sa.String(64),
+                                                nullable=False,
+                                                index=True)
+    actor_id: orm.Mapped[Optional[int]] = orm.mapped_column(sa.Integer(),
+                                                            index=True)
+    target: orm.Mapped[Optional[str]] = orm.mapped_column(sa.String(64))
+    success: orm.Mapped[bool] = orm.mapped_column(sa.Boolean(),
+                                                  nullable=False)
+    ip: orm.Mapped[Optional[str]] = orm.mapped_column(sa.String(45))
+    details: orm.Mapped[Optional[dict]] = orm.mapped_column(sa.JSON())
+
+    def __repr__(self) -> str:
+        """Return a string representation of the audit event.
+
+        Returns:
+            str: string representation of the audit event
+        """
+        return f"<AuditEvent ID {self.id} - {self.action}>"
+
+    @classmethod
+    def as_dict_columns(cls) -> tuple[orm.InstrumentedAttribute, ...]:
+        """Columns of an event as returned by the audit API.
+
+        Returns:
+            tuple[orm.InstrumentedAttribute, ...]: the columns.
+        """
+        return (cls.id, cls.created_at, cls.action, cls.actor_id,
+                cls.target, cls.success, cls.ip, cls.details)
+
+
+class IdempotencyKey(db.Model):
+    """Idempotency key of a POST request, and the response to replay for it
+    (see idempotency.py). The status is NULL while the first request with
+    the key is running, which other requests may take over after
+    locked_until.
+    """
+    __table_name__ = "idempotency_key"
+
+    # Digest of the key, the caller and the endpoint
+    key: orm.Mapped[str] = orm.mapped_column(sa.String(64), primary_key=True)
+    fingerprint: orm.Mapped[str] = orm.mapped_column(sa.String(64),
+                                                     nullable=False)
+    created_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime(),
+                                                         nullable=False)
+    expires_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime(),
+                                                         nullable=False,
+                                                         index=True)
+    status: orm.Mapped[Optional[int]] = orm.mapped_column(sa.Integer())
+    headers: orm.Mapped[Optional[list]] = orm.mapped_column(sa.JSON())
+    body: orm.Mapped[Optional[bytes]] = orm.mapped_column(sa.LargeBinary())
+    # End of the lease of the running request; NULL once it has completed
+    locked_until: orm.Mapped[Optional[datetime]] = \
+        orm.mapped_column(sa.DateTime())
+
+    def __repr__(self) -> str:
+        """Return a string representation of the idempotency key.
+
+        Returns:
+            str: string representation of the idempotency key
+        """
+        return f"<IdempotencyKey {self.key} - {self.status}>"
@@ -0,0 +1,116 @@
+"""JSON Patch (RFC 6902) for the flat documents of the DnD Behind API.
+
+Resources are patched as flat JSON objects whose members are the columns of
+a model, so JSON Pointers address top-level members only. Patches are
+applied to a document holding just the members they refer to; building the
+full document would load every column, including large text columns the
+patch doesn't touch.
+"""
+from typing import Any
+
+from .schemas import UNSET, PatchOperation
+
+
+class PatchError(ValueError):
+    """Raised when a patch can't be applied to the document."""
+
+
+class PatchConflict(PatchError):
+    """Raised when a "test" operation of a patch fails."""
+
+
+def _member(pointer: str) -> str:
+    """Resolve a JSON Pointer to the name of a top-level member.
+
+    Args:
+        pointer (str): JSON Pointer, e.g. "/strength".
+
+    Raises:
+        PatchError: raised when the pointer doesn't address a top-level
+                    member.
+
+    Returns:
+        str: the member name.
+    """
+    if not pointer.startswith("/") or "/" in pointer[1:]:
+        raise PatchError(f"Unsupported path {pointer!r}")
+    return pointer[1:].replace("~1", "/").replace("~0", "~")
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """Compare two JSON values; unlike ==, true doesn't equal 1.
+
+    Args:
+        a (Any): a JSON value.
+        b (Any): another JSON value.
+
+    Returns:
+        bool: True if the values are equal.
+    """
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+
+def referenced_members(operations: list[PatchOperation]) -> set[str]:
+    """Find the members a patch reads or writes.
+
+    Args:
+        operations (list[PatchOperation]): the patch.
+
+    Raises:
+        PatchError: raised when a path doesn't address a top-level member.
+
+    Returns:
+        set[str]: names of the members.
+    """
+    members = {_member(operation.path) for operation in operations}
+    members.update(_member(operation.from_) for operation in operations
+                   if operation.from_ is not UNSET)
+    return members
+
+
+def apply_patch(document: dict[str, Any],
+                operations: list[PatchOperation]) -> dict[str, Any]:
+    """Apply a JSON Patch to a flat document.
+    The patch is applied atomically: the document is left unchanged when an
+    operation fails.
+
+    Args:
+        document (dict[str, Any]): the document, holding at least the
+                                   existing members the patch refers to.
+        operations (list[PatchOperation]): the patch.
+
+    Raises:
+        PatchConflict: raised when a "test" operation fails.
+        PatchError: raised when an operation can't be applied.
+
+    Returns:
+        dict[str, Any]: the patched document.
+    """
+    result = dict(document)
+    for operation in operations:
+        member = _member(operation.path)
+        if operation.op in ("add", "replace", "test") \
+                and operation.value is UNSET:
+            raise PatchError(f"{operation.op} operation without a value")
+        if operation.op in ("move", "copy"):
+            if operation.from_ is UNSET:
+                raise PatchError(f"{operation.op} operation without from")
+            source = _member(operation.from_)
+            if source not in result:
+                raise PatchError(f"Path {operation.from_!r} doesn't exist")
+        elif operation.op != "add" and member not in result:
+            raise PatchError(f"Path {operation.path!r} doesn't exist")
+
+        if operation.op in ("add", "replace"):
+            result[member] = operation.value
+        elif operation.op == "remove":
+            del result[member]
+        elif operation.op == "move":
+            result[member] = result.pop(source)
+        elif operation.op == "copy":
+            result[member] = result[source]
+        elif not _json_equal(result[member], operation.value):
+            raise PatchConflict(f"Test of {operation.path!r} failed")
+    return result
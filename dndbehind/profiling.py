@@ -0,0 +1,297 @@
+"""Opt-in profiling of live requests.
+
+When PROFILING_ENABLED is set, individual requests are profiled and the
+profiles are written to PROFILE_DIR:
+
+- on demand, for requests by admins carrying an "X-Profile" header,
+- at random, for a PROFILE_SAMPLE_RATE fraction of all requests.
+
+Two profilers are available: "cprofile" writes a deterministic profile as a
+pstats file (open with `python -m pstats` or snakeviz), "sample" samples the
+request's stack every PROFILE_SAMPLE_INTERVAL seconds and writes a
+speedscope file (open on https://www.speedscope.app). The X-Profile header
+may name the profiler to use. At most PROFILE_MAX_PER_MINUTE profiles are
+taken per worker.
+
+With PROFILING_ENABLED unset (the default), no hooks are registered and
+requests are not touched at all.
+"""
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from types import FrameType
+
+from flask import Flask, Response, current_app, request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+
+from .auth.rbac import role_required
+
+PROFILERS = ("cprofile", "sample")
+
+
+class StackSampler:
+    """Statistical profiler sampling the stack of one thread."""
+
+    def __init__(self, interval: float) -> None:
+        """Initialize the sampler for the calling thread.
+
+        Args:
+            interval (float): seconds between two samples.
+        """
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.frames: dict[tuple[str, str, int], int] = {}
+        self.samples: list[list[int]] = []
+        self.weights: list[float] = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="stack-sampler")
+
+    def start(self) -> None:
+        """Start sampling."""
+        self.start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stopped.set()
+        self._thread.join()
+        self.end_time = time.perf_counter()
+
+    def _run(self) -> None:
+        """Take samples until stopped."""
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            now = time.perf_counter()
+            self.samples.append(self._stack(frame))
+            self.weights.append(now - last)
+            last = now
+
+    def _stack(self, frame: FrameType | None) -> list[int]:
+        """Convert a stack to a list of frame indexes, outermost first.
+
+        Args:
+            frame (FrameType | None): innermost frame of the stack.
+
+        Returns:
+            list[int]: indexes into the shared frame table.
+        """
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+            stack.append(self.frames.setdefault(key, len(self.frames)))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def write(self, path: str, name: str) -> None:
+        """Write the samples as a speedscope file.
+
+        Args:
+            path (str): path of the file to write.
+            name (str): name of the profile.
+        """
+        profile = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "dndbehind",
+            "shared": {"frames": [
+                {"name": function, "file": filename, "line": line}
+                for function, filename, line in self.frames
+            ]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.end_time - self.start_time,
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(profile, f)
+
+
+class CProfiler:
+    """Deterministic profiler writing pstats files."""
+
+    def __init__(self) -> None:
+        """Initialize the profiler."""
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        """Start profiling the calling thread."""
+        self.profile.enable()
+
+    def stop(self) -> None:
+        """Stop profiling."""
+        self.profile.disable()
+
+    def write(self, path: str, name: str) -> None:
+        """Write the profile as a pstats file.
+
+        Args:
+            path (str): path of the file to write.
+            name (str): name of the profile (unused).
+        """
+        self.profile.dump_stats(path)
+
+
+class RateLimiter:
+    """Thread safe sliding window limit of events per minute."""
+
+    def __init__(self, max_per_minute: int) -> None:
+        """Initialize the limiter.
+
+        Args:
+            max_per_minute (int): maximum number of events per minute.
+        """
+        self.max_per_minute = max_per_minute
+        self._events: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Record an event if the limit allows it.
+
+        Returns:
+            bool: True if the event is allowed, False otherwise.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._events and self._events[0] <= now - 60:
+                self._events.popleft()
+            if len(self._events) >= self.max_per_minute:
+                return False
+            self._events.append(now)
+            return True
+
+
+@role_required("admin")
+def _admin() -> bool:
+    """Check that the current request was made by an admin.
+
+    Returns:
+        bool: True for admins; other users get an access denied response.
+    """
+    return True
+
+
+def _requested_by_admin() -> bool:
+    """Check whether the current request carries an admin's access token.
+
+    Returns:
+        bool: True if the request was made by an admin, False otherwise.
+    """
+    try:
+        return _admin() is True
+    except (JWTExtendedException, PyJWTError):
+        return False
+
+
+class Profiler:
+    """Flask extension profiling individual requests."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the profiling hooks on the application.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        if not app.config["PROFILING_ENABLED"]:
+            return
+
+        app.extensions["profiler"] = \
+            RateLimiter(app.config["PROFILE_MAX_PER_MINUTE"])
+        app.before_request(self._start)
+        app.after_request(self._add_header)
+        app.teardown_request(self._stop)
+
+    @staticmethod
+    def _start() -> None:
+        """Start profiling the current request if requested or sampled."""
+        config = current_app.config
+
+        requested = request.headers.get("X-Profile")
+        if requested is not None:
+            if not _requested_by_admin():
+                return
+        elif random.random() >= config["PROFILE_SAMPLE_RATE"]:
+            return
+
+        if not current_app.extensions["profiler"].acquire():
+            return
+
+        kind = requested if requested in PROFILERS else config["PROFILE_MODE"]
+        if kind == "sample":
+            profiler = StackSampler(config["PROFILE_SAMPLE_INTERVAL"])
+        else:
+            profiler = CProfiler()
+
+        try:
+            profiler.start()
+        except ValueError:
+            # Another profiler is already active in this process
+            return
+
+        profile_id = uuid.uuid4().hex
+        request.environ["dndbehind.profiler"] = (profiler, profile_id)
+
+    @staticmethod
+    def _add_header(response: Response) -> Response:
+        """Tell admins which profile was taken of their request.
+
+        Args:
+            response (Response): the response to the current request.
+
+        Returns:
+            Response: the response, with an X-Profile-Id header added if the
+                      request was profiled on demand.
+        """
+        _, profile_id = request.environ.get("dndbehind.profiler",
+                                            (None, None))
+        if profile_id is not None and "X-Profile" in request.headers:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    @staticmethod
+    def _stop(_exc: BaseException | None) -> None:
+        """Stop profiling the current request and write the profile."""
+        profiler, profile_id = request.environ.pop("dndbehind.profiler",
+                                                   (None, None))
+        if profiler is None:
+            return
+
+        profiler.stop()
+
+        directory = current_app.config["PROFILE_DIR"] \
+            or os.path.join(current_app.instance_path, "profiles")
+        os.makedirs(directory, exist_ok=True)
+
+        name = f"{request.method} {request.path}"
+        extension = "speedscope.json" if isinstance(profiler, StackSampler) \
+            else "prof"
+        endpoint = request.endpoint or "unmatched"
+        filename = f"{int(time.time())}-{endpoint}-{profile_id}.{extension}"
+        profiler.write(os.path.join(directory, filename), name)
@@ -0,0 +1,205 @@
+"""Per-request SQL statement statistics and N+1 query detection.
+
+Every statement executed through SQLAlchemy is recorded, with its duration,
+in the query collectors that are active at the time. A collector is active
+for every request, and the results are reported in a Server-Timing header
+and a log line. Statements executed repeatedly with the same SQL text
+within one request usually indicate an N+1 query pattern and are logged as
+a warning.
+
+Tests can assert the query budget of a piece of code:
+
+    with query_budget(2):
+        client.get("/auth/userrole", headers=headers)
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+import sqlalchemy as sa
+from flask import Flask, Response, current_app, request
+
+logger = logging.getLogger(__name__)
+
+# Transaction control statements aren't counted as queries
+_TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT",
+                        "ROLLBACK TO SAVEPOINT")
+
+
+class QueryStats:
+    """Statistics of the SQL statements executed while collecting."""
+
+    def __init__(self) -> None:
+        """Initialize empty statistics."""
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        """Record an executed statement.
+
+        Args:
+            statement (str): SQL text of the statement.
+            duration (float): execution time in seconds.
+        """
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement] += 1
+
+    @property
+    def duplicates(self) -> dict[str, int]:
+        """Statements that were executed more than once.
+
+        Returns:
+            dict[str, int]: SQL text and execution count of every repeated
+                            statement.
+        """
+        return {shape: n for shape, n in self.shapes.items() if n > 1}
+
+
+# Collectors receiving the statements executed in the current context
+_collectors: ContextVar[tuple[QueryStats, ...]] = \
+    ContextVar("query_collectors", default=())
+
+
+@sa.event.listens_for(sa.Engine, "before_cursor_execute")
+def _before_cursor_execute(conn: sa.Connection, cursor: Any,
+                           statement: str, parameters: Any,
+                           context: Any, executemany: bool) -> None:
+    """Remember when a statement started executing."""
+    if _collectors.get():
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@sa.event.listens_for(sa.Engine, "after_cursor_execute")
+def _after_cursor_execute(conn: sa.Connection, cursor: Any,
+                          statement: str, parameters: Any,
+                          context: Any, executemany: bool) -> None:
+    """Record an executed statement in all active collectors."""
+    collectors = _collectors.get()
+    if not collectors or not conn.info.get("query_start"):
+        return
+
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    if statement.startswith(_TRANSACTION_CONTROL):
+        return
+    for stats in collectors:
+        stats.record(statement, duration)
+
+
+@contextmanager
+def collect_queries() -> Iterator[QueryStats]:
+    """Collect statistics of the statements executed within the block.
+
+    Yields:
+        Iterator[QueryStats]: the statistics, updated while the block runs.
+    """
+    stats = QueryStats()
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int,
+                 max_repeats: int | None = None) -> Iterator[QueryStats]:
+    """Assert that the block executes at most max_queries statements.
+
+    Args:
+        max_queries (int): maximum number of statements.
+        max_repeats (int | None, optional): maximum number of times the same
+                                            statement may be executed.
+                                            Defaults to None (unchecked).
+
+    Raises:
+        AssertionError: raised when the budget is exceeded.
+
+    Yields:
+        Iterator[QueryStats]: the statistics of the block.
+    """
+    with collect_queries() as stats:
+        yield stats
+
+    assert stats.count <= max_queries, \
+        f"{stats.count} queries executed, budget is {max_queries}: " \
+        f"{list(stats.shapes)}"
+    if max_repeats is not None:
+        repeated = {shape: n for shape, n in stats.shapes.items()
+                    if n > max_repeats}
+        assert not repeated, f"Repeated queries (N+1?): {repeated}"
+
+
+class QueryCounter:
+    """Flask extension collecting query statistics for every request."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the request hooks on the application.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        if not app.config["QUERY_STATS_ENABLED"]:
+            return
+
+        app.before_request(self._start)
+        app.after_request(self._report)
+        app.teardown_request(self._stop)
+
+    @staticmethod
+    def _start() -> None:
+        """Start collecting statistics for the current request."""
+        stats = QueryStats()
+        request.environ["dndbehind.query_stats"] = (
+            stats, _collectors.set(_collectors.get() + (stats,)))
+
+    @staticmethod
+    def _report(response: Response) -> Response:
+        """Add the statistics to the response and log them.
+
+        Args:
+            response (Response): the response to the current request.
+
+        Returns:
+            Response: the response, with a Server-Timing header added.
+        """
+        stats, _ = request.environ.get("dndbehind.query_stats", (None, None))
+        if stats is None:
+            return response
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"')
+
+        logger.info("%s %s: %d queries, %.2f ms",
+                    request.method, request.path,
+                    stats.count, stats.duration * 1000)
+
+        threshold = current_app.config["QUERY_REPEAT_THRESHOLD"]
+        for statement, n in stats.duplicates.items():
+            if n >= threshold:
+                logger.warning("%s %s: query executed %d times (N+1?): %s",
+                               request.method, request.path, n, statement)
+
+        return response
+
+    @staticmethod
+    def _stop(_exc: BaseException | None) -> None:
+        """Stop collecting statistics for the current request."""
+        _, token = request.environ.pop("dndbehind.query_stats", (None, None))
+        if token is not None:
+            _collectors.reset(token)
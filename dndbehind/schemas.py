@@ -0,0 +1,153 @@
+"""Request body schemas for the DnD Behind API.
+
+Every schema is a msgspec Struct. The decoders for the schemas are compiled
+once at import time, and decode a raw request body into a typed object in a
+single pass, validating field presence, types and constraints on the way.
+"""
+from datetime import datetime
+from functools import wraps
+from typing import Annotated, Any, Callable, Literal
+
+import msgspec
+from flask import Response, request
+
+from .utils import make_standardized_response
+
+# Column length limits, as defined in models.py
+Name = Annotated[str, msgspec.Meta(min_length=1, max_length=254)]
+Password = Annotated[str, msgspec.Meta(min_length=1)]
+Description = Annotated[str, msgspec.Meta(max_length=100_000)]
+CharacterText = Annotated[str, msgspec.Meta(max_length=1_000_000)]
+# D&D 5E ability scores range from 1 to 30
+AbilityScore = Annotated[int, msgspec.Meta(ge=1, le=30)]
+
+UNSET = msgspec.UNSET
+UnsetType = msgspec.UnsetType
+
+
+class UserCreate(msgspec.Struct):
+    """Request body of POST /auth/user."""
+    username: Name
+    email: Name
+    password: Password
+
+
+class UserProvision(msgspec.Struct, forbid_unknown_fields=True):
+    """A user of POST /auth/users, with the names of its roles."""
+    username: Name
+    email: Name
+    password: Password
+    roles: list[Name] = msgspec.field(default_factory=list)
+
+
+class UserBulkCreate(msgspec.Struct, forbid_unknown_fields=True):
+    """Request body of POST /auth/users."""
+    users: Annotated[list[UserProvision], msgspec.Meta(min_length=1)]
+
+
+class UserUpdate(msgspec.Struct, forbid_unknown_fields=True):
+    """Request body of PUT/PATCH /auth/user/<user_id>.
+    All fields are optional; fields that are not present are left unchanged.
+    """
+    username: Name | UnsetType = UNSET
+    email: Name | UnsetType = UNSET
+    password: Password | UnsetType = UNSET
+    disabled: bool | UnsetType = UNSET
+    last_logged_in: datetime | None | UnsetType = UNSET
+
+
+class BackgroundCreate(msgspec.Struct):
+    """Request body of POST /background."""
+    name: Name
+    description: Description
+
+
+class CharacterCreate(msgspec.Struct, forbid_unknown_fields=True):
+    """Request body of POST /character."""
+    name: Name
+    strength: AbilityScore
+    dexterity: AbilityScore
+    constitution: AbilityScore
+    intelligence: AbilityScore
+    wisdom: AbilityScore
+    charisma: AbilityScore
+    background_id: int
+    description: CharacterText | None = None
+    backstory: CharacterText | None = None
+
+
+class CharacterUpdate(msgspec.Struct, forbid_unknown_fields=True):
+    """Request body of PATCH /character/<character_id> as a JSON Merge
+    Patch (RFC 7396). Fields that are not present are left unchanged; null
+    clears the description or backstory.
+    """
+    name: Name | UnsetType = UNSET
+    description: CharacterText | None | UnsetType = UNSET
+    backstory: CharacterText | None | UnsetType = UNSET
+    strength: AbilityScore | UnsetType = UNSET
+    dexterity: AbilityScore | UnsetType = UNSET
+    constitution: AbilityScore | UnsetType = UNSET
+    intelligence: AbilityScore | UnsetType = UNSET
+    wisdom: AbilityScore | UnsetType = UNSET
+    charisma: AbilityScore | UnsetType = UNSET
+    background_id: int | UnsetType = UNSET
+
+
+class PatchOperation(msgspec.Struct, forbid_unknown_fields=True):
+    """Operation of a JSON Patch (RFC 6902) request body."""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = UNSET
+    from_: str | UnsetType = msgspec.field(default=UNSET, name="from")
+
+
+def present_fields(body: msgspec.Struct) -> dict[str, Any]:
+    """Return the fields that were present in the decoded request body.
+
+    Args:
+        body (msgspec.Struct): decoded request body.
+
+    Returns:
+        dict[str, Any]: field names and values of all fields that are set.
+    """
+    return {
+        field: getattr(body, field)
+        for field in body.__struct_fields__
+        if getattr(body, field) is not UNSET
+    }
+
+
+def validated_body(schema: type[msgspec.Struct]) -> Callable:
+    """Decorator for views that take a JSON request body.
+    The request body is decoded and validated against the schema, and passed
+    to the view as the "body" keyword argument. Invalid bodies are rejected
+    with a 400 response before the view is called.
+
+    Args:
+        schema (type[msgspec.Struct]): schema of the request body.
+    """
+    decoder = msgspec.json.Decoder(schema)
+
+    def inner_decorator(fn: Callable) -> Callable:
+        """Inner decorator function to wrap the target function."""
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Response:
+            """Wrapper function to decode and validate the request body.
+
+            Returns:
+                Response: The result of the target function if the request
+                body is valid, or a JSON response with status code 400
+                describing the problem if it is not.
+            """
+            try:
+                body = decoder.decode(request.get_data(cache=False))
+            except msgspec.DecodeError as e:
+                return make_standardized_response(
+                    message=f"Invalid request body: {e}",
+                    status_code=400
+                )
+
+            return fn(*args, body=body, **kwargs)
+
+        return wrapper
+    return inner_decorator
@@ -0,0 +1,333 @@
+"""Synthetic data for capacity and load testing (`flask seed`).
+
+Generates users with roles, backgrounds and characters with realistic
+distributions:
+
+- Characters per owner are skewed: the first users own thousands of
+  characters, most users a handful, like the users of a real instance.
+- Description and backstory lengths are log-normal: mostly a few paragraphs,
+  with a long tail of epic backstories.
+- A small share of users is disabled or has the maintainer, operator or
+  admin role.
+
+Rows are generated lazily and inserted with one executemany per batch of
+batch_size rows, so memory use doesn't grow with the number of rows. Rows
+get explicit IDs following the existing ones, which lets characters refer to
+owners without reading IDs back; on PostgreSQL the ID sequences are moved
+past them afterwards.
+
+Texts are drawn from a pool of generated texts that is compressed once, so
+the compressed text columns cost no compression per row. Password hashing is
+done at most once: all generated users share one hash, or have none.
+"""
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator
+
+import click
+from flask.cli import with_appcontext
+import sqlalchemy as sa
+
+from .compressed import LazyText, codec
+from .history import FIELDS, dump
+from .models import Background, Character, CharacterHistory, Role, User, \
+    password_hasher, user_roles_table
+
+BATCH_SIZE = 10_000
+
+# Share of users with each role, and of disabled users
+ROLE_SHARES = {"maintainer": 0.01, "operator": 0.001, "admin": 0.0001}
+DISABLED_SHARE = 0.01
+
+# Distinct generated texts per column; rows sample from these
+TEXT_POOL_SIZE = 2_000
+
+_SENTENCES = (
+    "The wind howled over the ruined keep as our hero set out.",
+    "Raised by a travelling troupe, they learned every road by heart.",
+    "A debt to the thieves' guild still weighs on them.",
+    "Nobody in the village believed the tale of the silver dragon.",
+    "Their mentor vanished on the night of the red moon.",
+    "Old scars tell of a war they refuse to speak about.",
+    "Every coin earned goes to the temple that took them in.",
+    "They carry a letter they have never dared to open.",
+    "A rival from the academy has sworn to ruin them.",
+    "The sea took their family, and they mean to take something back.",
+    "Rumours of a lost library drew them north.",
+    "They trust dogs more than people, and with good reason.",
+    "An oath sworn in haste binds them to a forgotten god.",
+    "Songs about their exploits are mostly exaggerated.",
+    "The mark on their hand glows when danger is near.",
+    "They once stole a crown and gave it back the next day.",
+    "Their sister rules a city they are banished from.",
+    "A talking raven insists it is their grandfather.",
+    "They keep a journal of every monster they have met.",
+    "Gold means little to them; stories mean everything.",
+)
+_FIRST_NAMES = ("Aria", "Borin", "Cael", "Dara", "Elric", "Fenna", "Garrick",
+                "Hilde", "Ilya", "Joss", "Kestrel", "Lyra", "Merrin", "Nyx",
+                "Orin", "Perrin", "Quill", "Rowan", "Sable", "Theron")
+_EPITHETS = ("the Bold", "the Wise", "Ironhand", "of the Vale", "Stormborn",
+             "the Quiet", "Ashwalker", "the Lucky", "Brightblade",
+             "of House Vey")
+
+Progress = Callable[[str, int], None]
+
+
+def _batches(rows: Iterable[dict[str, Any]],
+             size: int) -> Iterator[list[dict[str, Any]]]:
+    """Group an iterable of rows in lists of at most size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(connection: sa.Connection, table: sa.Table,
+            rows: Iterable[dict[str, Any]], batch_size: int,
+            progress: Progress | None) -> int:
+    """Insert rows in batches.
+
+    Args:
+        connection (sa.Connection): connection to insert with.
+        table (sa.Table): the table.
+        rows (Iterable[dict[str, Any]]): the rows, generated lazily.
+        batch_size (int): rows per executemany.
+        progress (Progress | None): called with the table name and the
+                                    number of rows inserted so far.
+
+    Returns:
+        int: number of inserted rows.
+    """
+    count = 0
+    for batch in _batches(rows, batch_size):
+        connection.execute(sa.insert(table), batch)
+        count += len(batch)
+        if progress is not None:
+            progress(table.name, count)
+    return count
+
+
+def _text_pool(rng: random.Random, mu: float, sigma: float,
+               max_length: int) -> list[LazyText]:
+    """Generate texts with log-normally distributed lengths, compressed.
+
+    Args:
+        rng (random.Random): random number generator.
+        mu (float): mean of the logarithm of the length.
+        sigma (float): standard deviation of the logarithm of the length.
+        max_length (int): maximum length.
+
+    Returns:
+        list[LazyText]: the texts, holding their stored form.
+    """
+    pool = []
+    for _ in range(TEXT_POOL_SIZE):
+        length = min(int(rng.lognormvariate(mu, sigma)), max_length)
+        sentences = []
+        total = 0
+        while total < length:
+            sentence = rng.choice(_SENTENCES)
+            sentences.append(sentence)
+            total += len(sentence) + 1
+        pool.append(LazyText(codec.compress(" ".join(sentences)[:length])))
+    return pool
+
+
+def _next_id(connection: sa.Connection, model: type) -> int:
+    """Return the ID after the highest ID of a table."""
+    return (connection.scalar(sa.select(sa.func.max(model.id))) or 0) + 1
+
+
+def _role_ids(connection: sa.Connection) -> dict[str, int]:
+    """Return the IDs of the seeded roles, creating missing roles."""
+    role_ids = dict(connection.execute(
+        sa.select(Role.name, Role.id)
+        .where(Role.name.in_(ROLE_SHARES))).all())
+    for name in ROLE_SHARES:
+        if name not in role_ids:
+            role_ids[name] = connection.scalar(
+                sa.insert(Role).returning(Role.id),
+                {"name": name, "description": f"{name.capitalize()} role"})
+    return role_ids
+
+
+def _sync_sequences(connection: sa.Connection,
+                    models: Iterable[type]) -> None:
+    """Move PostgreSQL ID sequences past explicitly inserted IDs."""
+    if connection.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = connection.dialect.identifier_preparer.quote(
+            model.__table__.name)
+        connection.execute(sa.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"max(id)) FROM {table} HAVING max(id) IS NOT NULL"))
+
+
+def seed(connection: sa.Connection, users: int, characters: int,
+         backgrounds: int = 100, seed_value: int = 42,
+         password_hash: str | None = None, history: bool = False,
+         batch_size: int = BATCH_SIZE,
+         progress: Progress | None = None) -> dict[str, int]:
+    """Insert generated users, roles, backgrounds and characters.
+    Existing rows are kept; the new rows get the following IDs.
+
+    Args:
+        connection (sa.Connection): connection to insert with; not
+                                    committed.
+        users (int): number of users.
+        characters (int): number of characters, owned by the new users.
+        backgrounds (int, optional): number of backgrounds. Defaults to 100.
+        seed_value (int, optional): random seed. Defaults to 42.
+        password_hash (str | None, optional): password hash of all users.
+                                              Defaults to None: users can't
+                                              log in.
+        history (bool, optional): whether to record version 1 of every
+                                  character in the history, as the ORM
+                                  does. Defaults to False.
+        batch_size (int, optional): rows per executemany. Defaults to
+                                    BATCH_SIZE.
+        progress (Progress | None, optional): called with a table name and
+                                              the number of rows inserted
+                                              into it so far, after every
+                                              batch. Defaults to None.
+
+    Raises:
+        ValueError: raised when characters are requested without users or
+                    backgrounds.
+
+    Returns:
+        dict[str, int]: number of inserted rows per table.
+    """
+    if characters and not (users and backgrounds):
+        raise ValueError("Characters need users and backgrounds")
+    rng = random.Random(seed_value)
+    counts = {}
+
+    first_user = _next_id(connection, User)
+    user_ids = range(first_user, first_user + users)
+    counts["user"] = _insert(connection, User.__table__, (
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+         "password_hash": password_hash,
+         "disabled": rng.random() < DISABLED_SHARE}
+        for i in user_ids), batch_size, progress)
+
+    role_ids = _role_ids(connection)
+    counts["user_role"] = _insert(connection, user_roles_table, (
+        {"user_id": i, "role_id": role_ids[name]}
+        for i in user_ids
+        for name, share in ROLE_SHARES.items() if rng.random() < share),
+        batch_size, progress)
+
+    first_background = _next_id(connection, Background)
+    descriptions = _text_pool(rng, 6, 0.8, 100_000)
+    counts["background"] = _insert(connection, Background.__table__, (
+        {"id": i, "name": f"Background {i}",
+         "description": rng.choice(descriptions)}
+        for i in range(first_background, first_background + backgrounds)),
+        batch_size, progress)
+
+    # Mostly a few paragraphs (median ~150 and ~1100 characters), some epic
+    character_descriptions = _text_pool(rng, 5, 0.8, 1_000_000)
+    backstories = _text_pool(rng, 7, 1.2, 1_000_000)
+
+    def generate_characters() -> Iterator[dict[str, Any]]:
+        """Generate the character rows."""
+        first = _next_id(connection, Character)
+        for i in range(first, first + characters):
+            yield {
+                "id": i,
+                "name": f"{rng.choice(_FIRST_NAMES)} "
+                        f"{rng.choice(_EPITHETS)}",
+                "description": rng.choice(character_descriptions),
+                "backstory": rng.choice(backstories),
+                "strength": rng.randint(3, 18),
+                "dexterity": rng.randint(3, 18),
+                "constitution": rng.randint(3, 18),
+                "intelligence": rng.randint(3, 18),
+                "wisdom": rng.randint(3, 18),
+                "charisma": rng.randint(3, 18),
+                # Skewed: the first users own the most characters
+                "owner_id": first_user + int(users * rng.random() ** 3),
+                "background_id": first_background + rng.randrange(
+                    backgrounds),
+                "version": 1,
+            }
+
+    if not history:
+        counts["character"] = _insert(connection, Character.__table__,
+                                      generate_characters(), batch_size,
+                                      progress)
+    else:
+        counts["character"] = counts["character_history"] = 0
+        created_at = datetime.now(timezone.utc)
+        for batch in _batches(generate_characters(), batch_size):
+            counts["character"] += _insert(
+                connection, Character.__table__, batch, batch_size, None)
+            counts["character_history"] += _insert(
+                connection, CharacterHistory.__table__, (
+                    {"character_id": row["id"], "version": 1,
+                     "created_at": created_at, "snapshot": True,
+                     "changed": list(FIELDS),
+                     "data": dump({field: str(row[field])
+                                   if field in ("description", "backstory")
+                                   else row[field] for field in FIELDS})}
+                    for row in batch), batch_size, None)
+            if progress is not None:
+                progress("character", counts["character"])
+
+    _sync_sequences(connection, (User, Background, Character))
+    return counts
+
+
+@click.command("seed")
+@click.option("--users", type=int, default=10_000, show_default=True,
+              help="Users to create.")
+@click.option("--characters", type=int, default=100_000, show_default=True,
+              help="Characters to create.")
+@click.option("--backgrounds", type=int, default=100, show_default=True,
+              help="Backgrounds to create.")
+@click.option("--password", default="password", show_default=True,
+              help="Password of all users, hashed once.")
+@click.option("--no-passwords", is_flag=True,
+              help="Don't hash a password; the users can't log in.")
+@click.option("--history", is_flag=True,
+              help="Record version 1 of every character in the history.")
+@click.option("--batch-size", type=int, default=BATCH_SIZE,
+              show_default=True, help="Rows per insert statement.")
+@click.option("--seed", "seed_value", type=int, default=42,
+              show_default=True, help="Random seed.")
+@with_appcontext
+def seed_cli(users: int, characters: int, backgrounds: int, password: str,
+             no_passwords: bool, history: bool, batch_size: int,
+             seed_value: int) -> None:
+    """Fill the database with generated data for capacity testing."""
+    from . import db
+
+    password_hash = None if no_passwords \
+        else password_hasher().hash(password)
+    start = last_report = time.perf_counter()
+
+    def report(table: str, rows: int) -> None:
+        """Print the progress at most every few seconds."""
+        nonlocal last_report
+        now = time.perf_counter()
+        if now - last_report >= 5:
+            last_report = now
+            click.echo(f"{table}: {rows} rows")
+
+    counts = seed(db.session.connection(), users, characters, backgrounds,
+                  seed_value, password_hash, history, batch_size, report)
+    db.session.commit()
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    for table, rows in counts.items():
+        click.echo(f"{table}: {rows} rows")
+    click.echo(f"Inserted {total} rows in {elapsed:.1f} s "
+               f"({total / max(elapsed, 1e-9):.0f} rows/s).")
@@ -0,0 +1,237 @@
+"""Fast JSON serialization for the DnD Behind API.
+
+The JSON provider in this module replaces Flask's default provider, which is
+built on the standard library :mod:`json` module. When `orjson` or `msgspec`
+is installed, it is used for both encoding and decoding; otherwise the
+standard library is used as a fallback. All backends serialize
+:class:`datetime.datetime` values to ISO 8601 strings, so the output does not
+depend on which backend happens to be installed.
+"""
+import importlib
+import json
+from collections import UserString
+from datetime import date, datetime
+from typing import Any, Callable
+
+import sqlalchemy as sa
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+
+# Preferred backends, fastest first. "auto" picks the first installed one.
+BACKENDS = ("orjson", "msgspec", "stdlib")
+
+
+def _default(o: Any) -> Any:
+    """Serialize objects the JSON backends don't know how to handle.
+
+    Args:
+        o (Any): object to serialize.
+
+    Returns:
+        Any: JSON serializable representation of the object.
+    """
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, UserString):
+        # e.g. LazyText, decompressed only now
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+
+def _orjson_codec(sort_keys: bool) -> tuple[Callable, Callable, Callable]:
+    """Build encode and decode functions backed by orjson.
+
+    Args:
+        sort_keys (bool): whether to sort the keys of serialized dicts.
+
+    Returns:
+        tuple[Callable, Callable, Callable]: compact encoder, indenting
+                                             encoder and decoder.
+    """
+    orjson = importlib.import_module("orjson")
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+
+    def encode(obj: Any) -> bytes:
+        """Encode obj to compact JSON."""
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def encode_indented(obj: Any) -> bytes:
+        """Encode obj to indented JSON."""
+        return orjson.dumps(obj,
+                            default=_default,
+                            option=option | orjson.OPT_INDENT_2)
+
+    return encode, encode_indented, orjson.loads
+
+
+def _msgspec_codec(sort_keys: bool) -> tuple[Callable, Callable, Callable]:
+    """Build encode and decode functions backed by msgspec.
+
+    Args:
+        sort_keys (bool): whether to sort the keys of serialized dicts.
+
+    Returns:
+        tuple[Callable, Callable, Callable]: compact encoder, indenting
+                                             encoder and decoder.
+    """
+    msgspec = importlib.import_module("msgspec")
+    encoder = msgspec.json.Encoder(enc_hook=_default,
+                                   order="sorted" if sort_keys else None)
+    decoder = msgspec.json.Decoder()
+
+    def encode_indented(obj: Any) -> bytes:
+        """Encode obj to indented JSON."""
+        return msgspec.json.format(encoder.encode(obj), indent=2)
+
+    def decode(s: str | bytes) -> Any:
+        """Decode JSON, raising ValueError on malformed input."""
+        # Werkzeug only turns ValueError into a "400 Bad Request".
+        try:
+            return decoder.decode(s)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    return encoder.encode, encode_indented, decode
+
+
+def _stdlib_codec(sort_keys: bool) -> tuple[Callable, Callable, Callable]:
+    """Build encode and decode functions backed by the standard library.
+
+    Args:
+        sort_keys (bool): whether to sort the keys of serialized dicts.
+
+    Returns:
+        tuple[Callable, Callable, Callable]: compact encoder, indenting
+                                             encoder and decoder.
+    """
+    compact = json.JSONEncoder(default=_default,
+                               ensure_ascii=False,
+                               sort_keys=sort_keys,
+                               separators=(",", ":"))
+    indented = json.JSONEncoder(default=_default,
+                                ensure_ascii=False,
+                                sort_keys=sort_keys,
+                                indent=2)
+
+    def encode(obj: Any) -> bytes:
+        """Encode obj to compact JSON."""
+        return compact.encode(obj).encode("utf-8")
+
+    def encode_indented(obj: Any) -> bytes:
+        """Encode obj to indented JSON."""
+        return indented.encode(obj).encode("utf-8")
+
+    return encode, encode_indented, json.loads
+
+
+_CODECS = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "stdlib": _stdlib_codec,
+}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using the fastest available JSON library.
+
+    Responses are encoded straight to UTF-8 bytes, skipping the intermediate
+    ``str`` the default provider creates. Keys are not sorted by default,
+    so objects keep the field order of the ``as_dict`` methods.
+    """
+    ensure_ascii = False
+    sort_keys = False
+
+    def __init__(self, app: Flask, backend: str = "auto") -> None:
+        """Initialize the provider and select a JSON backend.
+
+        Args:
+            app (Flask): the Flask application to provide JSON for.
+            backend (str, optional): one of "orjson", "msgspec", "stdlib" or
+                                     "auto". Defaults to "auto", which uses
+                                     the first installed backend.
+
+        Raises:
+            ValueError: raised when an unknown backend is requested.
+            ImportError: raised when the requested backend is not installed.
+        """
+        super().__init__(app)
+
+        if backend != "auto" and backend not in _CODECS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+
+        candidates = BACKENDS if backend == "auto" else (backend,)
+        for candidate in candidates:
+            try:
+                self._encode, self._encode_indented, self._decode = \
+                    _CODECS[candidate](self.sort_keys)
+            except ImportError:
+                if backend != "auto":
+                    raise
+                continue
+            self.backend = candidate
+            break
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serialize data as JSON to a string.
+
+        Args:
+            obj (Any): the data to serialize.
+            kwargs (Any): only "indent" is honoured, other arguments are
+                          accepted for compatibility and ignored.
+
+        Returns:
+            str: JSON document.
+        """
+        if kwargs.get("indent"):
+            return self._encode_indented(obj).decode("utf-8")
+        return self._encode(obj).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        """Deserialize data as JSON from a string or bytes.
+
+        Args:
+            s (str | bytes): text or UTF-8 bytes.
+            kwargs (Any): accepted for compatibility and ignored.
+
+        Returns:
+            Any: the deserialized data.
+        """
+        return self._decode(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        """Serialize the given arguments as JSON into a Response object.
+
+        Either positional or keyword arguments can be given, not both.
+
+        Returns:
+            Response: Flask Response object with JSON data.
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+
+        if (self.compact is None and self._app.debug) or \
+                self.compact is False:
+            body = self._encode_indented(obj)
+        else:
+            body = self._encode(obj)
+
+        return self._app.response_class(body + b"\n",
+                                        mimetype=self.mimetype)
+
+
+def rows_as_dicts(result: sa.Result) -> list[dict[str, Any]]:
+    """Convert the rows of a column-based query result to dictionaries.
+
+    Selecting columns instead of entities skips ORM object hydration and the
+    identity map, which is considerably cheaper for large list endpoints.
+
+    Args:
+        result (sa.Result): result of a query selecting columns, such as
+                            ``sa.select(*Model.as_dict_columns())``.
+
+    Returns:
+        list[dict[str, Any]]: one dictionary per row, keyed by column name.
+    """
+    keys = tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
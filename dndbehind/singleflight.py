@@ -0,0 +1,186 @@
+"""Coalescing of concurrent identical reads ("single flight").
+
+When a character link is shared, many clients request the same resource at
+the same moment, and each request would run the same queries and
+serialization. SingleFlight lets the first of several concurrent identical
+requests (the leader) do the work, while the others wait for its result
+instead of repeating it. Nothing is cached: a request arriving after the
+leader finished starts a new flight, so results are never older than the
+requests they answer.
+
+Only the work that is the same for every caller is shared. Views verify the
+caller's access before joining a flight, and the key must include whatever
+else makes the result caller-specific. Results are shared between threads
+and must not be modified; shared_response hands every caller its own copy of
+the response.
+
+Threads of a worker coalesce through SingleFlight.do, async views through
+SingleFlight.do_async; the two don't coalesce with each other.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from flask import Flask, Response, current_app
+
+from .metrics import SINGLE_FLIGHT_REQUESTS
+
+T = TypeVar("T")
+
+
+class _Call:
+    """A computation in flight and the callers waiting for it."""
+
+    def __init__(self) -> None:
+        """Initialize a call without a result."""
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Flask extension sharing in-flight computations between callers."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._async_calls: dict[Hashable, asyncio.Future] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the extension with an application.
+
+        Args:
+            app (Flask): the Flask application.
+        """
+        app.extensions["single_flight"] = self
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run a computation, or wait for the identical one in flight.
+
+        Args:
+            key (Hashable): identifies the computation; calls with equal keys
+                            must compute the same result.
+            fn (Callable[[], T]): the computation.
+
+        Raises:
+            BaseException: the error of the computation, raised in every
+                           caller sharing it.
+
+        Returns:
+            T: the result of the computation.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            SINGLE_FLIGHT_REQUESTS.labels("shared").inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLE_FLIGHT_REQUESTS.labels("leader").inc()
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable,
+                       fn: Callable[[], Awaitable[T]]) -> T:
+        """Run a coroutine, or wait for the identical one in flight.
+        Must be called from a single event loop.
+
+        Args:
+            key (Hashable): identifies the computation; calls with equal keys
+                            must compute the same result.
+            fn (Callable[[], Awaitable[T]]): function returning the
+                                             coroutine.
+
+        Raises:
+            BaseException: the error of the computation, raised in every
+                           caller sharing it.
+
+        Returns:
+            T: the result of the computation.
+        """
+        future = self._async_calls.get(key)
+        if future is not None:
+            SINGLE_FLIGHT_REQUESTS.labels("shared").inc()
+            # A cancelled waiter must not cancel the leader's computation
+            return await asyncio.shield(future)
+
+        SINGLE_FLIGHT_REQUESTS.labels("leader").inc()
+        future = self._async_calls[key] = \
+            asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception, in case no one else waits for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[key]
+
+
+def shared(key: Hashable, fn: Callable[[], T]) -> T:
+    """Run a computation of a request, sharing it with identical concurrent
+    requests to the current application.
+
+    Args:
+        key (Hashable): identifies the computation; the endpoint, its
+                        arguments and anything else the result depends on.
+                        Access must be checked before.
+        fn (Callable[[], T]): the computation.
+
+    Returns:
+        T: the result of the computation, which must not be modified.
+    """
+    if not current_app.config["SINGLE_FLIGHT_ENABLED"]:
+        return fn()
+    return current_app.extensions["single_flight"].do(
+        (id(current_app._get_current_object()), key), fn)
+
+
+def shared_response(key: Hashable, fn: Callable[[], Response]) -> Response:
+    """Build a response, sharing the work with identical concurrent requests.
+
+    Args:
+        key (Hashable): identifies the response, as for shared.
+        fn (Callable[[], Response]): function building the response.
+
+    Returns:
+        Response: a response of its own for the caller, with the status,
+                  headers and body built by the leader.
+    """
+    def build() -> tuple[bytes, int, list[tuple[str, str]]]:
+        """Build the response and keep what is needed to copy it."""
+        response = fn()
+        return (response.get_data(), response.status_code,
+                list(response.headers.items()))
+
+    body, status, headers = shared(key, build)
+    return current_app.response_class(body, status, headers)
@@ -0,0 +1,26 @@
+"""One-off initialization of an application before it serves requests.
+
+Kept apart from the entry modules, which create their application on import.
+"""
+from flask import Flask
+import sqlalchemy.orm as orm
+
+from . import db
+from .models import password_hasher
+
+
+def warm_up(app: Flask) -> None:
+    """Do one-off initialization work before the application serves requests.
+    When the application is preloaded in the gunicorn master process, this
+    work is done once and shared with all workers through copy-on-write,
+    instead of being repeated in every worker on its first request.
+
+    Args:
+        app (Flask): the application to warm up.
+    """
+    with app.app_context():
+        # Imports argon2, which is otherwise imported on first use
+        password_hasher()
+        orm.configure_mappers()
+        # Pooled connections must not be shared between forked workers
+        db.engine.dispose()
@@ -0,0 +1,281 @@
+"""Signing and verification of access tokens.
+
+TokenManager extends Flask-JWT-Extended's JWTManager with two features:
+
+- A bounded per-process cache of verified token payloads, keyed by the
+  SHA-256 digest of the token. Clients send the same token with every
+  request until it expires, so the signature is checked once per worker
+  instead of once per request. Cached payloads are only used until the
+  token's "exp"; blocklist checks and user lookups still run per request.
+- Ed25519 ("EdDSA") signing keys with rotation by key ID. Tokens carry the
+  "kid" of the key that signed them, and are verified with the public key of
+  that ID. The public keys are served as a JSON Web Key Set on
+  /auth/jwks.json, so other services can verify tokens without calling us.
+
+With the default HS256 algorithm tokens are signed with JWT_SECRET_KEY, as
+before.
+"""
+import base64
+import glob
+import hashlib
+import importlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config as jwt_config
+from flask_jwt_extended.default_callbacks import \
+    default_decode_key_callback, default_encode_key_callback
+import jwt
+
+from .metrics import JWT_DECODE_CACHE
+
+
+class KeyRing:
+    """Ed25519 keys to sign tokens with and to verify them with."""
+
+    def __init__(self, directory: str, signing_kid: str | None) -> None:
+        """Load the keys of a directory.
+        Every <kid>.pem file holds a private key, or the public key of a
+        retired private key whose tokens are still accepted.
+
+        Args:
+            directory (str): the directory.
+            signing_kid (str | None): ID of the private key to sign with.
+
+        Raises:
+            ValueError: raised when a key isn't an Ed25519 key, or the
+                        signing key is missing.
+        """
+        serialization = importlib.import_module(
+            "cryptography.hazmat.primitives.serialization")
+        ed25519 = importlib.import_module(
+            "cryptography.hazmat.primitives.asymmetric.ed25519")
+
+        self.signing_kid = signing_kid
+        self.signing_key = None
+        self.public_keys: dict[str, Any] = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*.pem"))):
+            kid = os.path.basename(path)[:-len(".pem")]
+            with open(path, "rb") as f:
+                data = f.read()
+            if b"PRIVATE KEY" in data:
+                key = serialization.load_pem_private_key(data, password=None)
+                if not isinstance(key, ed25519.Ed25519PrivateKey):
+                    raise ValueError(f"{path} isn't an Ed25519 key")
+                if kid == signing_kid:
+                    self.signing_key = key
+                key = key.public_key()
+            else:
+                key = serialization.load_pem_public_key(data)
+                if not isinstance(key, ed25519.Ed25519PublicKey):
+                    raise ValueError(f"{path} isn't an Ed25519 key")
+            self.public_keys[kid] = key
+
+        if self.signing_key is None:
+            raise ValueError(
+                f"No private key {signing_kid}.pem in {directory}")
+
+    def jwks(self) -> dict[str, list[dict[str, str]]]:
+        """Return the public keys as a JSON Web Key Set (RFC 8037).
+
+        Returns:
+            dict[str, list[dict[str, str]]]: the key set.
+        """
+        serialization = importlib.import_module(
+            "cryptography.hazmat.primitives.serialization")
+        keys = []
+        for kid, key in self.public_keys.items():
+            raw = key.public_bytes(serialization.Encoding.Raw,
+                                   serialization.PublicFormat.Raw)
+            keys.append({
+                "kty": "OKP",
+                "crv": "Ed25519",
+                "alg": "EdDSA",
+                "use": "sig",
+                "kid": kid,
+                "x": base64.urlsafe_b64encode(raw).rstrip(b"=").decode(),
+            })
+        return {"keys": keys}
+
+
+class TokenCache:
+    """Bounded LRU cache of verified token payloads."""
+
+    def __init__(self, max_size: int) -> None:
+        """Initialize an empty cache.
+
+        Args:
+            max_size (int): maximum number of payloads; 0 disables the
+                            cache.
+        """
+        self.max_size = max_size
+        self._payloads: OrderedDict[bytes, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes, leeway: float) -> dict[str, Any] | None:
+        """Look up the payload of a token that hasn't expired yet.
+
+        Args:
+            digest (bytes): digest of the token.
+            leeway (float): seconds a token is accepted after its "exp".
+
+        Returns:
+            dict[str, Any] | None: the payload, or None if it isn't cached or
+                                   the token expired.
+        """
+        with self._lock:
+            payload = self._payloads.get(digest)
+            if payload is None:
+                return None
+            exp = payload.get("exp")
+            if exp is not None and time.time() > exp + leeway:
+                del self._payloads[digest]
+                return None
+            self._payloads.move_to_end(digest)
+            return payload
+
+    def put(self, digest: bytes, payload: dict[str, Any]) -> None:
+        """Cache the payload of a verified token.
+
+        Args:
+            digest (bytes): digest of the token.
+            payload (dict[str, Any]): its payload.
+        """
+        with self._lock:
+            self._payloads[digest] = payload
+            self._payloads.move_to_end(digest)
+            while len(self._payloads) > self.max_size:
+                self._payloads.popitem(last=False)
+
+
+def _encode_key(identity: Any) -> Any:
+    """Return the key to sign a token with."""
+    keys = current_app.extensions["jwt_keys"]
+    if keys is None:
+        return default_encode_key_callback(identity)
+    return keys.signing_key
+
+
+def _decode_key(jwt_header: dict[str, Any], jwt_data: dict[str, Any]) -> Any:
+    """Return the key to verify a token with, chosen by its "kid"."""
+    keys = current_app.extensions["jwt_keys"]
+    if keys is None:
+        return default_decode_key_callback(jwt_header, jwt_data)
+    try:
+        return keys.public_keys[jwt_header["kid"]]
+    except KeyError:
+        raise jwt.InvalidTokenError("Unknown signing key")
+
+
+def _additional_headers(_identity: Any) -> dict[str, str]:
+    """Return the "kid" header of new tokens."""
+    keys = current_app.extensions["jwt_keys"]
+    return {} if keys is None else {"kid": keys.signing_kid}
+
+
+class TokenManager(JWTManager):
+    """JWTManager caching verified tokens and supporting Ed25519 keys."""
+
+    def __init__(self, app: Flask | None = None,
+                 add_context_processor: bool = False) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+            add_context_processor (bool, optional): passed on to
+                                                    JWTManager. Defaults to
+                                                    False.
+        """
+        super().__init__(add_context_processor=add_context_processor)
+        self.encode_key_loader(_encode_key)
+        self.decode_key_loader(_decode_key)
+        self.additional_headers_loader(_additional_headers)
+        if app is not None:
+            self.init_app(app, add_context_processor)
+
+    def init_app(self, app: Flask,
+                 add_context_processor: bool = False) -> None:
+        """Load the keys and create the token cache of an application.
+
+        Args:
+            app (Flask): the Flask application.
+            add_context_processor (bool, optional): passed on to
+                                                    JWTManager. Defaults to
+                                                    False.
+        """
+        super().init_app(app, add_context_processor)
+        keys = None
+        if app.config["JWT_ALGORITHM"] == "EdDSA":
+            keys = KeyRing(app.config["JWT_KEYS_DIR"],
+                           app.config["JWT_KEY_ID"])
+        app.extensions["jwt_keys"] = keys
+        app.extensions["jwt_cache"] = TokenCache(app.config["JWT_CACHE_SIZE"])
+
+    def _decode_jwt_from_config(self, encoded_token: str, csrf_value=None,
+                                allow_expired: bool = False) -> dict:
+        """Verify a token, or return its cached payload.
+        Overrides the method every verification of Flask-JWT-Extended
+        (verify_jwt_in_request, decode_token) goes through.
+
+        Args:
+            encoded_token (str): the token.
+            csrf_value (optional): CSRF token of cookie-based tokens, which
+                                   are not cached. Defaults to None.
+            allow_expired (bool, optional): whether to accept expired
+                                            tokens, which are not cached.
+                                            Defaults to False.
+
+        Returns:
+            dict: the payload of the token.
+        """
+        cache = current_app.extensions["jwt_cache"]
+        if allow_expired or csrf_value is not None or not cache.max_size:
+            return super()._decode_jwt_from_config(
+                encoded_token, csrf_value, allow_expired)
+
+        digest = hashlib.sha256(encoded_token.encode("utf-8")).digest()
+        payload = cache.get(digest, jwt_config.leeway)
+        if payload is not None:
+            JWT_DECODE_CACHE.labels("hit").inc()
+        else:
+            JWT_DECODE_CACHE.labels("miss").inc()
+            payload = super()._decode_jwt_from_config(encoded_token)
+            cache.put(digest, payload)
+        # Callers get their own copy of the shared payload
+        return dict(payload)
+
+
+@click.group("jwt-keys")
+def jwt_keys_cli() -> None:
+    """Manage the Ed25519 keys access tokens are signed with."""
+
+
+@jwt_keys_cli.command("generate")
+@click.argument("kid")
+@with_appcontext
+def generate(kid: str) -> None:
+    """Write a new private key KID.pem to JWT_KEYS_DIR."""
+    serialization = importlib.import_module(
+        "cryptography.hazmat.primitives.serialization")
+    ed25519 = importlib.import_module(
+        "cryptography.hazmat.primitives.asymmetric.ed25519")
+
+    directory = current_app.config["JWT_KEYS_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kid}.pem")
+    pem = ed25519.Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    # Exclusive creation never overwrites a key
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600),
+              "wb") as f:
+        f.write(pem)
+    click.echo(f"Wrote {path}. Set JWT_KEY_ID={kid} to sign with it.")
@@ -0,0 +1,219 @@
+"""OpenTelemetry tracing for the DnD Behind API.
+
+Every request gets a server span, with child spans for JWT verification, the
+JWT user lookup, RBAC checks, every SQL statement, Argon2 hashing, the login
+time update and token creation. Incoming W3C traceparent headers are
+honoured.
+
+The instrumentation only uses the OpenTelemetry API: without a configured
+tracer provider all spans are no-ops. TRACING_EXPORTER selects where spans go
+(requires the `tracing` extra):
+
+    console  print spans to stdout
+    file     append spans as JSON lines to TRACING_FILE
+    otlp     send spans to an OTLP/HTTP collector, configured with the
+             standard OTEL_EXPORTER_OTLP_* environment variables
+    external use the tracer provider configured outside the application,
+             e.g. by opentelemetry-instrument
+
+The tracer provider is global to the process, so the exporter is installed
+once, by the first application configuring one; applications created later
+in the same process (tests, the CLI) share it. Other exporters can be
+plugged in with add_exporter().
+"""
+import importlib
+import json
+from typing import Any
+
+import sqlalchemy as sa
+from flask import Flask, Response, request
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer("dndbehind")
+
+# TRACING_EXPORTER installed in this process, if any
+_installed_exporter: str | None = None
+
+
+def add_exporter(exporter: Any, batch: bool = True) -> None:
+    """Send all spans to an exporter.
+    Installs an SDK tracer provider first if none is configured yet.
+
+    Args:
+        exporter (SpanExporter): OpenTelemetry SDK span exporter.
+        batch (bool, optional): export spans in batches from a background
+                                thread, rather than as each span ends.
+                                Defaults to True.
+    """
+    sdk_trace = importlib.import_module("opentelemetry.sdk.trace")
+    sdk_export = importlib.import_module("opentelemetry.sdk.trace.export")
+    sdk_resources = importlib.import_module("opentelemetry.sdk.resources")
+
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, sdk_trace.TracerProvider):
+        provider = sdk_trace.TracerProvider(resource=sdk_resources.Resource(
+            {"service.name": "dndbehind"}))
+        trace.set_tracer_provider(provider)
+
+    processor = sdk_export.BatchSpanProcessor if batch \
+        else sdk_export.SimpleSpanProcessor
+    provider.add_span_processor(processor(exporter))
+
+
+def _console_exporter(app: Flask) -> Any:
+    """Build an exporter printing spans to stdout."""
+    sdk_export = importlib.import_module("opentelemetry.sdk.trace.export")
+    return sdk_export.ConsoleSpanExporter()
+
+
+def _file_exporter(app: Flask) -> Any:
+    """Build an exporter appending spans as JSON lines to TRACING_FILE."""
+    sdk_export = importlib.import_module("opentelemetry.sdk.trace.export")
+
+    class FileSpanExporter(sdk_export.ConsoleSpanExporter):
+        """Console exporter closing its file when the provider shuts down."""
+
+        def shutdown(self) -> None:
+            """Close the file."""
+            self.out.close()
+
+    out = open(app.config["TRACING_FILE"], "a", encoding="utf-8")
+    return FileSpanExporter(
+        out=out,
+        formatter=lambda span: json.dumps(json.loads(span.to_json())) + "\n")
+
+
+def _otlp_exporter(app: Flask) -> Any:
+    """Build an exporter sending spans to an OTLP/HTTP collector."""
+    otlp = importlib.import_module(
+        "opentelemetry.exporter.otlp.proto.http.trace_exporter")
+    return otlp.OTLPSpanExporter()
+
+
+_EXPORTERS = {
+    "console": _console_exporter,
+    "file": _file_exporter,
+    "otlp": _otlp_exporter,
+}
+
+
+@sa.event.listens_for(sa.Engine, "before_cursor_execute")
+def _start_statement_span(conn: sa.Connection, cursor: Any,
+                          statement: str, parameters: Any,
+                          context: Any, executemany: bool) -> None:
+    """Start a span for an SQL statement."""
+    if not trace.get_current_span().is_recording():
+        return
+
+    span = tracer.start_span(
+        statement.split(None, 1)[0] if statement else "SQL",
+        kind=SpanKind.CLIENT,
+        attributes={"db.system": conn.dialect.name,
+                    "db.statement": statement})
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+@sa.event.listens_for(sa.Engine, "after_cursor_execute")
+def _end_statement_span(conn: sa.Connection, cursor: Any,
+                        statement: str, parameters: Any,
+                        context: Any, executemany: bool) -> None:
+    """End the span of an SQL statement."""
+    if conn.info.get("trace_spans"):
+        conn.info["trace_spans"].pop().end()
+
+
+@sa.event.listens_for(sa.Engine, "handle_error")
+def _fail_statement_span(exception_context: Any) -> None:
+    """End the span of a failed SQL statement."""
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("trace_spans"):
+        span = conn.info["trace_spans"].pop()
+        span.record_exception(exception_context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
+
+class Tracing:
+    """Flask extension creating a span for every request."""
+
+    def __init__(self, app: Flask | None = None) -> None:
+        """Initialize the extension.
+
+        Args:
+            app (Flask | None, optional): application to initialize the
+                                          extension for. Defaults to None.
+        """
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Register the request hooks and configure the exporter.
+
+        Args:
+            app (Flask): the Flask application.
+
+        Raises:
+            ValueError: raised when TRACING_EXPORTER is unknown.
+        """
+        global _installed_exporter
+
+        exporter = app.config["TRACING_EXPORTER"]
+        if exporter == "none":
+            return
+        if exporter not in _EXPORTERS and exporter != "external":
+            raise ValueError(f"Unknown TRACING_EXPORTER {exporter!r}")
+
+        if exporter != "external" and _installed_exporter is None:
+            add_exporter(_EXPORTERS[exporter](app))
+            _installed_exporter = exporter
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._end)
+
+    @staticmethod
+    def _start() -> None:
+        """Start the span of the current request."""
+        route = request.url_rule.rule if request.url_rule else request.path
+        span = tracer.start_span(
+            f"{request.method} {route}",
+            context=propagate.extract(request.headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": request.method,
+                        "http.route": route,
+                        "url.path": request.path})
+        request.environ["dndbehind.trace_span"] = (
+            span, context.attach(trace.set_span_in_context(span)))
+
+    @staticmethod
+    def _finish(response: Response) -> Response:
+        """Record the response status on the span of the current request.
+
+        Args:
+            response (Response): the response to the current request.
+
+        Returns:
+            Response: the unmodified response.
+        """
+        span, _ = request.environ.get("dndbehind.trace_span", (None, None))
+        if span is not None:
+            span.set_attribute("http.response.status_code",
+                               response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+        return response
+
+    @staticmethod
+    def _end(exc: BaseException | None) -> None:
+        """End the span of the current request."""
+        span, token = request.environ.pop("dndbehind.trace_span",
+                                          (None, None))
+        if span is None:
+            return
+
+        if exc is not None:
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        context.detach(token)
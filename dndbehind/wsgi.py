@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers.
+
+Run with gunicorn, using the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py dndbehind.wsgi:app
+"""
+from . import create_app
+from .startup import warm_up
+
+app = create_app()
+warm_up(app)
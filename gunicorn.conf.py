@@ -0,0 +1,68 @@
+"""Gunicorn configuration, tunable through environment variables.
+
+    WEB_CONCURRENCY      number of worker processes (default: 2 * CPUs + 1)
+    GUNICORN_THREADS     threads per worker; more than 1 selects the gthread
+                         worker class (default: 4)
+    GUNICORN_KEEPALIVE   seconds to keep idle connections open (default: 5)
+    GUNICORN_TIMEOUT     seconds before a silent worker is restarted
+                         (default: 30)
+    GUNICORN_PRELOAD     "true" to import and warm up the application in the
+                         master process before forking (default: true)
+    PORT                 port to listen on (default: 5000)
+    PROMETHEUS_MULTIPROC_DIR
+                         empty directory for the metrics of the workers;
+                         /metrics aggregates all workers when set
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY",
+                             multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Restart workers periodically to contain memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10_000))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server) -> None:
+    """Freeze all objects created while preloading, before forking workers.
+    Frozen objects are ignored by the garbage collector, so collections in
+    the workers don't touch (and copy) the pages shared with the master.
+
+    Args:
+        server: the gunicorn arbiter.
+    """
+    if preload_app:
+        gc.freeze()
+
+
+def on_starting(server) -> None:
+    """Remove the metrics of previous runs from PROMETHEUS_MULTIPROC_DIR.
+
+    Args:
+        server: the gunicorn arbiter.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(".db"):
+                os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker) -> None:
+    """Stop reporting the live gauges of an exited worker.
+
+    Args:
+        server: the gunicorn arbiter.
+        worker: the exited worker.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,106 @@
+"""Compressed text columns
+
+Revision ID: 5b1f0e7c3d92
+Revises: cd3c92103bed
+Create Date: 2026-10-19 03:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from dndbehind.compressed import MAGIC, codec
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0e7c3d92'
+down_revision = 'cd3c92103bed'
+branch_labels = None
+depends_on = None
+
+# Rows are rewritten in chunks, so the backfill doesn't hold every text in
+# memory at once
+CHUNK_SIZE = 500
+
+COLUMNS = {
+    'character': (('description', 1_000_000, True),
+                  ('backstory', 1_000_000, True)),
+    'background': (('description', 100_000, False),),
+}
+
+
+def _rewrite(table_name, column_names, convert):
+    """Rewrite the values of text columns in chunks of CHUNK_SIZE rows."""
+    connection = op.get_bind()
+    table = sa.table(table_name, sa.column('id', sa.Integer()),
+                     *(sa.column(name, sa.LargeBinary())
+                       for name in column_names))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(table.c.id, *(table.c[name] for name in column_names))
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(CHUNK_SIZE)).all()
+        if not rows:
+            break
+        for row in rows:
+            values = {name: convert(getattr(row, name))
+                      for name in column_names}
+            if any(values[name] != getattr(row, name)
+                   for name in column_names):
+                connection.execute(
+                    sa.update(table).where(table.c.id == row.id)
+                    .values(**values))
+        last_id = rows[-1].id
+
+
+def _compress(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return codec.compress(value)
+    value = bytes(value)
+    if value.startswith(MAGIC):
+        return value
+    return codec.compress(value.decode('utf-8'))
+
+
+def _decompress(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return codec.decompress(bytes(value)).encode('utf-8')
+
+
+def upgrade():
+    for table_name, columns in COLUMNS.items():
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            for name, length, nullable in columns:
+                batch_op.alter_column(
+                    name,
+                    existing_type=sa.String(length=length),
+                    type_=sa.LargeBinary(),
+                    existing_nullable=nullable,
+                    postgresql_using=f"convert_to({name}, 'UTF8')")
+        _rewrite(table_name, [name for name, _, _ in columns], _compress)
+
+
+def downgrade():
+    for table_name, columns in COLUMNS.items():
+        names = [name for name, _, _ in columns]
+        _rewrite(table_name, names, _decompress)
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            for name, length, nullable in columns:
+                batch_op.alter_column(
+                    name,
+                    existing_type=sa.LargeBinary(),
+                    type_=sa.String(length=length),
+                    existing_nullable=nullable,
+                    postgresql_using=f"convert_from({name}, 'UTF8')")
+        if op.get_bind().dialect.name == 'sqlite':
+            # SQLite keeps the rewritten values as BLOBs
+            op.execute(sa.text(
+                f'UPDATE "{table_name}" SET '
+                + ', '.join(f'{name} = CAST({name} AS TEXT)'
+                            for name in names)))
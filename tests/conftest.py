@@ -1,25 +1,65 @@
 from flask import Flask
 from flask.testing import FlaskClient
+from flask_sqlalchemy.session import Session
 import pytest
+import sqlalchemy as sa
 
 from dndbehind import create_app, db
 from dndbehind.models import User, Role, Background
 from config import TestingConfig
 
 
-@pytest.fixture
+class TransactionalSession(Session):
+    """Session bound to the per-test connection.
+    Flask-SQLAlchemy's Session picks the engine itself, which would bypass
+    the connection holding the test transaction.
+    """
+
+    def get_bind(self, *args, **kwargs):
+        return self.bind
+
+
+@pytest.fixture(scope='session')
 def app() -> Flask:
     app = create_app(TestingConfig)
+
+    with app.app_context():
+        # pysqlite doesn't emit BEGIN itself, which breaks SAVEPOINTs
+        @sa.event.listens_for(db.engine, 'connect')
+        def _disable_pysqlite_transactions(dbapi_connection, _):
+            dbapi_connection.isolation_level = None
+
+        @sa.event.listens_for(db.engine, 'begin')
+        def _emit_begin(connection):
+            connection.exec_driver_sql('BEGIN')
+
+        db.create_all()
+
     return app
 
 
 @pytest.fixture
 def db_session(app: Flask):
+    """Session whose work is rolled back after the test.
+    Commits in the code under test only release a SAVEPOINT inside the
+    outer transaction of the test.
+    """
     with app.app_context():
-        db.create_all()
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        app_session = db.session
+        db.session = db._make_scoped_session({
+            'class_': TransactionalSession,
+            'bind': connection,
+            'join_transaction_mode': 'create_savepoint',
+        })
+
         yield db.session
+
         db.session.remove()
-        db.drop_all()
+        db.session = app_session
+        transaction.rollback()
+        connection.close()
 
 
 @pytest.fixture
@@ -62,3 +102,15 @@ def test_background(db_session):
     db_session.add(background)
     db_session.commit()
     return background
+
+
+@pytest.fixture
+def login(client):
+    """Log in and return the Authorization header for the user."""
+    def login(username, password='password123'):
+        response = client.post('/auth/login', json={
+            'username': username,
+            'password': password
+        })
+        return {'Authorization': f'Bearer {response.json["access_token"]}'}
+    return login
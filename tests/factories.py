@@ -0,0 +1,96 @@
+"""Factory helpers for seeding the test database.
+
+Single objects are built through the ORM; bulk helpers insert rows with one
+executemany per table and return the new primary keys. All generated users
+share one precomputed password hash, so seeding doesn't hash per row.
+"""
+from itertools import count
+
+import sqlalchemy as sa
+
+from dndbehind.models import Background, Character, Role, User, \
+    password_hasher
+
+DEFAULT_PASSWORD = 'password123'
+
+_sequence = count(1)
+_password_hashes = {}
+
+
+def _password_hash(password: str) -> str:
+    if password not in _password_hashes:
+        _password_hashes[password] = password_hasher().hash(password)
+    return _password_hashes[password]
+
+
+def make_user(session, roles=(), password=DEFAULT_PASSWORD, **overrides):
+    n = next(_sequence)
+    user = User(**{'username': f'user{n}', 'email': f'user{n}@example.com',
+                   'password_hash': _password_hash(password), **overrides})
+    user.roles.extend(make_role(session, name) if isinstance(name, str)
+                      else name for name in roles)
+    session.add(user)
+    session.commit()
+    return user
+
+
+def make_role(session, name, description=None):
+    role = session.scalar(sa.select(Role).where(Role.name == name))
+    if role is None:
+        role = Role(name=name, description=description or f'{name} role')
+        session.add(role)
+        session.commit()
+    return role
+
+
+def make_background(session, **overrides):
+    n = next(_sequence)
+    background = Background(**{'name': f'Background {n}',
+                               'description': 'A background for testing',
+                               **overrides})
+    session.add(background)
+    session.commit()
+    return background
+
+
+def make_character(session, owner, background, **overrides):
+    n = next(_sequence)
+    character = Character(**{
+        'name': f'Character {n}', 'description': 'A character',
+        'backstory': 'Once upon a time', 'strength': 10, 'dexterity': 10,
+        'constitution': 10, 'intelligence': 10, 'wisdom': 10,
+        'charisma': 10, 'owner': owner, 'background': background,
+        **overrides
+    })
+    session.add(character)
+    session.commit()
+    return character
+
+
+def bulk_users(session, n, password=DEFAULT_PASSWORD):
+    start = next(_sequence)
+    for _ in range(n - 1):
+        next(_sequence)
+    ids = session.scalars(sa.insert(User).returning(User.id), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com',
+         'password_hash': _password_hash(password), 'disabled': False}
+        for i in range(start, start + n)
+    ]).all()
+    session.commit()
+    return ids
+
+
+def bulk_characters(session, n, owner_ids, background_id, backstory=''):
+    start = next(_sequence)
+    for _ in range(n - 1):
+        next(_sequence)
+    ids = session.scalars(sa.insert(Character).returning(Character.id), [
+        {'name': f'Character {i}', 'description': '', 'backstory': backstory,
+         'strength': 10, 'dexterity': 10, 'constitution': 10,
+         'intelligence': 10, 'wisdom': 10, 'charisma': 10,
+         'owner_id': owner_ids[i % len(owner_ids)],
+         'background_id': background_id}
+        for i in range(start, start + n)
+    ]).all()
+    session.commit()
+    return ids
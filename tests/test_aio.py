@@ -0,0 +1,274 @@
+import asyncio
+import gzip
+import json
+
+from prometheus_client import REGISTRY
+import pytest
+import sqlalchemy as sa
+
+from config import TestingConfig
+from dndbehind import create_app, db
+from dndbehind.aio import AsyncApp, async_database_url
+from dndbehind.models import Background, Character, Role, User
+
+
+def send_request(asgi_app, method, path, body=None, token=None, headers=()):
+    path, _, query_string = path.partition('?')
+    request_body = json.dumps(body).encode() if body is not None else b''
+    headers = [(b'content-type', b'application/json'),
+               (b'content-length', str(len(request_body)).encode()),
+               *headers]
+    if token is not None:
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': headers,
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 12345),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': request_body,
+                'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    response_headers = {name.decode(): value.decode()
+                        for name, value in messages[0]['headers']}
+    data = b''.join(m.get('body', b'') for m in messages[1:])
+    return messages[0]['status'], response_headers, data
+
+
+def call(asgi_app, method, path, body=None, token=None):
+    status, _, data = send_request(asgi_app, method, path, body, token)
+    return status, json.loads(data) if data else None
+
+
+@pytest.fixture
+def async_app(tmp_path):
+    class FileConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "aio.db"}'
+        COMPRESSION_MIN_SIZE = 0
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        db.create_all()
+        operator = Role(name='operator', description='Operator role')
+        owner = User(username='owner', email='owner@example.com')
+        owner.set_password('password123')
+        other = User(username='other', email='other@example.com')
+        other.set_password('password123')
+        boss = User(username='boss', email='boss@example.com',
+                    roles=[operator])
+        boss.set_password('password123')
+        background = Background(name='Acolyte', description='Temple life')
+        character = Character(name='Tordek', strength=16, dexterity=10,
+                              constitution=16, intelligence=8, wisdom=12,
+                              charisma=10, owner=owner,
+                              background=background)
+        db.session.add_all([owner, other, boss, character])
+        db.session.commit()
+
+    asgi_app = AsyncApp(app)
+    yield asgi_app
+    asyncio.run(asgi_app.engine.dispose())
+    asgi_app.hash_executor.shutdown()
+
+
+def login(asgi_app, username):
+    status, body = call(asgi_app, 'POST', '/auth/login',
+                        {'username': username, 'password': 'password123'})
+    assert status == 200
+    return body['access_token']
+
+
+def test_async_database_url():
+    assert async_database_url('sqlite:///dndbehind.db') == \
+        'sqlite+aiosqlite:///dndbehind.db'
+    assert async_database_url('postgresql://db/dnd') == \
+        'postgresql+asyncpg://db/dnd'
+    assert async_database_url('postgresql+psycopg://db/dnd') == \
+        'postgresql+psycopg://db/dnd'
+
+
+def test_login_and_whoami(async_app):
+    token = login(async_app, 'owner')
+
+    status, body = call(async_app, 'GET', '/auth/whoami', token=token)
+    assert status == 200
+    assert body['logged_in_as']['username'] == 'owner'
+    assert body['logged_in_as']['last_logged_in'] is not None
+
+
+def test_login_invalid_credentials(async_app):
+    status, _ = call(async_app, 'POST', '/auth/login',
+                     {'username': 'owner', 'password': 'wrong'})
+    assert status == 401
+
+
+def test_whoami_without_token(async_app):
+    status, _ = call(async_app, 'GET', '/auth/whoami')
+    assert status == 401
+
+
+def test_get_character_access(async_app):
+    status, body = call(async_app, 'GET', '/character/1',
+                        token=login(async_app, 'owner'))
+    assert status == 200
+    assert body['character']['name'] == 'Tordek'
+
+    status, _ = call(async_app, 'GET', '/character/1',
+                     token=login(async_app, 'other'))
+    assert status == 403
+
+    status, _ = call(async_app, 'GET', '/character/1',
+                     token=login(async_app, 'boss'))
+    assert status == 200
+
+    status, _ = call(async_app, 'GET', '/character/99',
+                     token=login(async_app, 'boss'))
+    assert status == 404
+
+
+def test_token_of_deleted_user_rejected(async_app):
+    token = login(async_app, 'boss')
+    with async_app.flask_app.app_context():
+        db.session.delete(db.session.scalar(
+            sa.select(User).where(User.username == 'boss')))
+        db.session.commit()
+
+    for path in ('/auth/whoami', '/character/1', '/character?ids=1',
+                 '/background', '/character/1/events'):
+        status, body = call(async_app, 'GET', path, token=token)
+        assert status == 401, path
+        assert body['msg'] == 'Error loading the user 3'
+
+
+def test_get_characters(async_app):
+    status, body = call(async_app, 'GET', '/character?ids=1,99',
+                        token=login(async_app, 'owner'))
+    assert status == 200
+    assert [r['status'] for r in body['results']] == [200, 404]
+    assert body['results'][0]['character']['name'] == 'Tordek'
+
+    status, body = call(async_app, 'GET', '/character?ids=1',
+                        token=login(async_app, 'other'))
+    assert body['results'][0]['status'] == 403
+
+    status, _ = call(async_app, 'GET', '/character?ids=x',
+                     token=login(async_app, 'other'))
+    assert status == 400
+
+
+def test_request_hooks_applied(async_app):
+    token = login(async_app, 'owner')
+    labels = {'endpoint': 'mgmt.get_character', 'method': 'GET',
+              'status': '200'}
+    before = REGISTRY.get_sample_value('dndbehind_requests_total', labels)
+
+    status, headers, data = send_request(
+        async_app, 'GET', '/character/1', token=token,
+        headers=[(b'accept-encoding', b'gzip')])
+
+    assert status == 200
+    assert headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(data))['character']['name'] == 'Tordek'
+    assert headers['etag'] == '"1"'
+    # The user lookup and the character
+    assert headers['server-timing'].endswith('desc="2 queries"')
+    assert REGISTRY.get_sample_value('dndbehind_requests_total', labels) \
+        == (before or 0) + 1
+
+
+def test_before_request_response_skips_view(async_app):
+    token = login(async_app, 'owner')
+    async_app.flask_app.before_request(
+        lambda: ({'msg': 'Slow down.'}, 429))
+
+    status, headers, data = send_request(async_app, 'GET', '/character/1',
+                                         token=token)
+
+    assert status == 429
+    assert json.loads(data) == {'msg': 'Slow down.'}
+    # The response still passed the after_request hooks, but no query ran
+    assert headers['server-timing'].endswith('desc="0 queries"')
+
+
+def test_token_interchangeable_with_sync_app(async_app):
+    token = login(async_app, 'owner')
+    response = async_app.flask_app.test_client().get(
+        '/auth/whoami', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+
+
+def test_unknown_routes_fall_back_to_flask(async_app):
+    status, body = call(async_app, 'POST', '/auth/user',
+                        {'username': 'new', 'email': 'new@example.com',
+                         'password': 'secret'})
+    assert status == 201
+    assert body['data']['username'] == 'new'
+
+
+def test_character_event_stream(async_app):
+    token = login(async_app, 'owner')
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/character/1/events',
+        'headers': [(b'authorization', f'Bearer {token}'.encode())],
+    }
+    messages = []
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    async def main():
+        stream = asyncio.ensure_future(async_app(scope, receive, send))
+        while len(messages) < 2:
+            await asyncio.sleep(0.01)
+        async_app.flask_app.extensions['live_changes'].broker.publish(
+            'character:1', {'id': 5, 'entity': 'character', 'entity_id': 1,
+                            'operation': 'delete', 'payload': None})
+        await asyncio.wait_for(stream, 5)
+
+    asyncio.run(main())
+
+    assert messages[0]['status'] == 200
+    body = b''.join(m['body'] for m in messages[1:]).decode()
+    assert body.startswith('retry: 3000\n\nevent: character\ndata: {"id":1,')
+    assert body.endswith('id: 5\nevent: delete\ndata: 1\n\n')
+    assert not messages[-1].get('more_body', False)
+
+
+def test_character_event_stream_deleted_while_subscribing(async_app,
+                                                          monkeypatch):
+    token = login(async_app, 'owner')
+    live_changes = async_app.flask_app.extensions['live_changes']
+    subscribe = live_changes.subscribe
+
+    def subscribe_and_delete(channel):
+        subscription = subscribe(channel)
+        with async_app.flask_app.app_context():
+            db.session.delete(db.session.get(Character, 1))
+            db.session.commit()
+        return subscription
+    monkeypatch.setattr(live_changes, 'subscribe', subscribe_and_delete)
+
+    status, body = call(async_app, 'GET', '/character/1/events', token=token)
+
+    assert status == 404
+    assert len(live_changes.broker) == 0
@@ -0,0 +1,86 @@
+import os
+
+import msgspec
+
+from config import TestingConfig
+from dndbehind import create_app, db
+from dndbehind.audit.log import FileSink
+
+from factories import make_background, make_user
+
+
+def test_events_written_in_background(tmp_path):
+    class AuditConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "audit.db"}'
+        AUDIT_SINK = 'database'
+        AUDIT_FLUSH_INTERVAL = 0.05
+        AUDIT_PAGE_SIZE = 3
+
+    app = create_app(AuditConfig)
+    audit_log = app.extensions['audit_log']
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        admin = make_user(db.session, roles=['admin', 'maintainer'])
+        user = make_user(db.session)
+        admin_id, user_id = admin.id, user.id
+        admin_name, user_name = admin.username, user.username
+
+    try:
+        response = client.post('/auth/login', json={
+            'username': admin_name, 'password': 'password123'})
+        headers = {'Authorization':
+                   f'Bearer {response.json["access_token"]}'}
+        assert client.post('/auth/login', json={
+            'username': user_name, 'password': 'wrong'}).status_code == 401
+        assert client.put(f'/auth/userrole/{user_id}', headers=headers,
+                          json={'roles': ['maintainer']}).status_code == 200
+        assert client.post('/background', headers=headers, json={
+            'name': 'Sage', 'description': 'Studious'}).status_code == 200
+        audit_log.close()
+
+        response = client.get('/audit', headers=headers)
+        assert response.status_code == 200
+        events = response.json['events']
+        assert [e['action'] for e in events] == \
+            ['background_created', 'roles_added', 'login_failed']
+        assert events[1]['actor_id'] == admin_id
+        assert events[1]['target'] == f'user:{user_id}'
+        assert events[1]['details'] == {'roles': ['maintainer']}
+        assert events[2]['success'] is False
+        assert 'password' not in events[2]['details']
+
+        response = client.get(f'/audit?before={response.json["next"]}',
+                              headers=headers)
+        assert [e['action'] for e in response.json['events']] == ['login']
+        assert response.json['next'] is None
+
+        response = client.get(f'/audit?action=login&actor_id={user_id}',
+                              headers=headers)
+        assert response.json['events'] == []
+    finally:
+        audit_log.close()
+
+
+def test_file_sink_rotates(tmp_path):
+    sink = FileSink(str(tmp_path), 100)
+    sink.write([{'action': 'login', 'n': 1}])
+    sink.write([{'action': 'login', 'n': n} for n in range(2, 5)])
+    sink.write([{'action': 'login', 'n': 5}])
+
+    current = tmp_path / os.path.basename(sink.path())
+    rotated = sorted(set(tmp_path.iterdir()) - {current})
+    assert len(rotated) == 1
+    lines = rotated[0].read_bytes().splitlines()
+    assert [msgspec.json.decode(line)['n'] for line in lines] == [1, 2, 3, 4]
+    assert msgspec.json.decode(current.read_bytes())['n'] == 5
+
+
+def test_audit_requires_database_sink(client, db_session, login):
+    admin = make_user(db_session, roles=['admin'])
+    make_background(db_session)
+    response = client.get('/audit', headers=login(admin.username))
+    assert response.status_code == 501
+    other = make_user(db_session)
+    response = client.get('/audit', headers=login(other.username))
+    assert response.status_code == 403
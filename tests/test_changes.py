@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+import sqlalchemy as sa
+import sqlalchemy.orm as orm
+
+from dndbehind import db
+from dndbehind.changes.outbox import events_since
+from dndbehind.models import Background
+
+from factories import make_background, make_character, make_user
+
+
+@pytest.fixture
+def operator(db_session):
+    return make_user(db_session, roles=['operator'])
+
+
+@pytest.fixture
+def cursor(db_session, operator):
+    events = events_since(db_session, 0, 10_000)
+    return events[-1]['id'] if events else 0
+
+
+def test_inserts_recorded(db_session, cursor):
+    owner = make_user(db_session)
+    background = make_background(db_session)
+    character = make_character(db_session, owner, background)
+
+    events = events_since(db_session, cursor, 100)
+
+    assert [(e['entity'], e['entity_id'], e['operation']) for e in events] \
+        == [('user', owner.id, 'insert'),
+            ('background', background.id, 'insert'),
+            ('character', character.id, 'insert')]
+    assert events[2]['payload']['owner_id'] == owner.id
+    assert events[0]['id'] < events[1]['id'] < events[2]['id']
+
+
+def test_updates_and_deletes_recorded(db_session, operator, cursor):
+    background = make_background(db_session)
+    character = make_character(db_session, operator, background)
+    cursor = events_since(db_session, cursor, 100)[-1]['id']
+
+    character.name = 'Renamed'
+    db_session.commit()
+    db_session.delete(character)
+    db_session.commit()
+
+    update, delete = events_since(db_session, cursor, 100)
+    assert update['operation'] == 'update'
+    assert update['payload']['name'] == 'Renamed'
+    assert delete['operation'] == 'delete'
+    assert delete['payload'] is None
+
+
+def test_login_not_recorded(client, db_session, operator, cursor):
+    client.post('/auth/login', json={'username': operator.username,
+                                     'password': 'password123'})
+    assert events_since(db_session, cursor, 100) == []
+
+
+def test_changes_endpoint(client, db_session, operator, login, cursor):
+    headers = login(operator.username)
+    backgrounds = [make_background(db_session) for _ in range(3)]
+
+    response = client.get(f'/changes?since={cursor}&limit=2',
+                          headers=headers)
+    assert response.status_code == 200
+    assert [c['entity_id'] for c in response.json['changes']] \
+        == [b.id for b in backgrounds[:2]]
+    assert response.json['more'] is True
+
+    response = client.get(
+        f'/changes?since={response.json["cursor"]}&limit=2', headers=headers)
+    assert [c['entity_id'] for c in response.json['changes']] \
+        == [backgrounds[2].id]
+    assert response.json['more'] is False
+
+
+def test_changes_long_poll_times_out(client, operator, login, cursor):
+    headers = login(operator.username)
+
+    start = time.monotonic()
+    response = client.get(f'/changes?since={cursor}&wait=0.1',
+                          headers=headers)
+
+    assert time.monotonic() - start >= 0.1
+    assert response.json == {'changes': [], 'cursor': cursor, 'more': False}
+
+
+@pytest.mark.parametrize('query', ['since=x', 'limit=0', 'wait=-1'])
+def test_changes_invalid_query(client, operator, login, query):
+    response = client.get(f'/changes?{query}',
+                          headers=login(operator.username))
+    assert response.status_code == 400
+
+
+def test_changes_requires_operator(client, test_user, login):
+    response = client.get('/changes', headers=login(test_user.username))
+    assert response.status_code == 403
+
+
+def test_event_ids_follow_commit_order(app, tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "outbox.db"}')
+    db.metadata.create_all(engine)
+
+    def commit_background(session):
+        make_background(session)
+        session.close()
+
+    with app.app_context(), orm.Session(engine) as first, \
+            orm.Session(engine) as second, orm.Session(engine) as reader:
+        # The first session is assigned its event ID, then the second one
+        # tries to commit before it
+        first.add(Background(name='First', description='Assigned first'))
+        first.flush()
+        thread = threading.Thread(target=commit_background, args=(second,))
+        thread.start()
+        thread.join(0.2)
+
+        # Its insert waits for the first transaction to end
+        assert thread.is_alive()
+        assert events_since(reader, 0, 100) == []
+        reader.rollback()
+        first.commit()
+        thread.join()
+
+        events = events_since(reader, 0, 100)
+
+    engine.dispose()
+    first_event, second_event = events
+    assert first_event['payload']['name'] == 'First'
+    assert first_event['id'] < second_event['id']
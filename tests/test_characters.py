@@ -0,0 +1,233 @@
+import pytest
+
+from dndbehind.changes.outbox import events_since
+from dndbehind.querystats import collect_queries, query_budget
+
+from factories import make_background, make_character, make_user
+
+MERGE_PATCH = 'application/merge-patch+json'
+JSON_PATCH = 'application/json-patch+json'
+
+
+@pytest.fixture
+def owner(db_session):
+    return make_user(db_session)
+
+
+@pytest.fixture
+def character(db_session, owner):
+    return make_character(db_session, owner, make_background(db_session),
+                          backstory='x' * 100_000)
+
+
+def patch(client, character_id, body, headers, content_type=MERGE_PATCH):
+    return client.patch(f'/character/{character_id}', json=body,
+                        headers={**headers, 'Content-Type': content_type})
+
+
+def test_create_character(client, db_session, owner, login):
+    background = make_background(db_session)
+    response = client.post('/character', headers=login(owner.username), json={
+        'name': 'Elara', 'strength': 8, 'dexterity': 16, 'constitution': 12,
+        'intelligence': 14, 'wisdom': 10, 'charisma': 13,
+        'background_id': background.id})
+
+    assert response.status_code == 201
+    assert response.json['character']['owner_id'] == owner.id
+    assert response.json['character']['version'] == 1
+    assert response.headers['ETag'] == '"1"'
+    assert response.headers['Location'].endswith(
+        f'/character/{response.json["character"]["id"]}')
+
+
+def test_create_character_validation(client, db_session, owner, login):
+    headers = login(owner.username)
+    stats = {'strength': 10, 'dexterity': 10, 'constitution': 10,
+             'intelligence': 10, 'wisdom': 10, 'charisma': 10}
+
+    response = client.post('/character', headers=headers, json={
+        'name': 'Elara', **stats, 'strength': 31, 'background_id': 1})
+    assert response.status_code == 400
+
+    response = client.post('/character', headers=headers, json={
+        'name': 'Elara', **stats, 'background_id': 999_999})
+    assert response.status_code == 400
+
+
+def test_merge_patch_writes_changed_columns(client, db_session, owner,
+                                            character, login):
+    headers = login(owner.username)
+    character_id = character.id
+    db_session.expunge_all()
+
+    with collect_queries() as stats:
+        response = patch(client, character_id, {'strength': 18},
+                         {**headers, 'Prefer': 'return=minimal'})
+
+    assert response.status_code == 204
+    assert response.headers['ETag'] == '"2"'
+    statements = list(stats.shapes)
+    update, = [s for s in statements if s.startswith('UPDATE character')]
+    assert 'strength=?' in update and 'backstory' not in update
+    assert not any('backstory' in s for s in statements)
+
+    events = events_since(db_session, 0, 10_000)
+    assert events[-1]['payload'] == {'id': character_id, 'strength': 18,
+                                     'version': 2}
+
+
+def test_merge_patch(client, db_session, owner, character, login):
+    response = patch(client, character.id,
+                     {'name': 'Renamed', 'description': None},
+                     login(owner.username))
+
+    assert response.status_code == 200
+    assert response.json['character']['name'] == 'Renamed'
+    assert response.json['character']['description'] is None
+    assert response.json['character']['backstory'] == 'x' * 100_000
+
+    for body in ({'version': 5}, {'owner_id': 1}, {'name': None},
+                 {'wisdom': 0}):
+        response = patch(client, character.id, body, login(owner.username))
+        assert response.status_code == 400
+
+
+def test_json_patch(client, db_session, owner, character, login):
+    headers = login(owner.username)
+    response = patch(client, character.id, [
+        {'op': 'test', 'path': '/version', 'value': 1},
+        {'op': 'replace', 'path': '/wisdom', 'value': 14},
+        {'op': 'copy', 'from': '/wisdom', 'path': '/charisma'},
+        {'op': 'remove', 'path': '/description'},
+    ], headers, JSON_PATCH)
+
+    assert response.status_code == 200
+    assert response.json['character']['wisdom'] == 14
+    assert response.json['character']['charisma'] == 14
+    assert response.json['character']['description'] is None
+    assert response.json['character']['version'] == 2
+
+    response = patch(client, character.id,
+                     [{'op': 'test', 'path': '/version', 'value': 1},
+                      {'op': 'replace', 'path': '/wisdom', 'value': 8}],
+                     headers, JSON_PATCH)
+    assert response.status_code == 409
+
+    response = patch(client, character.id,
+                     [{'op': 'replace', 'path': '/level', 'value': 2}],
+                     headers, JSON_PATCH)
+    assert response.status_code == 422
+
+    response = patch(client, character.id,
+                     [{'op': 'replace', 'path': '/version', 'value': 9}],
+                     headers, JSON_PATCH)
+    assert response.status_code == 422
+
+
+def test_if_match(client, db_session, owner, character, login):
+    headers = login(owner.username)
+    response = client.get(f'/character/{character.id}', headers=headers)
+    etag = response.headers['ETag']
+
+    response = patch(client, character.id, {'wisdom': 12},
+                     {**headers, 'If-Match': etag})
+    assert response.status_code == 200
+
+    response = patch(client, character.id, {'wisdom': 13},
+                     {**headers, 'If-Match': etag})
+    assert response.status_code == 412
+    assert response.json['version'] == 2
+
+
+def test_patch_access(client, db_session, character, login):
+    other = make_user(db_session)
+    response = patch(client, character.id, {'wisdom': 12},
+                     login(other.username))
+    assert response.status_code == 403
+
+    response = patch(client, 999_999, {'wisdom': 12}, login(other.username))
+    assert response.status_code == 404
+
+
+def test_patch_unsupported_media_type(client, db_session, owner, character,
+                                      login):
+    response = client.patch(f'/character/{character.id}', data='wisdom=12',
+                            headers={**login(owner.username),
+                                     'Content-Type': 'text/plain'})
+    assert response.status_code == 415
+    assert JSON_PATCH in response.headers['Accept-Patch']
+
+
+def test_get_characters(client, db_session, owner, character, login):
+    background = make_background(db_session)
+    party = [make_character(db_session, owner, background).id
+             for _ in range(5)]
+    foreign = make_character(db_session, make_user(db_session),
+                             background).id
+    character_id = character.id
+    headers = login(owner.username)
+    db_session.expunge_all()
+
+    with query_budget(2):
+        response = client.get(
+            f'/character?ids={character_id},{",".join(map(str, party))}'
+            f'&ids={foreign}&ids=999999', headers=headers)
+
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['id'] for r in results] == \
+        [character_id, *party, foreign, 999_999]
+    assert [r['status'] for r in results] == [200] * 6 + [403, 404]
+    assert results[0]['character']['backstory'] == 'x' * 100_000
+
+
+def test_get_characters_operator(client, db_session, character, login):
+    operator = make_user(db_session, roles=['operator'])
+    response = client.get(f'/character?ids={character.id}',
+                          headers=login(operator.username))
+    assert response.json['results'][0]['status'] == 200
+
+
+def test_get_characters_invalid_ids(app, client, db_session, owner, login):
+    headers = login(owner.username)
+    for query in ('', '?ids=', '?ids=1,x',
+                  '?ids=' + ','.join(map(str, range(101)))):
+        response = client.get(f'/character{query}', headers=headers)
+        assert response.status_code == 400
+
+
+def test_expand(client, db_session, owner, character, login):
+    headers = login(owner.username)
+    response = client.get(f'/character/{character.id}?expand=owner',
+                          headers=headers)
+    assert response.json['character']['owner']['email'] == owner.email
+    assert 'background' not in response.json['character']
+
+    response = client.get(f'/character/{character.id}?expand=level',
+                          headers=headers)
+    assert response.status_code == 400
+
+
+def test_expand_batched(client, db_session, owner, login):
+    operator = make_user(db_session, roles=['operator'])
+    backgrounds = [make_background(db_session) for _ in range(2)]
+    ids = [make_character(db_session, user, background).id
+           for user in (owner, operator, make_user(db_session))
+           for background in backgrounds]
+    background_ids = [background.id for background in backgrounds]
+    expected_owner = {'id': owner.id, 'username': owner.username}
+    operator_email = operator.email
+    headers = login(operator.username)
+    db_session.expunge_all()
+
+    with query_budget(4, max_repeats=1):
+        response = client.get(
+            f'/character?ids={",".join(map(str, ids))}'
+            '&expand=owner,background&expand=owner', headers=headers)
+
+    results = response.json['results']
+    assert [r['character']['background']['id'] for r in results] == \
+        background_ids * 3
+    owners = [r['character']['owner'] for r in results]
+    assert owners[0] == expected_owner
+    assert owners[2]['email'] == operator_email
@@ -0,0 +1,89 @@
+import pytest
+import sqlalchemy as sa
+import zstandard
+
+from dndbehind.compressed import MAGIC, LazyText, TextCodec
+from dndbehind.models import Character
+
+from factories import make_background, make_character, make_user
+
+PROSE = ('The wind howled over the ruined keep as our hero set out, sword '
+         'in hand and doubt in heart, to find the truth about the past. ')
+
+
+@pytest.mark.parametrize('name', ['zstd', 'zlib'])
+def test_codec_round_trip(name):
+    codec = TextCodec()
+    codec.configure(name)
+    text = PROSE * 20
+
+    stored = codec.compress(text)
+    assert stored.startswith(MAGIC)
+    assert len(stored) < len(text) / 5
+    assert codec.decompress(stored) == text
+
+
+def test_codec_stores_short_texts_plain():
+    codec = TextCodec()
+    assert codec.compress('Brave') == b'Brave'
+    assert codec.decompress(b'Brave') == 'Brave'
+
+    codec.configure('none')
+    assert codec.compress(PROSE * 20) == (PROSE * 20).encode()
+
+
+def test_codec_dictionary():
+    samples = [f'{PROSE} Chapter {n}: {PROSE[n:]}'.encode()
+               for n in range(1000)]
+    dictionary = zstandard.train_dictionary(4096, samples).as_bytes()
+    codec = TextCodec()
+    codec.configure('zstd', min_size=0, dictionaries=[dictionary])
+    text = f'{PROSE} Chapter 7: a new tale.'
+
+    stored = codec.compress(text)
+    plain = TextCodec()
+    plain.configure('zstd', min_size=0)
+    assert len(stored) < len(plain.compress(text))
+    assert codec.decompress(stored) == text
+
+    with pytest.raises(LookupError):
+        plain.decompress(stored)
+    with pytest.raises(ValueError):
+        codec.configure('zlib', dictionaries=[dictionary])
+
+
+def test_compressed_column(client, db_session, login):
+    owner = make_user(db_session)
+    character = make_character(db_session, owner,
+                               make_background(db_session),
+                               backstory=PROSE * 1000, description='Short')
+    character_id = character.id
+    headers = login(owner.username)
+    db_session.expunge_all()
+
+    stored = db_session.execute(
+        sa.text('SELECT backstory, description FROM character WHERE id = :id'),
+        {'id': character_id}).one()
+    assert stored.backstory.startswith(MAGIC)
+    assert len(stored.backstory) < len(PROSE)
+    assert stored.description == b'Short'
+
+    character = db_session.get(Character, character_id)
+    assert isinstance(character.backstory, LazyText)
+    assert character.backstory.compressed is not None
+    assert character.description == 'Short'
+
+    response = client.get(f'/character/{character_id}', headers=headers)
+    assert response.json['character']['backstory'] == PROSE * 1000
+
+
+def test_uncompressed_rows_readable(db_session):
+    owner = make_user(db_session)
+    character = make_character(db_session, owner,
+                               make_background(db_session))
+    db_session.execute(
+        sa.text("UPDATE character SET backstory = 'Plain text' "
+                "WHERE id = :id"), {'id': character.id})
+    db_session.expire_all()
+
+    assert db_session.get(Character, character.id).backstory == 'Plain text'
@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+
+from dndbehind.compression import CompressedCache
+from dndbehind.models import Background, Role
+
+
+@pytest.fixture
+def maintainer_headers(client, db_session, test_user):
+    maintainer = Role(name='maintainer', description='Maintainer role')
+    test_user.roles.append(maintainer)
+    for i in range(20):
+        db_session.add(Background(name=f'Background {i}',
+                                  description='Lorem ipsum ' * 20))
+    db_session.commit()
+
+    response = client.post('/auth/login', json={
+        'username': 'testuser',
+        'password': 'password123'
+    })
+    return {'Authorization': f'Bearer {response.json["access_token"]}'}
+
+
+def test_uncompressed_without_accept_encoding(client, maintainer_headers):
+    response = client.get('/background', headers=maintainer_headers)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.json) == 20
+
+
+def test_gzip_negotiated(client, maintainer_headers):
+    response = client.get('/background', headers={
+        **maintainer_headers,
+        'Accept-Encoding': 'gzip'
+    })
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'Background 19' in gzip.decompress(response.data)
+
+
+def test_preferred_encoding_negotiated(client, maintainer_headers):
+    pytest.importorskip('zstandard')
+    response = client.get('/background', headers={
+        **maintainer_headers,
+        'Accept-Encoding': 'gzip, br, zstd'
+    })
+    assert response.headers['Content-Encoding'] == 'zstd'
+
+
+def test_small_responses_not_compressed(client, test_user):
+    response = client.post('/auth/login',
+                           json={'username': 'testuser',
+                                 'password': 'password123'},
+                           headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_compressed_body_cached(app, client, maintainer_headers):
+    headers = {**maintainer_headers, 'Accept-Encoding': 'gzip'}
+    first = client.get('/background', headers=headers)
+    cache = app.extensions['compress']
+    size = cache.size
+
+    second = client.get('/background', headers=headers)
+    assert size > 0
+    assert cache.size == size
+    assert first.data == second.data
+
+
+def test_compressed_cache_evicts_lru():
+    cache = CompressedCache(max_bytes=10)
+    cache.put(b'a', 'gzip', b'12345')
+    cache.put(b'b', 'gzip', b'12345')
+    assert cache.get(b'a', 'gzip') == b'12345'
+
+    cache.put(b'c', 'gzip', b'12345')
+    assert cache.get(b'b', 'gzip') is None
+    assert cache.get(b'a', 'gzip') == b'12345'
+    assert cache.size == 10
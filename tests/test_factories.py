@@ -0,0 +1,38 @@
+import sqlalchemy as sa
+
+from dndbehind.models import Character, User
+
+from factories import bulk_characters, bulk_users, make_background, \
+    make_character, make_user
+
+
+def test_make_user_with_roles(db_session):
+    user = make_user(db_session, roles=['admin', 'operator'])
+    assert user.check_password('password123')
+    assert [role.name for role in user.roles] == ['admin', 'operator']
+
+
+def test_make_character(db_session):
+    owner = make_user(db_session)
+    character = make_character(db_session, owner, make_background(db_session),
+                               strength=18)
+    assert character.owner == owner
+    assert character.strength == 18
+
+
+def test_bulk_seeding(db_session):
+    background = make_background(db_session)
+    user_ids = bulk_users(db_session, 200)
+    character_ids = bulk_characters(db_session, 1000, user_ids,
+                                    background.id)
+
+    assert len(set(user_ids)) == 200
+    assert len(character_ids) == 1000
+    assert db_session.scalar(sa.select(sa.func.count(User.id))) == 200
+    assert db_session.scalar(
+        sa.select(sa.func.count(Character.id))) == 1000
+
+
+def test_bulk_seeding_is_rolled_back(db_session):
+    assert db_session.scalar(sa.select(sa.func.count(User.id))) == 0
+    assert db_session.scalar(sa.select(sa.func.count(Character.id))) == 0
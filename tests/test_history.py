@@ -0,0 +1,102 @@
+import sqlalchemy as sa
+
+from dndbehind.history import SNAPSHOT_INTERVAL, apply_text_diff, \
+    compact_history, text_diff, version_at
+from dndbehind.models import Character, CharacterHistory
+
+from factories import make_background, make_character, make_user
+
+MERGE_PATCH = 'application/merge-patch+json'
+BACKSTORY = ''.join(f'Chapter {n}: the hero wandered far. '
+                    for n in range(20_000))
+
+
+def test_text_diff():
+    old = 'First line.\nSecond line! Third? ' + 'Another sentence. ' * 20
+    new = 'First line.\nSecond LINE! Third? ' + 'Another sentence. ' * 20 \
+        + 'The end.'
+
+    operations = text_diff(old, new)
+    assert isinstance(operations, list)
+    assert apply_text_diff(old, operations) == new
+    # Diffs that aren't smaller than the new text are replaced by it
+    assert text_diff(old, '') == ''
+    assert text_diff('Short', 'Other') == 'Other'
+
+
+def test_patch_records_delta(client, db_session, login):
+    owner = make_user(db_session)
+    character = make_character(db_session, owner,
+                               make_background(db_session),
+                               backstory=BACKSTORY)
+    character_id = character.id
+    headers = {**login(owner.username), 'Content-Type': MERGE_PATCH}
+    db_session.expunge_all()
+
+    edited = BACKSTORY.replace('Chapter 7:', 'Chapter seven:')
+    response = client.patch(f'/character/{character_id}', headers=headers,
+                            json={'backstory': edited, 'strength': 18})
+    assert response.status_code == 200
+
+    delta = db_session.execute(
+        sa.text('SELECT data FROM character_history '
+                'WHERE character_id = :id AND version = 2'),
+        {'id': character_id}).scalar_one()
+    assert len(delta) < 200
+
+    response = client.get(f'/character/{character_id}/history',
+                          headers=headers)
+    assert [(v['version'], sorted(v['changed']))
+            for v in response.json['versions']][0] == \
+        (2, ['backstory', 'strength'])
+    assert len(response.json['versions']) == 2
+
+    response = client.get(f'/character/{character_id}/history/1',
+                          headers=headers)
+    assert response.json['character']['backstory'] == BACKSTORY
+    assert response.json['character']['strength'] == 10
+    assert client.get(f'/character/{character_id}/history/3',
+                      headers=headers).status_code == 404
+
+    response = client.post(f'/character/{character_id}/history/1/restore',
+                           headers={**headers, 'If-Match': '"2"'})
+    assert response.status_code == 200
+    assert response.json['character']['version'] == 3
+    assert response.json['character']['strength'] == 10
+    assert version_at(db_session, character_id, 3)['backstory'] == BACKSTORY
+    db_session.expire_all()
+    assert db_session.get(Character, character_id).backstory == BACKSTORY
+
+
+def test_restore_access(client, db_session, login):
+    character = make_character(db_session, make_user(db_session),
+                               make_background(db_session))
+    other = make_user(db_session)
+    response = client.post(f'/character/{character.id}/history/1/restore',
+                           headers=login(other.username))
+    assert response.status_code == 403
+
+
+def test_snapshots_and_compaction(db_session):
+    character = make_character(db_session, make_user(db_session),
+                               make_background(db_session))
+    for n in range(2, SNAPSHOT_INTERVAL + 6):
+        character.name = f'Name {n}'
+        db_session.commit()
+    version = character.version
+    character_id = character.id
+
+    snapshots = db_session.scalars(
+        sa.select(CharacterHistory.version)
+        .where(CharacterHistory.character_id == character_id,
+               CharacterHistory.snapshot.is_(True))).all()
+    assert snapshots == [1, SNAPSHOT_INTERVAL + 1]
+    assert version_at(db_session, character_id, 7)['name'] == 'Name 7'
+    assert version_at(db_session, character_id, version)['name'] == \
+        f'Name {version}'
+
+    assert compact_history(db_session, 3, None) == version - 3
+    assert version_at(db_session, character_id, version - 3) is None
+    assert version_at(db_session, character_id, version - 2)['name'] == \
+        f'Name {version - 2}'
+    assert compact_history(db_session, 3, None) == 0
@@ -0,0 +1,97 @@
+import sqlalchemy as sa
+
+from dndbehind.idempotency import DatabaseStore, MemoryStore, purge_expired
+from dndbehind.models import Character, User
+
+from factories import make_background, make_user
+
+
+def test_create_user_replayed(client, db_session):
+    body = {'username': 'retry', 'email': 'retry@example.com',
+            'password': 'password123'}
+    headers = {'Idempotency-Key': 'signup-1'}
+    first = client.post('/auth/user', json=body, headers=headers)
+    second = client.post('/auth/user', json=body, headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.json == first.json
+    assert second.headers['Location'] == first.headers['Location']
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert db_session.scalar(sa.select(sa.func.count()).select_from(User)
+                             .where(User.username == 'retry')) == 1
+
+    response = client.post('/auth/user', headers=headers,
+                           json={**body, 'username': 'other'})
+    assert response.status_code == 422
+    # Without a key, the duplicate is rejected as before
+    assert client.post('/auth/user', json=body).status_code == 409
+
+
+def test_keys_scoped_to_user(client, db_session, login):
+    background = make_background(db_session)
+    users = [make_user(db_session) for _ in range(2)]
+    body = {'name': 'Twin', 'background_id': background.id,
+            **{ability: 10 for ability in (
+                'strength', 'dexterity', 'constitution', 'intelligence',
+                'wisdom', 'charisma')}}
+    for user in users:
+        headers = {**login(user.username), 'Idempotency-Key': 'same'}
+        for _ in range(2):
+            response = client.post('/character', json=body, headers=headers)
+            assert response.status_code == 201
+
+    owners = db_session.scalars(sa.select(Character.owner_id)
+                                .where(Character.name == 'Twin')).all()
+    assert sorted(owners) == sorted(user.id for user in users)
+
+
+def test_database_store(db_session):
+    store = DatabaseStore()
+    assert store.begin('k', 'fp', 60, 60) is None
+    assert store.begin('k', 'fp', 60, 60) == ('fp', None)
+    store.complete('k', {'status': 201, 'headers': [('X-A', '1')],
+                         'body': b'{}'})
+    assert store.begin('k', 'fp', 60, 60) == \
+        ('fp', {'status': 201, 'headers': [('X-A', '1')], 'body': b'{}'})
+    store.release('k')
+    assert store.begin('k', 'other', -1, 60) is None
+    # Expired keys are replaced, and purged
+    assert store.begin('k', 'fp', 60, 60) is None
+    assert store.begin('gone', 'fp', -1, 60) is None
+    assert purge_expired(db_session) == 1
+
+
+def test_memory_store():
+    store = MemoryStore(max_keys=2)
+    assert store.begin('a', 'fp', 60, 60) is None
+    assert store.begin('a', 'fp', 60, 60) == ('fp', None)
+    store.complete('a', {'status': 200, 'headers': [], 'body': b'x'})
+    assert store.begin('a', 'other', 60, 60) == \
+        ('fp', {'status': 200, 'headers': [], 'body': b'x'})
+    assert store.begin('b', 'fp', 60, 60) is None
+    assert store.begin('c', 'fp', 60, 60) is None
+    # The oldest key was evicted
+    assert store.begin('a', 'fp', 60, 60) is None
+    store.release('a')
+    assert store.begin('d', 'fp', 0, 60) is None
+    assert store.begin('d', 'fp', 60, 60) is None
+
+
+def test_database_store_takes_over_abandoned_claim(db_session):
+    store = DatabaseStore()
+    # The worker running the first request died with its lease expired
+    assert store.begin('k', 'fp', 60, -1) is None
+    assert store.begin('k', 'fp', 60, 60) is None
+    assert store.begin('k', 'fp', 60, 60) == ('fp', None)
+    # Completed keys are kept after their lease
+    assert store.begin('done', 'fp', 60, -1) is None
+    store.complete('done', {'status': 201, 'headers': [], 'body': b''})
+    assert store.begin('done', 'fp', 60, 60)[1]['status'] == 201
+
+
+def test_memory_store_takes_over_abandoned_claim():
+    store = MemoryStore(max_keys=2)
+    assert store.begin('a', 'fp', 60, 0) is None
+    assert store.begin('a', 'fp', 60, 60) is None
+    assert store.begin('a', 'fp', 60, 60) == ('fp', None)
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+
+import pytest
+import sqlalchemy.orm as orm
+
+from config import TestingConfig
+from dndbehind import create_app, db
+from dndbehind.changes.broker import Broker, merge_events
+from dndbehind.models import Character
+
+from factories import make_background, make_character, make_user
+
+
+def test_broker_fan_out():
+    broker = Broker()
+    first = broker.subscribe('character:1')
+    second = broker.subscribe('character:1')
+    other = broker.subscribe('character:2')
+
+    assert broker.publish('character:1', 'update') == 2
+    assert first.wait(0) == ['update']
+    assert second.wait(0) == ['update']
+    assert other.wait(0) == []
+
+    broker.unsubscribe(first)
+    broker.unsubscribe(first)
+    assert broker.publish('character:1', 'update') == 1
+    assert len(broker) == 2
+
+
+def test_subscription_buffer_bounded():
+    broker = Broker(max_pending=2)
+    subscription = broker.subscribe('character:1')
+    for n in range(5):
+        broker.publish('character:1', n)
+
+    assert subscription.wait(0) == [3, 4]
+    assert subscription.dropped == 3
+
+
+def test_subscription_merges_updates():
+    broker = Broker(max_pending=2, merge=merge_events)
+    subscription = broker.subscribe('character:1')
+    broker.publish('character:1', {'id': 1, 'operation': 'insert',
+                                   'payload': {'name': 'A', 'wisdom': 10}})
+    for n, payload in enumerate(({'wisdom': 12}, {'name': 'B'}), start=2):
+        broker.publish('character:1', {'id': n, 'operation': 'update',
+                                       'payload': payload})
+
+    assert subscription.wait(0) == [
+        {'id': 2, 'operation': 'insert',
+         'payload': {'name': 'A', 'wisdom': 12}},
+        {'id': 3, 'operation': 'update', 'payload': {'name': 'B'}},
+    ]
+    assert subscription.dropped == 1
+
+
+def test_broker_capacity():
+    broker = Broker(max_subscriptions=1)
+    broker.subscribe('character:1')
+    with pytest.raises(OverflowError):
+        broker.subscribe('character:2')
+
+
+def test_wait_async():
+    broker = Broker()
+    subscription = broker.subscribe('character:1')
+
+    async def main():
+        waiter = asyncio.ensure_future(subscription.wait_async(5))
+        await asyncio.sleep(0)
+        broker.publish('character:1', 'update')
+        return await waiter, await subscription.wait_async(0.01)
+
+    assert asyncio.run(main()) == (['update'], [])
+
+
+@pytest.fixture
+def character(db_session):
+    owner = make_user(db_session)
+    return make_character(db_session, owner, make_background(db_session))
+
+
+def test_character_event_stream(app, client, login, character):
+    response = client.get(f'/character/{character.id}/events',
+                          headers=login(character.owner.username),
+                          buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+
+    assert next(stream) == b'retry: 3000\n\n'
+    assert next(stream).startswith(b'event: character\ndata: {"id":')
+
+    broker = app.extensions['live_changes'].broker
+    broker.publish(f'character:{character.id}', {
+        'id': 7, 'entity': 'character', 'entity_id': character.id,
+        'operation': 'update', 'payload': {'name': 'Renamed'}})
+    assert next(stream) == \
+        b'id: 7\nevent: character\ndata: {"name":"Renamed"}\n\n'
+
+    broker.publish(f'character:{character.id}', {
+        'id': 8, 'entity': 'character', 'entity_id': character.id,
+        'operation': 'delete', 'payload': None})
+    assert next(stream).decode() == \
+        f'id: 8\nevent: delete\ndata: {character.id}\n\n'
+    assert list(stream) == []
+    assert len(broker) == 0
+
+
+def test_character_event_stream_access(client, login, character, db_session):
+    other = make_user(db_session)
+    response = client.get(f'/character/{character.id}/events',
+                          headers=login(other.username))
+    assert response.status_code == 403
+
+
+def test_relay_publishes_committed_changes(tmp_path):
+    class RelayConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "relay.db"}'
+        CHANGES_RELAY_ENABLED = True
+        CHANGES_POLL_INTERVAL = 0.05
+
+    app = create_app(RelayConfig)
+    with app.app_context():
+        db.create_all()
+        owner = make_user(db.session)
+        character = make_character(db.session, owner,
+                                   make_background(db.session))
+        live_changes = app.extensions['live_changes']
+        subscription = live_changes.subscribe(f'character:{character.id}')
+
+        character.name = 'Renamed'
+        db.session.commit()
+
+        events = subscription.wait(5)
+        live_changes.unsubscribe(subscription)
+        live_changes.relay.stop()
+
+    assert [e['payload']['name'] for e in events] == ['Renamed']
+
+
+def test_relay_publishes_out_of_order_commits(tmp_path):
+    class RelayConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "relay.db"}'
+        CHANGES_RELAY_ENABLED = True
+        CHANGES_POLL_INTERVAL = 0.05
+
+    app = create_app(RelayConfig)
+    with app.app_context():
+        db.create_all()
+        owner = make_user(db.session)
+        background = make_background(db.session)
+        first, second = (make_character(db.session, owner, background).id
+                         for _ in range(2))
+        live_changes = app.extensions['live_changes']
+        subscriptions = [live_changes.subscribe(f'character:{character_id}')
+                         for character_id in (first, second)]
+
+        def rename(session, character_id, name):
+            session.get(Character, character_id).name = name
+            session.commit()
+            session.close()
+
+        with orm.Session(db.engine) as early, \
+                orm.Session(db.engine) as late:
+            # The first change is written first and committed last
+            early.get(Character, first).name = 'Early'
+            early.flush()
+            thread = threading.Thread(target=rename,
+                                      args=(late, second, 'Late'))
+            thread.start()
+            thread.join(0.2)
+            early.commit()
+            thread.join()
+
+        events = [subscription.wait(5) for subscription in subscriptions]
+        for subscription in subscriptions:
+            live_changes.unsubscribe(subscription)
+        live_changes.relay.stop()
+        db.engine.dispose()
+
+    assert [[e['payload']['name'] for e in batch] for batch in events] \
+        == [['Early'], ['Late']]
@@ -0,0 +1,47 @@
+from prometheus_client import REGISTRY
+
+from dndbehind import create_app
+from config import TestingConfig
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics_endpoint(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b'dndbehind_request_duration_seconds' in response.data
+
+
+def test_request_latency_recorded(client, test_user, login):
+    name = 'dndbehind_request_duration_seconds_count'
+    labels = {'endpoint': 'auth.whoami', 'method': 'GET'}
+    before = sample(name, **labels)
+
+    client.get('/auth/whoami', headers=login(test_user.username))
+
+    assert sample(name, **labels) == before + 1
+    assert sample('dndbehind_requests_total', status='200', **labels) >= 1
+
+
+def test_jwt_lookups_and_hashing_recorded(client, test_user, login):
+    hits = sample('dndbehind_jwt_user_lookups_total', result='hit')
+    verifies = sample('dndbehind_password_hash_duration_seconds_count',
+                      operation='verify')
+
+    client.get('/auth/whoami', headers=login(test_user.username))
+
+    assert sample('dndbehind_jwt_user_lookups_total',
+                  result='hit') == hits + 1
+    assert sample('dndbehind_password_hash_duration_seconds_count',
+                  operation='verify') == verifies + 1
+
+
+def test_metrics_disabled():
+    class NoMetricsConfig(TestingConfig):
+        METRICS_ENABLED = False
+
+    app = create_app(NoMetricsConfig)
+    assert app.test_client().get('/metrics').status_code == 404
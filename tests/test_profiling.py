@@ -0,0 +1,89 @@
+import json
+import pstats
+
+import pytest
+
+from config import TestingConfig
+from dndbehind import create_app, db
+from dndbehind.profiling import RateLimiter
+
+from factories import make_user
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    class ProfilingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "profiling.db"}'
+        PROFILING_ENABLED = True
+        PROFILE_DIR = str(tmp_path / 'profiles')
+        PROFILE_MAX_PER_MINUTE = 2
+
+    app = create_app(ProfilingConfig)
+    with app.app_context():
+        db.create_all()
+        make_user(db.session, roles=['admin'], username='boss')
+        make_user(db.session, username='player')
+    return app
+
+
+def login(client, username):
+    response = client.post('/auth/login', json={'username': username,
+                                                'password': 'password123'})
+    return {'Authorization': f'Bearer {response.json["access_token"]}'}
+
+
+def test_admin_request_profiled(profiled_app, tmp_path):
+    client = profiled_app.test_client()
+    headers = {**login(client, 'boss'), 'X-Profile': 'cprofile'}
+
+    response = client.get('/auth/whoami', headers=headers)
+
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+    [path] = (tmp_path / 'profiles').glob(f'*{profile_id}.prof')
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_sampled_profile_is_speedscope(profiled_app, tmp_path):
+    client = profiled_app.test_client()
+    headers = {**login(client, 'boss'), 'X-Profile': 'sample'}
+
+    response = client.get('/auth/whoami', headers=headers)
+
+    profile_id = response.headers['X-Profile-Id']
+    [path] = (tmp_path / 'profiles').glob(f'*{profile_id}.speedscope.json')
+    profile = json.loads(path.read_text())
+    assert profile['profiles'][0]['type'] == 'sampled'
+
+
+@pytest.mark.parametrize('username', ['player', None])
+def test_non_admin_not_profiled(profiled_app, tmp_path, username):
+    client = profiled_app.test_client()
+    headers = login(client, username) if username else {}
+
+    response = client.get('/auth/whoami',
+                          headers={**headers, 'X-Profile': '1'})
+
+    assert response.status_code == (200 if username else 401)
+    assert 'X-Profile-Id' not in response.headers
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_profiles_rate_limited(profiled_app):
+    client = profiled_app.test_client()
+    headers = {**login(client, 'boss'), 'X-Profile': '1'}
+
+    profiled = [client.get('/auth/whoami', headers=headers)
+                .headers.get('X-Profile-Id') for _ in range(3)]
+
+    assert profiled[2] is None and None not in profiled[:2]
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(1)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+
+
+def test_disabled_by_default(app):
+    assert 'profiler' not in app.extensions
@@ -0,0 +1,87 @@
+import json
+
+import sqlalchemy as sa
+
+from dndbehind.models import User
+
+from factories import make_role, make_user
+
+
+def new_user(name, **overrides):
+    return {'username': name, 'email': f'{name}@example.com',
+            'password': f'{name}-secret', **overrides}
+
+
+def test_create_users(app, client, db_session, login):
+    admin = make_user(db_session, roles=['admin'])
+    existing = make_user(db_session)
+    make_role(db_session, 'maintainer')
+    headers = login(admin.username)
+
+    response = client.post('/auth/users', headers=headers, json={'users': [
+        new_user('ann', roles=['maintainer']),
+        new_user('bob'),
+        new_user(existing.username),
+        new_user('ann2', email='ann@example.com'),
+        new_user('cid', roles=['wizard']),
+    ]})
+    assert response.status_code == 200
+    assert response.json['created'] == 2
+    results = response.json['results']
+    assert [r['status'] for r in results] == \
+        ['created', 'created', 'conflict', 'conflict', 'invalid']
+    assert [r['index'] for r in results] == list(range(5))
+
+    ann = db_session.get(User, results[0]['id'])
+    assert [role.name for role in ann.roles] == ['maintainer']
+    assert ann.check_password('ann-secret')
+    assert client.post('/auth/login', json={
+        'username': 'bob', 'password': 'bob-secret'}).status_code == 200
+
+
+def test_create_users_access_and_limits(app, client, db_session, login,
+                                        monkeypatch):
+    user = make_user(db_session)
+    response = client.post('/auth/users', headers=login(user.username),
+                           json={'users': [new_user('eve')]})
+    assert response.status_code == 403
+
+    admin = make_user(db_session, roles=['admin'])
+    monkeypatch.setitem(app.config, 'BULK_USERS_MAX', 1)
+    response = client.post('/auth/users', headers=login(admin.username),
+                           json={'users': [new_user('a'), new_user('b')]})
+    assert response.status_code == 400
+    response = client.post('/auth/users', headers=login(admin.username),
+                           json={'users': []})
+    assert response.status_code == 400
+
+
+def test_batches_and_concurrent_conflicts(app, db_session, monkeypatch):
+    from dndbehind.auth import provisioning
+    from dndbehind.schemas import UserProvision
+
+    users = [UserProvision(**new_user(f'batch{n}')) for n in range(5)]
+    real_hash = provisioning.hash_passwords
+
+    def hash_and_race(passwords):
+        # Someone signs up with the name of user 3 meanwhile
+        make_user(db_session, username='batch3')
+        return real_hash(passwords)
+
+    monkeypatch.setattr(provisioning, 'hash_passwords', hash_and_race)
+    with app.app_context():
+        results = provisioning.provision_users(db_session, users, 2)
+    assert [r['status'] for r in results] == \
+        ['created'] * 3 + ['conflict', 'created']
+    count = db_session.scalar(sa.select(sa.func.count()).select_from(User)
+                              .where(User.username.like('batch%')))
+    assert count == 5
+
+
+def test_import_cli(app, db_session, tmp_path):
+    path = tmp_path / 'club.json'
+    path.write_text(json.dumps([new_user('cli1'), new_user('cli2')]))
+    result = app.test_cli_runner().invoke(args=['users', 'import',
+                                                str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'Created 2 of 2 users.' in result.output
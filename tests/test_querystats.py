@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+from dndbehind.querystats import collect_queries, query_budget
+
+from factories import bulk_users, make_background, make_character, \
+    make_user
+
+
+@pytest.fixture
+def admin(db_session):
+    return make_user(db_session, roles=['admin', 'operator', 'maintainer'])
+
+
+def test_collect_queries(client, admin, login):
+    headers = login(admin.username)
+    with collect_queries() as stats:
+        client.get('/auth/whoami', headers=headers)
+        client.get('/auth/whoami', headers=headers)
+
+    assert stats.count == 2
+    assert list(stats.duplicates.values()) == [2]
+    assert stats.duration > 0
+
+
+def test_server_timing_header(client, admin, login):
+    response = client.get('/auth/whoami', headers=login(admin.username))
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert 'desc="1 queries"' in response.headers['Server-Timing']
+
+
+def test_query_budget_exceeded(client, admin, login):
+    headers = login(admin.username)
+    with pytest.raises(AssertionError):
+        with query_budget(1):
+            client.get('/auth/whoami', headers=headers)
+            client.get('/auth/whoami', headers=headers)
+
+    with pytest.raises(AssertionError):
+        with query_budget(2, max_repeats=1):
+            client.get('/auth/whoami', headers=headers)
+            client.get('/auth/whoami', headers=headers)
+
+
+def test_repeated_queries_logged(app, client, db_session, admin, login,
+                                 caplog):
+    headers = login(admin.username)
+    other_id = make_user(db_session).id
+    db_session.expunge_all()
+    app.config['QUERY_REPEAT_THRESHOLD'] = 2
+    try:
+        with caplog.at_level(logging.INFO, logger='dndbehind.querystats'):
+            client.get(f'/auth/userrole/{other_id}', headers=headers)
+    finally:
+        app.config['QUERY_REPEAT_THRESHOLD'] = 5
+
+    assert 'GET /auth/userrole/' in caplog.text
+    assert 'N+1' in caplog.text
+
+
+def test_list_all_user_roles_budget(client, db_session, admin, login):
+    headers = login(admin.username)
+    bulk_users(db_session, 50)
+
+    with query_budget(3, max_repeats=1):
+        response = client.get('/auth/userrole', headers=headers)
+    assert len(response.json) == 51
+
+
+def test_list_backgrounds_budget(client, db_session, admin, login):
+    headers = login(admin.username)
+    for _ in range(10):
+        make_background(db_session)
+
+    with query_budget(2, max_repeats=1):
+        client.get('/background', headers=headers)
+
+
+def test_get_character_budget(client, db_session, admin, login):
+    owner = make_user(db_session)
+    character = make_character(db_session, owner,
+                               make_background(db_session))
+    character_id = character.id
+    headers = login(owner.username)
+    db_session.expunge_all()
+
+    with query_budget(2, max_repeats=1):
+        response = client.get(f'/character/{character_id}', headers=headers)
+    assert response.status_code == 200
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import msgspec
+import pytest
+
+from dndbehind.models import Role, User
+from dndbehind.schemas import UserCreate, UserUpdate, present_fields
+
+
+def test_user_create_schema_requires_fields():
+    with pytest.raises(msgspec.ValidationError):
+        msgspec.json.decode(b'{"username": "x", "email": "x@example.com"}',
+                            type=UserCreate)
+
+
+def test_user_update_schema_types():
+    body = msgspec.json.decode(
+        b'{"disabled": true, "last_logged_in": "2025-03-11T13:34:18"}',
+        type=UserUpdate)
+    assert present_fields(body) == {
+        'disabled': True,
+        'last_logged_in': datetime(2025, 3, 11, 13, 34, 18)
+    }
+
+    with pytest.raises(msgspec.ValidationError):
+        msgspec.json.decode(b'{"disabled": "yes"}', type=UserUpdate)
+
+    with pytest.raises(msgspec.ValidationError):
+        msgspec.json.decode(b'{"role": "admin"}', type=UserUpdate)
+
+
+def test_create_user(client, db_session):
+    response = client.post('/auth/user', json={
+        'username': 'newuser',
+        'email': 'new@example.com',
+        'password': 'secret'
+    })
+    assert response.status_code == 201
+    assert response.json['data']['username'] == 'newuser'
+
+
+@pytest.mark.parametrize('payload', [
+    {'username': 'newuser', 'email': 'new@example.com'},
+    {'username': 'newuser', 'email': 'new@example.com', 'password': 123},
+    {'username': '', 'email': 'new@example.com', 'password': 'secret'},
+])
+def test_create_user_invalid_body(client, db_session, payload):
+    response = client.post('/auth/user', json=payload)
+    assert response.status_code == 400
+    assert response.json['status'] == 400
+    assert response.json['msg'].startswith('Invalid request body')
+
+
+def test_create_user_malformed_json(client, db_session):
+    response = client.post('/auth/user', data=b'{"username": ',
+                           content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_update_user(client, test_user, login):
+    response = client.patch(f'/auth/user/{test_user.id}',
+                            json={'disabled': True},
+                            headers=login('testuser'))
+    assert response.status_code == 200
+    assert response.json['user']['disabled'] is True
+
+
+def test_update_user_password(client, test_user, login):
+    response = client.patch(f'/auth/user/{test_user.id}',
+                            json={'password': 'newpassword'},
+                            headers=login('testuser'))
+    assert response.status_code == 200
+    assert User.from_id(test_user.id).check_password('newpassword')
+
+
+@pytest.mark.parametrize('payload', [
+    {},
+    {'disabled': 'yes'},
+    {'last_logged_in': 'yesterday'},
+    {'roles': ['admin']},
+])
+def test_update_user_invalid_body(client, test_user, login, payload):
+    response = client.patch(f'/auth/user/{test_user.id}',
+                            json=payload,
+                            headers=login('testuser'))
+    assert response.status_code == 400
+
+
+def test_create_background_invalid_body(client, db_session, test_user,
+                                        login):
+    maintainer = Role(name='maintainer', description='Maintainer role')
+    test_user.roles.append(maintainer)
+    db_session.commit()
+
+    response = client.post('/background',
+                           json={'name': 'Acolyte'},
+                           headers=login('testuser'))
+    assert response.status_code == 400
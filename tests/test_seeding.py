@@ -0,0 +1,53 @@
+import sqlalchemy as sa
+
+from dndbehind.compressed import codec
+from dndbehind.history import version_at
+from dndbehind.models import Character, User
+from dndbehind.seeding import TEXT_POOL_SIZE, seed
+
+from factories import make_user
+
+
+def test_seed(db_session):
+    existing = make_user(db_session)
+    counts = seed(db_session.connection(), users=50, characters=400,
+                  backgrounds=5, history=True, batch_size=64,
+                  password_hash=existing.password_hash)
+    assert counts['user'] == 50
+    assert counts['background'] == 5
+    assert counts['character'] == counts['character_history'] == 400
+
+    owners = db_session.execute(
+        sa.select(Character.owner_id, sa.func.count())
+        .group_by(Character.owner_id)
+        .order_by(sa.func.count().desc())).all()
+    assert owners[0].owner_id == existing.id + 1
+    assert owners[0][1] > 400 / 50 * 3
+
+    character = db_session.scalars(sa.select(Character)
+                                   .order_by(Character.id.desc())).first()
+    assert character.owner_id > existing.id
+    assert version_at(db_session, character.id, 1)['backstory'] == \
+        str(character.backstory)
+    user = db_session.get(User, existing.id + 1)
+    assert user.check_password('password123')
+
+
+def test_seed_cli(app, db_session):
+    result = app.test_cli_runner().invoke(args=[
+        'seed', '--users', '10', '--characters', '20', '--backgrounds', '2',
+        '--no-passwords'])
+    assert result.exit_code == 0, result.output
+    assert 'Inserted' in result.output
+
+
+def test_seed_compresses_text_pools_only(db_session, monkeypatch):
+    compress = codec.compress
+    calls = []
+    monkeypatch.setattr(codec, 'compress',
+                        lambda text: calls.append(text) or compress(text))
+
+    seed(db_session.connection(), users=5, characters=20, backgrounds=5,
+         history=False, batch_size=64, password_hash=None)
+
+    assert len(calls) == 3 * TEXT_POOL_SIZE
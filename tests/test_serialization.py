@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from dndbehind.models import Background, Role, User
+from dndbehind.serialization import FastJSONProvider, rows_as_dicts
+
+
+@pytest.mark.parametrize("backend", ["stdlib", "orjson", "msgspec"])
+def test_provider_serializes_datetime_as_iso(app, backend):
+    pytest.importorskip(backend if backend != "stdlib" else "json")
+    provider = FastJSONProvider(app, backend=backend)
+    moment = datetime(2025, 3, 11, 13, 34, 18)
+
+    assert provider.loads(provider.dumps({"at": moment})) == {
+        "at": "2025-03-11T13:34:18"
+    }
+
+
+def test_provider_unknown_backend(app):
+    with pytest.raises(ValueError):
+        FastJSONProvider(app, backend="yaml")
+
+
+def test_provider_response_is_json(app):
+    with app.app_context():
+        response = app.json.response({"msg": "ok"})
+        assert response.mimetype == "application/json"
+        assert response.json == {"msg": "ok"}
+
+
+def test_rows_as_dicts(db_session, test_background):
+    rows = db_session.execute(sa.select(*Background.as_dict_columns()))
+    assert rows_as_dicts(rows) == [test_background.as_dict()]
+
+
+def test_list_all_user_roles(client, db_session, test_user, admin_role):
+    test_user.roles.append(admin_role)
+    other = User(username="other", email="other@example.com")
+    db_session.add(other)
+    db_session.add(Role(name="maintainer", description="Maintainer role"))
+    db_session.commit()
+
+    token = client.post("/auth/login", json={
+        "username": "testuser",
+        "password": "password123"
+    }).json["access_token"]
+    response = client.get("/auth/userrole",
+                          headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    users = {user["username"]: user for user in response.json}
+    assert [role["name"] for role in users["testuser"]["roles"]] == ["admin"]
+    assert users["other"]["roles"] == []
+    assert "password_hash" not in users["testuser"]
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dndbehind.singleflight import SingleFlight
+
+
+def wait_for_waiters(flight, key, waiters):
+    deadline = time.monotonic() + 5
+    while flight._calls[key].waiters < waiters:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'id': 1}
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(flight.do, 'key', compute)
+        while 'key' not in flight._calls:
+            time.sleep(0.001)
+        followers = [executor.submit(flight.do, 'key', compute)
+                     for _ in range(3)]
+        wait_for_waiters(flight, 'key', 3)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert flight._calls == {}
+    # Nothing is cached
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+
+
+def test_error_is_shared():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise LookupError('gone')
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flight.do, 'key', compute)
+        while 'key' not in flight._calls:
+            time.sleep(0.001)
+        follower = executor.submit(flight.do, 'key', compute)
+        wait_for_waiters(flight, 'key', 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(LookupError):
+                future.result()
+    assert flight._calls == {}
+
+
+def test_async_calls_share_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        call = len(calls)
+        await asyncio.sleep(0.01)
+        return call
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do_async('key', compute) for _ in range(5)),
+            flight.do_async('other', compute))
+
+    assert asyncio.run(main()) == [1] * 5 + [2]
+    assert flight._async_calls == {}
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+from config import TestingConfig
+from dndbehind import create_app
+from dndbehind.models import User, password_hasher
+
+LAZY_MODULES = ('alembic', 'flask_migrate', 'argon2', 'dotenv')
+
+
+def test_heavy_modules_imported_lazily():
+    script = ('import sys\n'
+              'from config import TestingConfig\n'
+              'from dndbehind import create_app\n'
+              'create_app(TestingConfig)\n'
+              f'print([m for m in {LAZY_MODULES!r} if m in sys.modules])')
+    result = subprocess.run([sys.executable, '-c', script], check=True,
+                            capture_output=True, text=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_migrate_set_up_by_cli():
+    app = create_app(TestingConfig)
+    assert 'migrate' not in app.extensions
+
+    result = app.test_cli_runner().invoke(args=['db', '--help'])
+    assert result.exit_code == 0, result.output
+    assert 'upgrade' in result.output
+    assert 'migrate' in app.extensions
+
+
+def test_password_hasher_created_on_first_use(app, db_session):
+    assert password_hasher() is app.extensions['password_hasher']
+    assert password_hasher().time_cost == TestingConfig.ARGON2_TIME_COST
+    user = User(username='lazy', email='lazy@example.com')
+    user.set_password('secret')
+    assert user.check_password('secret')
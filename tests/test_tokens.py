@@ -0,0 +1,78 @@
+import time
+
+from flask_jwt_extended import create_access_token, decode_token
+import jwt
+import pytest
+
+from config import TestingConfig
+from dndbehind import create_app
+from dndbehind.tokens import TokenCache
+
+from factories import make_user
+
+
+def test_verified_tokens_cached(app, client, db_session, login):
+    user = make_user(db_session)
+    headers = login(user.username)
+    cache = app.extensions['jwt_cache']
+    for _ in range(2):
+        assert client.get('/auth/whoami', headers=headers).status_code == 200
+    token = headers['Authorization'].split()[1]
+    with app.app_context():
+        payload = decode_token(token)
+    assert payload['sub'] == str(user.id)
+    assert len(cache._payloads) >= 1
+
+    forged = token[:-4] + ('AAAA' if token[-4:] != 'AAAA' else 'BBBB')
+    response = client.get('/auth/whoami',
+                          headers={'Authorization': f'Bearer {forged}'})
+    assert response.status_code == 422
+
+
+def test_token_cache_expiry():
+    cache = TokenCache(max_size=2)
+    cache.put(b'old', {'exp': time.time() - 10})
+    assert cache.get(b'old', leeway=0) is None
+    assert cache.get(b'old', leeway=0) is None
+    for digest in (b'a', b'b', b'c'):
+        cache.put(digest, {'exp': time.time() + 60})
+    assert cache.get(b'a', leeway=0) is None
+    assert cache.get(b'c', leeway=0) is not None
+
+
+def test_eddsa_key_rotation(tmp_path):
+    pytest.importorskip('cryptography')
+
+    class KeysConfig(TestingConfig):
+        JWT_KEYS_DIR = str(tmp_path)
+
+    runner = create_app(KeysConfig).test_cli_runner()
+    for kid in ('2026-01', '2026-02'):
+        result = runner.invoke(args=['jwt-keys', 'generate', kid])
+        assert result.exit_code == 0, result.output
+
+    def eddsa_app(kid):
+        class EdDSAConfig(KeysConfig):
+            JWT_ALGORITHM = 'EdDSA'
+            JWT_KEY_ID = kid
+        return create_app(EdDSAConfig)
+
+    old_app = eddsa_app('2026-01')
+    with old_app.app_context():
+        token = create_access_token(identity='7')
+    assert jwt.get_unverified_header(token)['kid'] == '2026-01'
+
+    new_app = eddsa_app('2026-02')
+    with new_app.app_context():
+        assert decode_token(token)['sub'] == '7'
+    jwks = new_app.test_client().get('/auth/jwks.json').json
+    assert [key['kid'] for key in jwks['keys']] == ['2026-01', '2026-02']
+    # Other services verify with the published public key
+    public_key = jwt.PyJWK(jwks['keys'][0]).key
+    assert jwt.decode(token, public_key, algorithms=['EdDSA'])['sub'] == '7'
+
+    (tmp_path / '2026-01.pem').unlink()
+    retired_app = eddsa_app('2026-02')
+    with retired_app.app_context():
+        with pytest.raises(jwt.InvalidTokenError):
+            decode_token(token)
@@ -0,0 +1,111 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import \
+    InMemorySpanExporter
+
+from config import TestingConfig
+from dndbehind import create_app, db
+from dndbehind.tracing import add_exporter
+
+from factories import make_background, make_user
+
+
+@pytest.fixture(scope='module')
+def exporter():
+    exporter = InMemorySpanExporter()
+    add_exporter(exporter, batch=False)
+    return exporter
+
+
+@pytest.fixture
+def traced_client(tmp_path, exporter):
+    class TracingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "tracing.db"}'
+        TRACING_EXPORTER = 'external'
+
+    app = create_app(TracingConfig)
+    with app.app_context():
+        db.create_all()
+        make_user(db.session, roles=['maintainer'], username='dm')
+        make_background(db.session)
+    exporter.clear()
+    return app.test_client()
+
+
+def children(spans, parent):
+    return [span.name for span in spans
+            if span.parent is not None
+            and span.parent.span_id == parent.context.span_id]
+
+
+def test_login_spans(traced_client, exporter):
+    response = traced_client.post('/auth/login', json={
+        'username': 'dm', 'password': 'password123'})
+    assert response.status_code == 200
+
+    spans = exporter.get_finished_spans()
+    [request_span] = [s for s in spans if s.name == 'POST /auth/login']
+    assert request_span.attributes['http.response.status_code'] == 200
+    steps = children(spans, request_span)
+    assert steps.index('argon2.verify') \
+        < steps.index('user.update_login_time') \
+        < steps.index('jwt.create_access_token')
+    assert 'SELECT' in steps
+
+
+def test_rbac_spans(traced_client, exporter):
+    token = traced_client.post('/auth/login', json={
+        'username': 'dm', 'password': 'password123'}).json['access_token']
+    exporter.clear()
+
+    traced_client.get('/background',
+                      headers={'Authorization': f'Bearer {token}'})
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    rbac = spans['rbac.role_required']
+    assert rbac.attributes['rbac.granted'] is True
+    assert children(exporter.get_finished_spans(), rbac) == ['jwt.verify']
+    assert children(exporter.get_finished_spans(), spans['jwt.verify']) \
+        == ['jwt.user_lookup']
+    assert spans['SELECT'].attributes['db.system'] == 'sqlite'
+
+
+def test_traceparent_honoured(traced_client, exporter):
+    trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+    traced_client.get('/auth/whoami', headers={
+        'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01'})
+
+    [span] = exporter.get_finished_spans()
+    assert format(span.context.trace_id, '032x') == trace_id
+
+
+def test_unknown_exporter():
+    class BadConfig(TestingConfig):
+        TRACING_EXPORTER = 'carrier-pigeon'
+
+    with pytest.raises(ValueError):
+        create_app(BadConfig)
+
+
+def test_exporter_installed_once(tmp_path):
+    traces = tmp_path / 'traces.jsonl'
+    script = ('from opentelemetry import trace\n'
+              'from config import TestingConfig\n'
+              'from dndbehind import create_app\n'
+              'class FileConfig(TestingConfig):\n'
+              '    TRACING_EXPORTER = "file"\n'
+              f'    TRACING_FILE = {str(traces)!r}\n'
+              'apps = [create_app(FileConfig) for _ in range(2)]\n'
+              'apps[1].test_client().get("/auth/whoami")\n'
+              'trace.get_tracer_provider().shutdown()\n'
+              'print(trace.get_tracer_provider()._active_span_processor'
+              '._span_processors[0].span_exporter.out.closed)')
+    result = subprocess.run([sys.executable, '-c', script], check=True,
+                            capture_output=True, text=True)
+
+    assert result.stdout.strip() == 'True'
+    names = [json.loads(line)['name'] for line in traces.open()]
+    assert names.count('GET /auth/whoami') == 1
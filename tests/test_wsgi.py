@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+from config import TestingConfig
+from dndbehind import create_app
+from dndbehind.startup import warm_up
+
+
+def test_warm_up():
+    # warm_up disposes the engine, which would drop the shared test database
+    app = create_app(TestingConfig)
+    warm_up(app)
+
+    response = app.test_client().get('/auth/whoami')
+    assert response.status_code == 401
+
+
+def test_wsgi_app(tmp_path):
+    # The entry module creates the production app on import: keep it out of
+    # the test process
+    script = ('from dndbehind.wsgi import app\n'
+              'print(app.test_client().get("/auth/whoami").status_code)')
+    env = {**os.environ,
+           'DATABASE_URL': f'sqlite:///{tmp_path / "wsgi.db"}',
+           'AUDIT_SINK': 'none'}
+    result = subprocess.run([sys.executable, '-c', script], check=True,
+                            capture_output=True, text=True, env=env)
+    assert result.stdout.strip() == '401'